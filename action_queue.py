@@ -0,0 +1,287 @@
+"""Write-behind queue for the divide actions (adding and removing tracks)."""
+
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import spotipy
+
+from pagination import chunks
+
+
+def retryable(error):
+    """
+    Return if a failed call may succeed when it's sent again.
+
+    Connection errors and server errors (5xx, or the retries of the session
+    running out) may; other client errors (e.g. 403 not allowed, 404 not
+    found) won't, so those fail right away.
+    """
+    if isinstance(error, requests.RequestException):
+        return True
+    return error.http_status >= 500 or "Max Retries" in str(error.msg)
+
+
+class PendingActions:
+    """The actions of one user that haven't been sent to Spotify yet."""
+
+    def __init__(self):
+        self.adds = OrderedDict()  # playlist id -> track uris
+        self.removes = OrderedDict()  # playlist id -> (track uri, position)
+        self.unlikes = []  # track ids
+
+    def __len__(self):
+        return (
+            sum(len(uris) for uris in self.adds.values())
+            + sum(len(items) for items in self.removes.values())
+            + len(self.unlikes)
+        )
+
+
+class ActionQueue:
+    """
+    Queue the adds and removes of the users, and send them in batches.
+
+    The divide page doesn't wait for the API anymore: the actions are queued
+    per user, adds and removes are grouped per playlist, and flushed in the
+    background (100 tracks per add/remove call, 50 per unlike call). A flush
+    happens when the user has flush_size pending actions, when the user was
+    idle for idle_seconds, or when asked (e.g. when leaving the divide page).
+    Failing calls are retried (unless they can't succeed, see retryable); if
+    they keep failing the error is kept, so it can be shown to the user
+    (pop_errors).
+
+    get_client(uid) must return the Spotify client of the user, or None if the
+    user isn't logged in.
+
+    Removals from a playlist are queued with the position the track had when
+    the playlist was loaded. As earlier removals may have been sent already,
+    the queue keeps track of those (per playlist) to find the current
+    position. So call forget_positions when the playlist is loaded again.
+    The snapshot_id of a playlist after the user's last change is kept too,
+    so what's loaded of the playlist can be reused if nothing else changed it.
+    """
+
+    def __init__(
+        self,
+        get_client,
+        flush_size=100,
+        idle_seconds=3,
+        retries=3,
+        retry_delay=1,
+        max_workers=4,
+    ):
+        self.get_client = get_client
+        self.flush_size = flush_size
+        self.idle_seconds = idle_seconds
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="action_queue"
+        )
+        self._lock = threading.Lock()
+        self._pending = {}  # uid -> PendingActions
+        self._timers = {}  # uid -> idle timer
+        self._flush_locks = {}  # uid -> lock, one flush at a time per user
+        self._removed = {}  # (uid, playlist id) -> sorted removed positions
+        self._snapshots = {}  # (uid, playlist id) -> snapshot_id after last change
+        self._errors = {}  # uid -> error messages
+
+    # queueing
+
+    def add(self, uid, playlist_id, uri):
+        """Queue adding the track (uri) to the playlist."""
+        with self._lock:
+            uris = self._user(uid).adds.setdefault(playlist_id, [])
+            if uri not in uris:
+                uris.append(uri)
+        self._queued(uid)
+
+    def remove(self, uid, playlist_id, uri, position):
+        """Queue removing the track (uri) at its (loaded) position from the playlist."""
+        with self._lock:
+            self._user(uid).removes.setdefault(playlist_id, []).append((uri, position))
+        self._queued(uid)
+
+    def unlike(self, uid, track_id):
+        """Queue removing the track from the user's Liked Songs."""
+        with self._lock:
+            self._user(uid).unlikes.append(track_id)
+        self._queued(uid)
+
+    def _user(self, uid):
+        if uid not in self._pending:
+            self._pending[uid] = PendingActions()
+        return self._pending[uid]
+
+    def _queued(self, uid):
+        with self._lock:
+            timer = self._timers.pop(uid, None)
+            if timer:
+                timer.cancel()
+            if len(self._pending.get(uid, ())) >= self.flush_size:
+                flush_now = True
+            else:
+                flush_now = False
+                timer = threading.Timer(self.idle_seconds, self.flush, args=(uid,))
+                timer.daemon = True
+                self._timers[uid] = timer
+                timer.start()
+        if flush_now:
+            self.flush(uid)
+
+    def pending_count(self, uid):
+        """Return the number of actions of the user that haven't been sent yet."""
+        with self._lock:
+            return len(self._pending.get(uid, ()))
+
+    # flushing
+
+    def flush(self, uid, wait=False):
+        """Send the pending actions of the user in the background (or wait for it)."""
+        try:
+            future = self._executor.submit(self._flush, uid)
+        except RuntimeError:
+            return  # (the worker is shutting down, e.g. an idle timer at exit)
+        if wait:
+            future.result()
+
+    def _flush(self, uid):
+        with self._lock:
+            flush_lock = self._flush_locks.setdefault(uid, threading.Lock())
+
+        with flush_lock:
+            with self._lock:
+                timer = self._timers.pop(uid, None)
+                if timer:
+                    timer.cancel()
+                actions = self._pending.pop(uid, None)
+            if not actions:
+                return
+
+            # (logged out in the meantime)
+            spotify_client = self.get_client(uid)
+            if spotify_client is None:
+                self._error(uid, "Couldn't divide the last tracks, not logged in.")
+                return
+
+            # adds first; for a move the track must be added before it's removed
+            failed = set()  # the uris that couldn't be added
+            for playlist_id, uris in actions.adds.items():
+                for uris_chunk in chunks(uris, 100):
+                    result = self._send(
+                        uid,
+                        f"add {len(uris_chunk)} track(s) to a playlist",
+                        spotify_client.playlist_add_items,
+                        playlist_id,
+                        uris_chunk,
+                    )
+                    if result is None:
+                        failed.update(uris_chunk)
+                    with self._lock:
+                        self._snapshots[(uid, playlist_id)] = (
+                            result.get("snapshot_id") if result else None
+                        )
+
+            # (a track that wasn't added isn't removed, or it would be lost)
+            kept = 0
+            for playlist_id, items in actions.removes.items():
+                sent = [(uri, position) for uri, position in items if uri not in failed]
+                kept += len(items) - len(sent)
+                if sent:
+                    self._send_removes(uid, spotify_client, playlist_id, sent)
+            failed_ids = {uri.rsplit(":", 1)[-1] for uri in failed}
+            unlikes = [
+                track_id for track_id in actions.unlikes if track_id not in failed_ids
+            ]
+            kept += len(actions.unlikes) - len(unlikes)
+            if kept:
+                self._error(
+                    uid,
+                    f"Kept {kept} track(s) in the source, as they couldn't be added.",
+                )
+
+            for track_ids_chunk in chunks(unlikes, 50):
+                self._send(
+                    uid,
+                    f"remove {len(track_ids_chunk)} track(s) from your Liked Songs",
+                    spotify_client.current_user_saved_tracks_delete,
+                    track_ids_chunk,
+                )
+
+    def _send_removes(self, uid, spotify_client, playlist_id, items):
+        with self._lock:
+            removed = self._removed.setdefault((uid, playlist_id), [])
+            # the current position is the loaded position minus the number of
+            # tracks before it that are removed already
+            current = [
+                (uri, position - bisect.bisect_left(removed, position), position)
+                for uri, position in items
+            ]
+
+        # remove from the end to the start, so a call doesn't move the positions
+        # of the next calls
+        current.sort(key=lambda item: item[1], reverse=True)
+        for items_chunk in chunks(current, 100):
+            result = self._send(
+                uid,
+                f"remove {len(items_chunk)} track(s) from the source playlist",
+                spotify_client.playlist_remove_specific_occurrences_of_items,
+                playlist_id,
+                [
+                    {"uri": uri, "positions": [position]}
+                    for uri, position, _ in items_chunk
+                ],
+            )
+            with self._lock:
+                if result is None:
+                    # (the playlist isn't what we think it is anymore)
+                    self._snapshots[(uid, playlist_id)] = None
+                    continue
+                self._snapshots[(uid, playlist_id)] = result.get("snapshot_id")
+                for _, _, loaded_position in items_chunk:
+                    bisect.insort(removed, loaded_position)
+
+    def _send(self, uid, description, method, *args):
+        """Call the API, with retries. Return the result, or keep the error (None)."""
+        for attempt in range(self.retries + 1):
+            try:
+                return method(*args)
+            except (
+                spotipy.exceptions.SpotifyException,
+                requests.RequestException,
+            ) as e:
+                error = e
+                if not retryable(e):
+                    break
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * 2**attempt)
+
+        self._error(
+            uid, f"Couldn't {description} on Spotify ({getattr(error, 'msg', error)})."
+        )
+        return None
+
+    def _error(self, uid, message):
+        with self._lock:
+            self._errors.setdefault(uid, []).append(message)
+
+    def pop_errors(self, uid):
+        """Return (and forget) the errors of the user's actions that failed."""
+        with self._lock:
+            return self._errors.pop(uid, [])
+
+    def snapshot_id(self, uid, playlist_id):
+        """Return the snapshot_id of the playlist after the user's last change."""
+        with self._lock:
+            return self._snapshots.get((uid, playlist_id))
+
+    def forget_positions(self, uid):
+        """Forget the removed positions of the user, e.g. after loading the source."""
+        with self._lock:
+            for key in [key for key in self._removed if key[0] == uid]:
+                del self._removed[key]
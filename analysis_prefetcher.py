@@ -0,0 +1,119 @@
+"""Fetch the audio analysis of the tracks ahead in the background, and cache it."""
+
+from background import BackgroundWorker
+
+# the fields of a section that are kept, in this order (see compact_analysis)
+SECTION_FIELDS = ("start", "duration", "key", "mode", "tempo")
+# the statuses of a track that has no analysis (so it isn't asked again)
+NO_ANALYSIS_STATUSES = (400, 403, 404)
+
+
+def compact_analysis(analysis):
+    """
+    Reduce an audio analysis of the API to what the divide page shows.
+
+    The full analysis (bars, beats, segments with their pitches and timbre)
+    is often over a megabyte; only the confidences of the track and a list
+    [start, duration, key, mode, tempo] per section are kept.
+    """
+    track = analysis.get("track") or {}
+    return {
+        "key_confidence": round(track.get("key_confidence") or 0, 3),
+        "mode_confidence": round(track.get("mode_confidence") or 0, 3),
+        "tempo_confidence": round(track.get("tempo_confidence") or 0, 3),
+        "time_signature": track.get("time_signature"),
+        "sections": [
+            [round(section.get(field) or 0, 2) for field in SECTION_FIELDS]
+            for section in analysis.get("sections") or []
+        ],
+    }
+
+
+class AnalysisPrefetcher(BackgroundWorker):
+    """
+    Fetch the audio analysis of tracks in the background, into a cache.
+
+    The audio analysis is too slow to fetch while the divide page waits, so
+    the divide page asks for the tracks ahead of the user (see prefetch), and
+    only shows the analysis of a track if it's in the cache already. The
+    analysis of a track never changes, so it's fetched once for all users (a
+    track that has none is cached as {}). At most max_pending tracks are
+    fetched (or waiting) at a time, the others are skipped until asked again.
+    The calls are background calls (see BackgroundWorker).
+    """
+
+    def __init__(
+        self, get_client, cache, max_workers=2, scheduler=None, max_pending=100
+    ):
+        super().__init__(
+            get_client,
+            max_workers=max_workers,
+            scheduler=scheduler,
+            name="analysis_prefetcher",
+        )
+        self.cache = cache
+        self.max_pending = max_pending
+        self._pending = set()  # track ids fetched or waiting to be fetched
+
+        self.fetched = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def get(self, track_id):
+        """Return the (compact) analysis of the track if it's cached, else None."""
+        return self.cache.get(track_id)
+
+    def prefetch(self, uid, track_ids):
+        """Fetch the analysis of the tracks that isn't cached yet, in the background."""
+        with self._lock:
+            track_ids = [
+                track_id
+                for track_id in dict.fromkeys(track_ids)
+                if track_id and track_id not in self._pending
+            ]
+        cached = self.cache.get_many(track_ids)
+        with self._lock:
+            for track_id in track_ids:
+                if track_id in cached or track_id in self._pending:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    self.skipped += 1
+                    continue
+                self._pending.add(track_id)
+                self._executor.submit(self._run, uid, track_id)
+
+    def _run(self, uid, track_id):
+        try:
+            with self.background_priority():
+                self._fetch(uid, track_id)
+        finally:
+            with self._lock:
+                self._pending.discard(track_id)
+
+    def _fetch(self, uid, track_id):
+        spotify_client = self.get_client(uid)
+        if spotify_client is None:
+            return  # (logged out, another user may ask for it again)
+        try:
+            analysis = compact_analysis(spotify_client.audio_analysis(track_id))
+        except Exception as e:  # a background fetch must never take the worker down
+            # (a client error means the track has no analysis, don't ask again;
+            # after the rate limit or a server error, it's asked again later)
+            if getattr(e, "http_status", None) in NO_ANALYSIS_STATUSES:
+                self.cache.set(track_id, {})
+            with self._lock:
+                self.failed += 1
+            return
+        self.cache.set(track_id, analysis)
+        with self._lock:
+            self.fetched += 1
+
+    def stats(self):
+        """Return the counters, and the number of tracks fetched or waiting."""
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "fetched": self.fetched,
+                "failed": self.failed,
+                "skipped": self.skipped,
+            }
@@ -1,19 +1,139 @@
 """Web app for dividing spotify songs over different playlists."""
 
 from flask import Flask, render_template, redirect, request, session, flash
-from flask import url_for
+from flask import g, get_flashed_messages, jsonify, url_for
+from flask import before_render_template, template_rendered
 from flask_session import Session
+import requests
 import spotipy
 import os
+import threading
+import time
 import uuid
-from functools import wraps
+from functools import partial, wraps
 from datetime import timedelta
 from config import ProductionConfig, DevelopmentConfig  # noqa: F401 (used as text)
+from action_queue import ActionQueue
+from analysis_prefetcher import AnalysisPrefetcher
+from circuit_breaker import CircuitBreakers
+from divide_plan import DividePlanRunner, PlanError, parse_plan
+from duplicate_index import DuplicateIndex
+from fan_out import FanOut
+from feature_matrix import COLUMNS, FeatureMatrix, step_in_order
+from metadata_cache import MetadataCache
+from metrics import Metrics
+from pagination import Paginator, chunks
+from playlist_membership import PlaylistMembership
+from projection import Projection
+from rate_limit import BACKGROUND, RequestScheduler
+from session_backend import SplitSessionInterface
+from source_loader import SourceLoader, source_pages
+from suggestions import PlaylistCentroids, feature_vector
+from target_loader import TargetLoader
+from spotify_client import ClientRegistry, build_http_session
+from token_cache import TokenCacheHandler, TokenStore
+from track_index import TrackIndex
+from track_store import Track, TrackStore
 
 app = Flask(__name__)
 
 app.config.from_object("config.ProductionConfig")
-Session(app)
+if app.config["SESSION_TYPE"] == "split":
+    app.session_interface = SplitSessionInterface(
+        app.config["SESSION_FILE_DIR"], large_keys=app.config["SESSION_LARGE_KEYS"]
+    )
+    app.session_interface.purge(app.config["TRACK_STORE_MAX_AGE"])
+else:
+    Session(app)
+
+# Latency histograms of the Spotify calls, session, templates and routes; see
+# /metrics (and the Server-Timing header if SERVER_TIMING)
+metrics = Metrics()
+metrics.describe(
+    "http_request_seconds", "Time to handle a request (without saving the session)."
+)
+metrics.describe(
+    "spotify_api_call_seconds", "Time of a Spotify API call, per endpoint."
+)
+metrics.describe(
+    "spotify_scheduler_wait_seconds", "Time a Spotify API call waited for its turn."
+)
+metrics.describe("session_seconds", "Time to load or save the session.")
+metrics.describe("template_render_seconds", "Time to render a template.")
+app.session_interface.open_session = metrics.timed(
+    "session_seconds", timing="session", operation="load"
+)(app.session_interface.open_session)
+app.session_interface.save_session = metrics.timed("session_seconds", operation="save")(
+    app.session_interface.save_session
+)
+
+# The loaded tracks are too large to (re)pickle with the session on every click
+track_store = TrackStore(app.config["TRACK_STORE_DIR"])
+track_store.purge(app.config["TRACK_STORE_MAX_AGE"])
+
+# Album labels and artist genres are shared by all users (and workers)
+album_label_cache = MetadataCache(
+    app.config["METADATA_CACHE_PATH"],
+    "album_label",
+    ttl=app.config["METADATA_CACHE_TTL"],
+    max_memory_entries=app.config["METADATA_CACHE_MEMORY_ENTRIES"],
+    max_disk_entries=app.config["METADATA_CACHE_DISK_ENTRIES"],
+)
+artist_genres_cache = MetadataCache(
+    app.config["METADATA_CACHE_PATH"],
+    "artist_genres",
+    ttl=app.config["METADATA_CACHE_TTL"],
+    max_memory_entries=app.config["METADATA_CACHE_MEMORY_ENTRIES"],
+    max_disk_entries=app.config["METADATA_CACHE_DISK_ENTRIES"],
+)
+# (and the compact audio analysis of the tracks, see analysis_prefetcher.py)
+audio_analysis_cache = MetadataCache(
+    app.config["METADATA_CACHE_PATH"],
+    "audio_analysis",
+    ttl=app.config["AUDIO_ANALYSIS_CACHE_TTL"],
+    max_memory_entries=app.config["METADATA_CACHE_MEMORY_ENTRIES"],
+    max_disk_entries=app.config["AUDIO_ANALYSIS_CACHE_DISK_ENTRIES"],
+)
+METADATA_CACHES = (album_label_cache, artist_genres_cache, audio_analysis_cache)
+
+
+def metadata_cache_lookups():
+    """Return the lookups of the metadata caches, per cache and result."""
+    lookups = {}
+    for cache in METADATA_CACHES:
+        stats = cache.stats()
+        for result, counter in (
+            ("memory_hit", "memory_hits"),
+            ("disk_hit", "disk_hits"),
+            ("miss", "misses"),
+        ):
+            lookups[(("cache", cache.namespace), ("result", result))] = stats[counter]
+    return lookups
+
+
+metrics.counter(
+    "metadata_cache_lookups_total",
+    "Lookups in the metadata caches, per cache and result.",
+    metadata_cache_lookups,
+)
+metrics.gauge(
+    "metadata_cache_memory_entries",
+    "Entries in the memory tier of the metadata caches, per cache.",
+    lambda: {
+        (("cache", cache.namespace),): cache.stats()["memory_entries"]
+        for cache in METADATA_CACHES
+    },
+)
+
+# Large playlists (and libraries) are fetched a number of pages at a time
+paginator = Paginator(app.config["SPOTIFY_MAX_CONCURRENCY"])
+# The metadata of the track on the divide page is looked up all at once
+fan_out = FanOut(app.config["SPOTIFY_MAX_CONCURRENCY"])
+# (lookups that come in after their request store their result in its threads,
+# see store_metadata)
+late_features_lock = threading.Lock()
+# the errors of the calls for metadata, which the pages can do without
+LOOKUP_ERRORS = (spotipy.exceptions.SpotifyException, requests.RequestException)
 
 # help from:
 # https://stackoverflow.com/questions/57580411/...
@@ -28,33 +148,191 @@ Session(app)
 # the loaded data between the divide renders/button presses...
 # TODO: use flask 'g' for track info, and session for the rest?
 
-# class CacheXHandler:
-#     """
-#     Modified version for handling the caching and retrieval of authorization tokens.
-
-#     Based on abstraction CacheHandler() in cache_handler.py of spotipy.
-#     Handles reading and writing Spotify authorization tokens
-#     """
+# The tokens of all users are in one store (see TokenCacheHandler), instead of
+# a cache file per visitor
+token_store = TokenStore(
+    app.config["TOKEN_STORE_PATH"], max_age=app.config["TOKEN_MAX_AGE"]
+)
+token_store.purge()
 
-#     def get_cached_token(self):
-#         """Get and return a token_info dictionary object."""
-#         # return token_info
-#         raise NotImplementedError()
 
-#     def save_token_to_cache(self, token_info):
-#         """Save a token_info dictionary object to the cache and return None."""
-#         raise NotImplementedError()
-#         return None
+def make_auth_manager(uid):
+    """Create the auth manager (with its own token cache) of a user."""
+    # Don't reuse a SpotifyOAuth object because they store token info and you
+    # could leak user tokens if you reuse a SpotifyOAuth object (for another user)
+    auth_manager = spotipy.oauth2.SpotifyOAuth(
+        client_id=app.config["CLIENT_ID"],
+        client_secret=app.config["CLIENT_SECRET"],
+        redirect_uri=app.config["REDIRECT_URI"],
+        scope=app.config["SCOPE"],
+        cache_handler=TokenCacheHandler(token_store, uid),
+        show_dialog=True,
+        requests_session=spotify_http_session,
+    )
+    auth_manager.OAUTH_AUTHORIZE_URL = f"{app.config['SPOTIFY_ACCOUNTS_URL']}/authorize"
+    auth_manager.OAUTH_TOKEN_URL = f"{app.config['SPOTIFY_ACCOUNTS_URL']}/api/token"
+    return auth_manager
+
+
+# One client per user, all sharing one keep-alive connection pool to Spotify,
+# and one scheduler: the rate limit, 429 pauses and turns of the users
+spotify_http_session = build_http_session(app.config["SPOTIFY_POOL_SIZE"])
+# (the metadata endpoints are skipped for a while when they fail, as the
+# divide page can do without)
+spotify_breakers = CircuitBreakers(
+    failures=app.config["SPOTIFY_BREAKER_FAILURES"],
+    cool_down=app.config["SPOTIFY_BREAKER_COOL_DOWN"],
+    slow=app.config["SPOTIFY_BREAKER_SLOW_CALL"],
+    endpoints=app.config["SPOTIFY_BREAKER_ENDPOINTS"],
+)
+spotify_scheduler = RequestScheduler(
+    app.config["SPOTIFY_RATE_LIMIT"],
+    burst=app.config["SPOTIFY_RATE_BURST"],
+    max_pause=app.config["SPOTIFY_MAX_PAUSE"],
+)
+spotify_clients = ClientRegistry(
+    make_auth_manager,
+    spotify_http_session,
+    max_clients=app.config["SPOTIFY_MAX_CLIENTS"],
+    scheduler=spotify_scheduler,
+    api_url=app.config["SPOTIFY_API_URL"],
+    metrics=metrics,
+    breakers=spotify_breakers,
+)
+metrics.gauge(
+    "spotify_scheduler_waiting_calls",
+    "Spotify API calls waiting for their turn, per priority.",
+    lambda: {
+        (("priority", priority),): waiting
+        for priority, waiting in enumerate(spotify_scheduler.stats()["waiting"])
+    },
+)
+metrics.counter(
+    "spotify_scheduler_pauses_total",
+    "Number of times all Spotify API calls were paused after a 429.",
+    lambda: {(): spotify_scheduler.stats()["pauses"]},
+)
+metrics.gauge(
+    "spotify_circuit_open",
+    "Spotify API endpoints that aren't called (open) or tried again (half_open).",
+    lambda: {
+        (("endpoint", endpoint), ("state", state)): 1
+        for endpoint, state in spotify_breakers.stats()["circuits"].items()
+    },
+)
+metrics.counter(
+    "spotify_circuit_opened_total",
+    "Number of times a Spotify API endpoint was skipped after failing.",
+    lambda: {(): spotify_breakers.stats()["opened"]},
+)
+
+
+def get_spotify_of_user(uid):
+    """Return the Spotify client of the user, or None if the user is logged out."""
+    spotify_client = spotify_clients.get(uid)
+    auth_manager = spotify_client.auth_manager
+
+    if not auth_manager.validate_token(auth_manager.cache_handler.get_cached_token()):
+        return None
+
+    return spotify_client
+
+
+# The adds and removes of divide are sent in batches, in the background
+action_queue = ActionQueue(
+    get_spotify_of_user,
+    flush_size=app.config["ACTION_QUEUE_FLUSH_SIZE"],
+    idle_seconds=app.config["ACTION_QUEUE_IDLE_SECONDS"],
+    retries=app.config["ACTION_QUEUE_RETRIES"],
+)
+
+# Whole divide plans (uploaded as JSON or CSV) run as a background job
+divide_plan_runner = DividePlanRunner(
+    get_spotify_of_user, paginator, track_store, scheduler=spotify_scheduler
+)
+
+# The pages of a large source after the first one load in the background,
+# with the metadata of their tracks (prefetch_loaded is defined below)
+source_loader = SourceLoader(
+    get_spotify_of_user,
+    paginator,
+    track_store,
+    scheduler=spotify_scheduler,
+    fetch_features=lambda *args: prefetch_loaded(*args),
+    chunk_seconds=app.config["SOURCE_CHUNK_SECONDS"],
+    concurrency=app.config["SOURCE_LOAD_CONCURRENCY"],
+)
+
+# The tracks of the target playlists load in the background too, to mark the
+# ones with the track and suggest targets (fetch_targets is defined below)
+target_loader = TargetLoader(
+    get_spotify_of_user,
+    track_store,
+    lambda *args: fetch_targets(*args),
+    scheduler=spotify_scheduler,
+)
+
+# The audio analysis of the tracks ahead is fetched in the background, the
+# divide page only shows it once it's cached
+analysis_prefetcher = AnalysisPrefetcher(
+    get_spotify_of_user,
+    audio_analysis_cache,
+    max_workers=app.config["AUDIO_ANALYSIS_WORKERS"],
+    scheduler=spotify_scheduler,
+    max_pending=app.config["AUDIO_ANALYSIS_MAX_PENDING"],
+)
+metrics.gauge(
+    "audio_analysis_prefetches",
+    "Audio analyses fetched in the background (pending, fetched, failed, skipped).",
+    lambda: {
+        (("state", state),): count
+        for state, count in analysis_prefetcher.stats().items()
+    },
+)
+
+
+def get_tracks():
+    """Return the loaded (compact) source tracks of the current user."""
+    return track_store.get(session.get("uuid"), "tracks", [])
+
+
+def get_membership():
+    """Get the track ids of the target playlists, from the track store."""
+    return track_store.get(session.get("uuid"), "membership") or PlaylistMembership()
+
+
+def get_duplicates():
+    """Get the duplicates in the loaded tracks, from the track store."""
+    return track_store.get(session.get("uuid"), "duplicates") or DuplicateIndex([])
+
+
+def get_centroids():
+    """Get the centroids of the target playlists, from the track store."""
+    return track_store.get(session.get("uuid"), "centroids") or PlaylistCentroids()
+
+
+def get_track_index():
+    """Return the navigation index (the tracks left) of the loaded source tracks."""
+    return track_store.get(session.get("uuid"), "track_index") or TrackIndex([])
 
 
-caches_folder = "./.spotify_caches/"
-if not os.path.exists(caches_folder):
-    os.makedirs(caches_folder)
+@app.before_request
+def start_request_timer():
+    """Remember when the request started, for the metrics."""
+    g.request_started = time.perf_counter()
 
 
-def session_cache_path():
-    """Create a cache for the current user."""
-    return caches_folder + session.get("uuid")
+# the requests of (and for) the divide page itself, which don't leave it: its
+# JSON API (the clicks, the tracks ahead and the load of the source) and the
+# static files (e.g. revalidating styles.css) and missing files (no endpoint)
+DIVIDE_PAGE_ENDPOINTS = {
+    "divide",
+    "divide_action",
+    "divide_tracks",
+    "divide_loading",
+    "static",
+    None,
+}
 
 
 @app.before_request
@@ -66,9 +344,57 @@ def before_request():
             url = request.url.replace("http://", "https://", 1)
             code = 301
             return redirect(url, code=code)
+    # (scraping the metrics shouldn't create a session every time)
+    if request.endpoint == "metrics_text":
+        return
     session.permanent = True
     app.permanent_session_lifetime = timedelta(hours=1)
 
+    uid = session.get("uuid")
+    if uid:
+        # leaving the divide page, so send the actions that are still queued
+        if (
+            request.endpoint not in DIVIDE_PAGE_ENDPOINTS
+            and action_queue.pending_count(uid)
+        ):
+            action_queue.flush(uid)
+        # tell the user about actions that couldn't be done
+        for error in action_queue.pop_errors(uid):
+            flash(error)
+
+
+@app.after_request
+def observe_request(response):
+    """Observe the time of the request, and add the Server-Timing header."""
+    seconds = time.perf_counter() - g.get("request_started", time.perf_counter())
+    metrics.observe(
+        "http_request_seconds",
+        seconds,
+        endpoint=request.endpoint or "none",
+        method=request.method,
+        status=response.status_code,
+    )
+    if app.config["SERVER_TIMING"]:
+        response.headers["Server-Timing"] = metrics.server_timing(total=seconds)
+    return response
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    """Remember when rendering the template started."""
+    g.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def observe_render(sender, template, context, **extra):
+    """Observe the time of rendering the template."""
+    metrics.observe(
+        "template_render_seconds",
+        time.perf_counter() - g.pop("render_started"),
+        timing="render",
+        template=template.name,
+    )
+
 
 def login_required(f):
     """
@@ -90,27 +416,19 @@ def get_spotify():
     """
     Get the Spotify API client for the current logged in user.
 
-    User must be logged in to Spotify previously.
+    User must be logged in to Spotify previously. The client is reused for the
+    rest of the request (and by later requests of the same user).
     """
-    cache_handler = spotipy.cache_handler.CacheFileHandler(
-        cache_path=session_cache_path()
-    )
+    if "spotify_client" in g:
+        return g.spotify_client
 
-    # Don't reuse a SpotifyOAuth object because they store token info and you
-    # could leak user tokens if you reuse a SpotifyOAuth object
-    auth_manager = spotipy.oauth2.SpotifyOAuth(
-        client_id=app.config["CLIENT_ID"],
-        client_secret=app.config["CLIENT_SECRET"],
-        redirect_uri=app.config["REDIRECT_URI"],
-        scope=app.config["SCOPE"],
-        cache_handler=cache_handler,
-        show_dialog=True,
-    )
+    spotify_client = get_spotify_of_user(session.get("uuid"))
 
-    if not auth_manager.validate_token(cache_handler.get_cached_token()):
+    if not spotify_client:
         return redirect("/")
 
-    return spotipy.Spotify(auth_manager=auth_manager)
+    g.spotify_client = spotify_client
+    return spotify_client
 
 
 @app.route("/")
@@ -148,20 +466,9 @@ def login():
         session["radio_action"] = "radio_move"
         session["select_all"] = None
 
-    cache_handler = spotipy.cache_handler.CacheFileHandler(
-        cache_path=session_cache_path()
-    )
-
-    # Don't reuse a SpotifyOAuth object because they store token info and you
-    # could leak user tokens if you reuse a SpotifyOAuth object
-    auth_manager = spotipy.oauth2.SpotifyOAuth(
-        client_id=app.config["CLIENT_ID"],
-        client_secret=app.config["CLIENT_SECRET"],
-        redirect_uri=app.config["REDIRECT_URI"],
-        scope=app.config["SCOPE"],
-        cache_handler=cache_handler,
-        show_dialog=True,
-    )
+    spotify_client = spotify_clients.get(session.get("uuid"))
+    auth_manager = spotify_client.auth_manager
+    cache_handler = auth_manager.cache_handler
 
     if request.args.get("code"):
         # Step 3. Being redirected from Spotify auth page
@@ -175,8 +482,6 @@ def login():
         return render_template("login.html", auth_url=auth_url)
 
     # Step 4. Signed in, display data
-    spotify_client = spotipy.Spotify(auth_manager=auth_manager)
-
     # (re)set log_n_failed tracker
     session["log_in_failed"] = False
 
@@ -199,21 +504,22 @@ def login():
 
 @app.route("/logout")
 def logout():
-    """Log the user out by deleting the cache file and clearing the session."""
+    """Log the user out by deleting the token and clearing the session."""
     # We have to carry over the login failed to "/"
     if session.get("log_in_failed"):
         track_log_in_failed = True
     else:
         track_log_in_failed = False
 
-    try:
-        # TODO: make this a bit smarter such that we can store the source-
-        # and target playlists
-        # Remove the CACHE file (.cache-test) so that a new user can authorize.
-        os.remove(session_cache_path())
-        session.clear()
-    except OSError as e:
-        print("Error: %s - %s." % (e.filename, e.strerror))
+    # TODO: make this a bit smarter such that we can store the source-
+    # and target playlists
+    # Remove the token (and client) so that a new user can authorize.
+    if session.get("uuid"):
+        action_queue.flush(session.get("uuid"), wait=True)
+        spotify_clients.discard(session.get("uuid"))
+        track_store.clear(session.get("uuid"))
+        token_store.delete(session.get("uuid"))
+    session.clear()
 
     if track_log_in_failed:
         session["log_in_failed"] = True
@@ -246,7 +552,9 @@ def select_source():
         # get the spotify_client for the current logged in user.
         spotify_client = get_spotify()
 
-        playlists = get_all_playlists_of_user(spotify_client)
+        playlists = get_playlist_index(
+            spotify_client, refresh=request.args.get("refresh")
+        )["playlists"]
 
         # TODO: fixed images somewhat quick and dirty in the html templates:
         # I wanted to get the smallest images to safe bandwidth and memory
@@ -285,31 +593,24 @@ def select_target():
     else:
         spotify_client = get_spotify()
 
-        playlists = get_all_playlists_of_user(spotify_client)
+        playlist_index = get_playlist_index(
+            spotify_client, refresh=request.args.get("refresh")
+        )
 
         # if we've made a selection before, let's pre-check those items
-        target_playlist_ids = session.get("target_playlist_ids")
+        target_playlist_ids = session.get("target_playlist_ids") or []
 
         # We only display the playlists that the user can edit: must be owned
         # by the user and not collaborative
         # (https://stackoverflow.com/questions/38885575/
         # spotify-web-api-how-to-find-playlists-the-user-can-edit)
-
-        user = spotify_client.me()
-        for current_playlist in reversed(playlists):
-            # remove not-owned and collaborative playlists
-            if (
-                current_playlist["owner"]["id"] != user["id"]
-                or current_playlist["collaborative"]
-            ):
-                playlists.remove(current_playlist)
-            else:
-                # if we've made a selection before, let's pre-check those items
-                if target_playlist_ids:
-                    if current_playlist["id"] in target_playlist_ids:
-                        current_playlist["checked"] = True
-                    else:
-                        current_playlist["checked"] = False
+        # (copies, as the playlists in the index are shared between requests)
+        playlists = [
+            dict(playlist, checked=playlist["id"] in target_playlist_ids)
+            for playlist in playlist_index["playlists"]
+            if playlist["owner_id"] == playlist_index["user_id"]
+            and not playlist["collaborative"]
+        ]
 
         # return template with the playlists
         return render_template("select_target.html", playlists=playlists)
@@ -331,7 +632,10 @@ def divide():
 
         # action playlists.. is very similar to target playlists
         action_playlist_ids = request.form.getlist("action_playlist_ids")
-        session["action_playlist_ids"] = action_playlist_ids
+        # (only the ones the user checked, not the ones checked as suggested)
+        session["action_playlist_ids"] = user_checked(
+            action_playlist_ids, request.form.get("suggested_playlist_ids")
+        )
         # action; move, copy or remove -
         # name of button; radio_move, radio_copy or radio_remove
         radio_action = request.form["radio_action"]
@@ -339,107 +643,51 @@ def divide():
         # is select_all checked? is 'on' or None (this is just to set the same state)
         select_all = request.form.get("select_all")
         session["select_all"] = select_all
+        # check the suggested playlists? 'on' or None
+        session["suggest"] = request.form.get("suggest")
         # previous or next butoon clicked? returns button name (btn_prev or btn_next)
         btn_clicked = request.form["btn_clicked"]
-
-        if (btn_clicked == "btn_next_no_action") or (
-            btn_clicked == "btn_prev_no_action"
-        ):
-            session["track_counter"] = update_count(btn_clicked)
+        # (with the tracks loaded in the background since)
+        merge_loaded(lazy=btn_clicked in NAVIGATION_BUTTONS)
+        merge_targets()
+
+        # filter and sort the tracks to divide (or show all again)
+        if btn_clicked == "btn_filter":
+            try:
+                session["divide_filter"] = parse_filter(request.form)
+            except ValueError as error:
+                flash(f"No filter applied: {error}")
+                return render_divide()
+            if not apply_filter():
+                flash("No tracks match the filter, showing all tracks.")
             return render_divide()
 
-        if (btn_clicked != "btn_next") and (btn_clicked != "btn_prev"):
-            flash("Something went wrong... (unexpected POST method/button click)")
-            return redirect(url_for("divide"))
-
-        # on empty playlist and 'move' return alert (please use delete), do not change
-        # song number
-        if not action_playlist_ids and radio_action == "radio_move":
-            flash(
-                "No action taken as you've selected 'Move', but without a "
-                "target playlist."
-            )
-            session["track_counter"] = update_count(btn_clicked)
+        if btn_clicked == "btn_filter_clear":
+            session["divide_filter"] = None
             return render_divide()
 
-        # on empty playlist and 'copy' return alert (no playlist selected). do change
-        # song number
-        if not action_playlist_ids and radio_action == "radio_copy":
-            flash(
-                "No action taken as you've selected 'Copy', but without a "
-                "target playlist."
+        # jump to the next copy (or similar version) of the track
+        if btn_clicked == "btn_next_duplicate":
+            duplicate = get_duplicates().next(
+                session.get("track_counter"), get_track_index()
             )
-            session["track_counter"] = update_count(btn_clicked)
+            if duplicate != -1:
+                session["track_counter"] = duplicate
             return render_divide()
-            # we're not removing songs, so always one (this) song remains,
-            # so no need to check for -1
 
-        # If we do have a target playlist selected, and we're on the remove, that's
-        # probably a mistake to, as nothing will be done with the target playlist
-        # let's warn the user and do nothing
-        if action_playlist_ids and radio_action == "radio_remove":
-            flash(
-                "No action taken as you've selected 'Remove', but you also have a "
-                "target playlist selected. Deselect all playlist to remove, or "
-                "select the 'Copy' or 'Move' action."
-            )
-            return render_divide()
+        if btn_clicked == "btn_remove_duplicates":
+            return remove_duplicates()
 
-        track_data = session.get("tracks")[session.get("track_counter")]["track"]
-
-        # add song to target playlists (move and copy)
-        if radio_action == "radio_move" or radio_action == "radio_copy":
-            for action_playlist in action_playlist_ids:
-                spotify_client.playlist_add_items(action_playlist, [track_data["uri"]])
-            # for move, the update count is updated in the next loop
-            if radio_action == "radio_copy":
-                session["track_counter"] = update_count(btn_clicked)
-                # we're not removing songs, so always one (this) song remains,
-                # so no need to check for -1
-
-        # delete song from source playlist + delete from sessiontracks (move and delete)
-        if radio_action == "radio_move" or radio_action == "radio_remove":
-            # delete from playlist...
-            # ...case liked songs
-            if session.get("source_playlist") == "liked_songs":
-                spotify_client.current_user_saved_tracks_delete([track_data["id"]])
-            # ...case playlist
-            else:
-                # TODO: double check if user is owner? Tho 'Copy' should be
-                # only option in that case, and this will just return an error
-                # so not destructive..
-                spotify_client.playlist_remove_specific_occurrences_of_items(
-                    playlist_id=session.get("source_playlist"),
-                    items=[
-                        {
-                            "uri": track_data["id"],
-                            "positions": [session.get("track_counter")],
-                        }
-                    ],
-                )
-            # delete from sessiontracks (move and delete)
-            tracks = session.get("tracks")
-            current_track = tracks[session.get("track_counter")]
-            tracks.remove(current_track)
-            session["tracks"] = tracks
-            # as we delete a track.. the next song automatically comes in the place
-            # of the track counter, but... it might be a non-track type.. so let's
-            # update count handle that...; set to -1, and pass to update count.
-            # This will also handle the edge case that we're at the last track...
-            # However, if we're going in the other direction, we need the original
-            # action.
-            if btn_clicked == "btn_next":
-                session["track_counter"] -= 1
-                session["track_counter"] = update_count(btn_clicked)
-            if btn_clicked == "btn_prev":
-                session["track_counter"] = update_count(btn_clicked)
-
-            if session.get("track_counter") == -1:
-                flash(
-                    "No (more) tracks in source playlist, "
-                    "select another source playlist."
-                )
-                return redirect(url_for("select_source"))
+        if btn_clicked not in NAVIGATION_BUTTONS:
+            flash("Something went wrong... (unexpected POST method/button click)")
+            return redirect(url_for("divide"))
+
+        forward = btn_clicked in ("btn_next", "btn_next_no_action")
+        if btn_clicked.endswith("_no_action"):
+            radio_action = None
+        divide_track(radio_action, action_playlist_ids, forward)
+        if session.get("track_counter") == -1:
+            return redirect(url_for("select_source"))
 
         # return all the selected stuff as before to the render (via session)!
         return render_divide()
@@ -453,45 +701,39 @@ def divide():
             flash("No source playlist selected, select a source playlist in step 1.")
             return redirect(url_for("select_source"))
 
-        if source_playlist == "liked_songs":
-            tr = spotify_client.current_user_saved_tracks()
-        else:
-            tr = spotify_client.playlist_tracks(playlist_id=source_playlist)
-            # possibly 'playlist_items', we can also move podcasts, quite difficult tho.
+        # make sure all queued actions are done before (re)loading the source
+        action_queue.flush(session.get("uuid"), wait=True)
+
+        # the tracks (and position) loaded before, if the source didn't change
+        tracks, track_index, track_counter = load_source(
+            spotify_client, source_playlist
+        )
 
-        if len(tr["items"]) == 0:
+        if len(tracks) == 0:
             flash("Source playlist is empty, select another source playlist.")
             return redirect(url_for("select_source"))
 
-        tracks = tr["items"]
-        while tr["next"]:
-            tr = spotify_client.next(tr)
-            tracks.extend(tr["items"])
-
-        # remove non-track items
-        skip_count = 0
-        for track in reversed(tracks):
-            if track["track"]["type"] != "track":
-                track["skip"] = True
-                skip_count += 1
+        if len(track_index) == 0:
+            if any(not track.skip for track in tracks):
+                flash("No (more) tracks in source playlist, select another one.")
             else:
-                track["skip"] = False
-
-        if len(tr["items"]) == skip_count:
-            flash(
-                "Source playlist only contains non-track items (Podcasts), "
-                "select another playlist."
-            )
+                flash(
+                    "Source playlist only contains non-track items (Podcasts), "
+                    "select another playlist."
+                )
             return redirect(url_for("select_source"))
 
         # check if user is owner of source playlist, if not owner (or collab etc.),
         # do not show move or delete options; only copy. # liked songs is definetly
         # ours, so no problems there
-        user = spotify_client.me()
+        playlist_index = get_playlist_index(spotify_client)
         session["move_remove_enabled"] = True
         if source_playlist != "liked_songs":
-            playlist = spotify_client.playlist(source_playlist)
-            if playlist["owner"]["id"] != user["id"] or playlist["collaborative"]:
+            playlist = find_playlist(spotify_client, playlist_index, source_playlist)
+            if (
+                playlist["owner_id"] != playlist_index["user_id"]
+                or playlist["collaborative"]
+            ):
                 session["move_remove_enabled"] = False
                 flash(
                     "Only the 'copy' action is available, as you do not own the "
@@ -514,216 +756,1534 @@ def divide():
 
         # reading each playlist from the spotify api takes about 0.1 per playlist
         # so if many playlists are selected this can take a long time, all my playlists
-        # resulted in about 15 seconds!... the target loading of step 2 takes 0.8 - 2.2
-        # seconds so... let's use that method (and pop) if we have more than x
-        # playlists...
-        # After timing both option multiple times, i measured that loading all playlists
-        # and popping was faster as of the length of 7 playlists.
-
-        if len(target_playlist_ids) < 7:
-            target_playlists = []
-            for target_playlist_id in target_playlist_ids:
-                target_playlists.append(spotify_client.playlist(target_playlist_id))
-
-        else:
-            target_playlists = get_all_playlists_of_user(spotify_client)
-
-            for playlist in reversed(target_playlists):
-                # remove not-owned and collaborative playlists
-                if playlist["id"] not in target_playlist_ids:
-                    target_playlists.remove(playlist)
+        # resulted in about 15 seconds!... but we have them all in the playlist
+        # index already (from step 1 and 2), so just pick them from there.
+        target_playlists = [
+            dict(playlist)
+            for playlist in playlist_index["playlists"]
+            if playlist["id"] in target_playlist_ids
+        ]
 
         # STORE DATA IN SESSION: (note that this is only done in GET, when
         # the page is loaded.)
         # - playlists just the name and id's? TODO: Store that info earlier
         #       with the target selection where we still have it?)
-        # - tracklist
-        # - iteration number [initialize in GET to 0]
+        # - tracklist and index (in the track store, by load_source)
+        # - iteration number (where the user was, or the first track left)
         session["target_playlists"] = target_playlists
-        session["tracks"] = tracks
-
-        # do not start at a 'skip' track
-        track_counter = 0
+        session["track_counter"] = track_counter
 
-        while tracks[track_counter]["skip"]:
-            track_counter += 1
+        # get all labels, genres and audio features in one go (batched), so
+        # next and previous don't have to wait for the API, only the ones
+        # not fetched yet (interactive calls of other users go first)
+        with spotify_scheduler.priority(BACKGROUND):
+            prefetch_metadata(spotify_client, tracks)
+        # (the targets are marked once they're loaded, see merge_targets)
+        target_loader.start(session.get("uuid"), target_playlist_ids)
 
-        session["track_counter"] = track_counter
+        # the tracks may have changed, so filter them again
+        if session.get("divide_filter") and not apply_filter():
+            flash("No tracks match the filter anymore, showing all tracks.")
 
         # render the divide page
         return render_divide()
 
 
+# audio features shown (as bars) on the divide page, next to popularity
+FEATURE_STRINGS = [
+    "energy",
+    "danceability",
+    "valence",
+    "speechiness",
+    "acousticness",
+    "instrumentalness",
+    "liveness",
+]
+
+
+# the tracks after the current one the divide page has ready (at most MAX_AHEAD)
+AHEAD = 5
+MAX_AHEAD = 20
+# seconds between the checks for more tracks of the source (see wait_for_source)
+SOURCE_WAIT_INTERVAL = 0.2
+
+# the buttons of the divide page that go to another track
+NAVIGATION_BUTTONS = (
+    "btn_next",
+    "btn_prev",
+    "btn_next_no_action",
+    "btn_prev_no_action",
+)
+
+
+@app.route("/divide/tracks")
+@login_required
+def divide_tracks():
+    """
+    Return the current track, the one before and the next ones as JSON.
+
+    For the divide page, to show the next track right away (see tracks_ahead).
+    'have' are the positions the page has already (comma separated). With an
+    ETag, so asking again for the same returns 304 Not Modified.
+    """
+    track_counter = session.get("track_counter")
+    if track_counter is None or track_counter not in get_track_index():
+        return jsonify(error="No track to divide, load the divide page."), 409
+    have = [
+        int(position)
+        for position in request.args.get("have", "").split(",")
+        if position.isdigit()
+    ]
+    merge_targets()
+    response = jsonify(tracks_ahead(have, request.args.get("ahead", AHEAD, type=int)))
+    response.headers["Cache-Control"] = "no-cache"
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route("/divide/action", methods=["POST"])
+@login_required
+def divide_action():
+    """
+    Divide the current track (see divide_track) and return the next as JSON.
+
+    Takes what the form of the divide page sends (as JSON), with the track
+    counter the page shows; if that isn't the current track (anymore), nothing
+    is done (409 Conflict). Returns the tracks the page doesn't have yet, like
+    divide_tracks (so one request per click), and the messages for the user.
+    """
+    data = request.get_json(silent=True) or {}
+    btn_clicked = data.get("btn_clicked")
+    radio_action = data.get("radio_action")
+    action_playlist_ids = data.get("action_playlist_ids") or []
+    have = data.get("have") or []
+    if (
+        btn_clicked not in NAVIGATION_BUTTONS
+        or radio_action not in ("radio_move", "radio_copy", "radio_remove")
+        or not isinstance(action_playlist_ids, list)
+        or not isinstance(have, list)
+        or not isinstance(data.get("suggested_playlist_ids") or [], list)
+    ):
+        return jsonify(error="Unexpected divide action."), 400
+    if data.get("track_counter") != session.get("track_counter"):
+        return (
+            jsonify(
+                error="This isn't the current track anymore.",
+                track_counter=session.get("track_counter"),
+            ),
+            409,
+        )
+
+    # the same state as the form of the divide page (see divide)
+    session["action_playlist_ids"] = user_checked(
+        action_playlist_ids, data.get("suggested_playlist_ids")
+    )
+    session["radio_action"] = radio_action
+    session["select_all"] = data.get("select_all")
+    session["suggest"] = data.get("suggest")
+    merge_loaded(lazy=True)
+    merge_targets()
+
+    forward = btn_clicked in ("btn_next", "btn_next_no_action")
+    if btn_clicked.endswith("_no_action"):
+        radio_action = None
+    divide_track(radio_action, action_playlist_ids, forward)
+
+    # (if no tracks are left, the page goes to step 1, with the messages)
+    if session.get("track_counter") == -1:
+        return jsonify(track_counter=-1, left=0, messages=[])
+    return jsonify(dict(tracks_ahead(have), messages=get_flashed_messages()))
+
+
+@app.route("/divide/loading")
+@login_required
+def divide_loading():
+    """Return how much of the source is loaded (in the background) as JSON."""
+    return jsonify(loading_view() or {})
+
+
+def loading_view():
+    """Return the tracks loaded and the total while the source loads, else None."""
+    uid = session.get("uuid")
+    source = track_store.get(uid, "source")
+    progress = source_loader.progress(uid)
+    if (
+        not source
+        or not source.get("loading")
+        or not progress
+        or progress["id"] != source["loading"]
+    ):
+        return None
+    return {"loaded": progress["loaded"], "total": progress["total"]}
+
+
+def tracks_ahead(have, ahead=AHEAD):
+    """
+    Return the tracks around the current one, for the JSON API of the divide page.
+
+    The track counter, the position before it and the (at most ahead, up to
+    MAX_AHEAD) positions after it, the way the buttons go (see next_position),
+    and the tracks at those positions (see track_view) that aren't in have.
+    """
+    track_counter = session.get("track_counter")
+    track_index = get_track_index()
+    order = filter_order()
+
+    upcoming = []
+    position = track_counter
+    while len(upcoming) < min(ahead, MAX_AHEAD):
+        position = next_position(position, True, track_index, order)
+        if position in (-1, track_counter) or position in upcoming:
+            break
+        upcoming.append(position)
+    previous = next_position(track_counter, False, track_index, order)
+    if previous in (-1, track_counter):
+        previous = None
+
+    prefetch_analysis(track_counter)
+    spotify_client = get_spotify()
+    positions = [track_counter, *upcoming] + (
+        [previous] if previous is not None else []
+    )
+    return dict(
+        track_counter=track_counter,
+        previous=previous,
+        upcoming=upcoming,
+        left=len(track_index),
+        tracks={
+            position: track_view(spotify_client, position)
+            for position in positions
+            if position not in have
+        },
+    )
+
+
+@app.route("/divide_plan", methods=["GET", "POST"])
+@login_required
+def divide_plan():
+    """
+    Divide a whole plan at once: a JSON or CSV mapping of tracks to playlists.
+
+    The tracks are moved, copied or removed from the source playlist of step 1
+    in a background job; this page shows the progress of that job.
+    """
+    uid = session.get("uuid")
+    source_playlist = session.get("source_playlist")
+    spotify_client = get_spotify()
+
+    if request.method == "POST":
+        if not source_playlist:
+            flash("No source playlist selected, select a source playlist in step 1.")
+            return redirect(url_for("select_source"))
+
+        progress = divide_plan_runner.progress(uid)
+        if progress and progress["state"] == "running":
+            flash("Your previous plan is still running, please wait for it to finish.")
+            return redirect(url_for("divide_plan"))
+
+        plan_file = request.files.get("plan_file")
+        if plan_file and plan_file.filename:
+            plan_text = plan_file.read().decode("utf-8-sig")
+        else:
+            plan_text = request.form.get("plan_text", "")
+
+        try:
+            plan = parse_plan(plan_text, request.form.get("plan_action", "move"))
+        except PlanError as e:
+            flash(f"No action taken, {e}")
+            return redirect(url_for("divide_plan"))
+
+        # just like in step 2, we can only change playlists the user can edit
+        playlist_index = get_playlist_index(spotify_client)
+        editable_ids = {
+            playlist["id"]
+            for playlist in playlist_index["playlists"]
+            if playlist["owner_id"] == playlist_index["user_id"]
+            and not playlist["collaborative"]
+        }
+        not_editable = {
+            target_playlist_id
+            for _, playlists, _ in plan
+            for target_playlist_id in playlists
+            if target_playlist_id not in editable_ids
+        }
+        if not_editable:
+            flash(
+                f"No action taken, you can't add tracks to {len(not_editable)} of "
+                "the playlists in the plan (you must own the playlist, and it "
+                "can't be a collaborative playlist)."
+            )
+            return redirect(url_for("divide_plan"))
+
+        removes = any(action != "copy" for _, _, action in plan)
+        if removes and source_playlist not in editable_ids | {"liked_songs"}:
+            flash(
+                "No action taken, the plan moves or removes tracks, but you can't "
+                "remove tracks from the source playlist. Use 'copy' only."
+            )
+            return redirect(url_for("divide_plan"))
+
+        # the divide actions of step 3 go first
+        action_queue.flush(uid, wait=True)
+        divide_plan_runner.start(uid, plan, source_playlist)
+        return redirect(url_for("divide_plan"))
+
+    if source_playlist == "liked_songs":
+        source_name = "Liked Songs"
+    elif source_playlist:
+        playlist_index = get_playlist_index(spotify_client)
+        source_name = find_playlist(spotify_client, playlist_index, source_playlist)[
+            "name"
+        ]
+    else:
+        source_name = None
+
+    return render_template(
+        "divide_plan.html",
+        source_name=source_name,
+        progress=divide_plan_runner.progress(uid),
+    )
+
+
+@app.route("/divide_plan/progress")
+@login_required
+def divide_plan_progress():
+    """Return the progress of the user's last divide plan as JSON."""
+    return jsonify(divide_plan_runner.progress(session.get("uuid")) or {})
+
+
+@app.route("/metrics")
+def metrics_text():
+    """Return the metrics of this worker, in the Prometheus text format."""
+    token = app.config["METRICS_TOKEN"]
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return "Unauthorized", 401
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
 # TODO: bug report button?
 # TODO: buy me a beer button?
 # TODO: add google ads?
 
 
+def load_source(spotify_client, source_playlist):
+    """
+    Return the tracks of the source, their TrackIndex and where to start.
+
+    The loaded tracks are reused, with the position of the user, if the source
+    didn't change since: a playlist has the same snapshot_id (or the one after
+    our own removals), for the liked songs (no snapshot_id) only the pages with
+    songs added since are fetched. Otherwise all tracks are loaded again, and
+    the user continues at the same track, if it's still there. Only the first
+    page is loaded right away, the others in the background (see
+    merge_loaded), unless the first page has nothing to divide or the track
+    the user was at isn't in it.
+    """
+    uid = session.get("uuid")
+    # (what's loaded in the background so far; until all is, it's reused as is)
+    loading = merge_loaded()
+    source = track_store.get(uid, "source")
+    tracks = get_tracks()
+    track_index = get_track_index()
+    track_counter = session.get("track_counter", -1)
+    reuse = bool(source and source["playlist"] == source_playlist and tracks)
+    if reuse and loading:
+        return tracks, track_index, resume_at(track_index, track_counter)
+
+    if source_playlist == "liked_songs":
+        snapshot_id = None
+        new_items = (
+            fetch_new_liked_songs(spotify_client, tracks, track_index)
+            if reuse
+            else None
+        )
+        if new_items is not None:
+            if not new_items:
+                return tracks, track_index, resume_at(track_index, track_counter)
+            # the new songs are at the top, the loaded ones shift down
+            new_tracks = [Track.from_item(item) for item in new_items]
+            live = [not track.skip for track in new_tracks]
+            live.extend(track.position in track_index for track in tracks)
+            tracks = new_tracks + tracks
+            for position, track in enumerate(tracks):
+                track.position = position
+            track_index = TrackIndex(live)
+            track_counter += len(new_tracks)
+            store_source(uid, tracks, track_index)
+            return tracks, track_index, resume_at(track_index, track_counter)
+    else:
+        playlist = spotify_client.playlist(
+            source_playlist, fields="snapshot_id,tracks.total"
+        )
+        snapshot_id = playlist["snapshot_id"]
+        # (the total is a check that nothing else changed it before our removals)
+        if (
+            reuse
+            and snapshot_id
+            in (source["snapshot_id"], action_queue.snapshot_id(uid, source_playlist))
+            and playlist["tracks"]["total"]
+            == len(tracks) - removed_count(tracks, track_index)
+        ):
+            track_store.set(uid, "source", dict(source, snapshot_id=snapshot_id))
+            return tracks, track_index, resume_at(track_index, track_counter)
+
+    # the track the user was at, to continue there
+    current_uri = (
+        tracks[track_counter].uri if reuse and track_counter in track_index else None
+    )
+
+    # (re)load all tracks, the positions of earlier removals don't apply anymore
+    action_queue.forget_positions(uid)
+    fetch_page, page_size = source_pages(spotify_client, source_playlist)
+    first_page = fetch_page(limit=page_size, offset=0)
+    items = list(first_page["items"])
+
+    # only keep what we need of each track, non-track items are marked 'skip'
+    tracks = [Track.from_item(item, position) for position, item in enumerate(items)]
+    loading = None
+    if first_page["total"] > len(items):
+        if any(not track.skip for track in tracks) and (
+            not current_uri or any(track.uri == current_uri for track in tracks)
+        ):
+            loading = source_loader.start(
+                uid, source_playlist, len(items), first_page["total"]
+            )["id"]
+        else:
+            for page_items in paginator.pages(
+                fetch_page, page_size, first_page["total"], start=page_size
+            ):
+                items.extend(page_items)
+            tracks = [
+                Track.from_item(item, position) for position, item in enumerate(items)
+            ]
+    if loading is None:
+        # (stops a load of the source before, if it's still running)
+        source_loader.forget(uid)
+
+    # the tracks left to divide, so not the 'skip' tracks
+    track_index = TrackIndex(not track.skip for track in tracks)
+    store_source(uid, tracks, track_index)
+    track_store.set(
+        uid,
+        "source",
+        {
+            "playlist": source_playlist,
+            "snapshot_id": snapshot_id,
+            "loading": loading,
+            "merged": 0,
+        },
+    )
+
+    # start at the first track left (so not at a 'skip' track)
+    track_counter = track_index.next(-1)
+    if current_uri:
+        track_counter = next(
+            (
+                track.position
+                for track in tracks
+                if track.uri == current_uri and track.position in track_index
+            ),
+            track_counter,
+        )
+    return tracks, track_index, track_counter
+
+
+def store_source(uid, tracks, track_index):
+    """Store the loaded tracks, their index and their duplicates in the track store."""
+    track_store.set(uid, "tracks", tracks)
+    track_store.set(uid, "track_index", track_index)
+    track_store.set(uid, "duplicates", DuplicateIndex(tracks))
+    # (built again from the audio features, see prefetch_metadata)
+    track_store.set(uid, "feature_matrix", None)
+
+
+def merge_loaded(lazy=False):
+    """
+    Add the tracks loaded in the background since the last time (see SourceLoader).
+
+    Only the requests of the user change the loaded tracks (and their index,
+    duplicates and features), so the divide requests that change them add
+    the chunks first. If the filter is on, it's applied again (with the new
+    tracks). Adding them writes all tracks again, so if lazy (for next and
+    previous) that waits until the load is done, or the user gets near the
+    last track loaded (at most MAX_AHEAD tracks left after the current one),
+    or the filter is on. Returns the progress of the load while it's running,
+    else None.
+    """
+    uid = session.get("uuid")
+    source = track_store.get(uid, "source")
+    if not source or not source.get("loading"):
+        return None
+
+    progress = source_loader.progress(uid)
+    lost = (
+        not progress
+        or progress["id"] != source["loading"]
+        or progress["state"] == "running"
+        and time.time() - progress["updated_at"] > app.config["SOURCE_LOAD_STALE"]
+    )
+    if (
+        lazy
+        and not lost
+        and progress["state"] == "running"
+        and not session.get("divide_filter")
+        and tracks_left_after(session.get("track_counter", -1)) > MAX_AHEAD
+    ):
+        return progress
+
+    merged = source["merged"]
+    if not lost and progress["chunks"] > merged:
+        tracks = get_tracks()
+        track_index = get_track_index()
+        features = track_store.get(uid, "features", {})
+        for number in range(merged, progress["chunks"]):
+            chunk = source_loader.take_chunk(uid, number)
+            if not chunk or chunk["id"] != source["loading"]:
+                lost = True
+                break
+            tracks.extend(chunk["tracks"])
+            track_index.extend(not track.skip for track in chunk["tracks"])
+            features.update(chunk["features"])
+            merged += 1
+        store_source(uid, tracks, track_index)
+        track_store.set(uid, "features", features)
+        track_store.set(uid, "feature_matrix", FeatureMatrix(tracks, features))
+        if session.get("divide_filter") and not apply_filter():
+            flash("No tracks match the filter anymore, showing all tracks.")
+
+    running = not lost and progress["state"] == "running"
+    if not running:
+        # (the source is checked as usual again, and loaded again if incomplete)
+        source_loader.forget(uid)
+        if lost or progress["state"] == "failed":
+            flash(
+                "Not all tracks of the source playlist could be loaded, "
+                "reload the page to try again."
+            )
+    if merged != source["merged"] or not running:
+        track_store.set(
+            uid,
+            "source",
+            dict(source, merged=merged, loading=source["loading"] if running else None),
+        )
+    return progress if running else None
+
+
+def tracks_left_after(position):
+    """Return the number of tracks left after the position, up to the last loaded."""
+    track_index = get_track_index()
+    return len(track_index) - track_index.rank(position + 1)
+
+
+def wait_for_source():
+    """
+    Wait for more tracks of the source, when no tracks are left while it loads.
+
+    Adds the chunks loaded in the background (see merge_loaded) until there
+    are tracks left, or the load is done (or given up, see SOURCE_LOAD_STALE).
+    Returns if there are tracks left.
+    """
+    deadline = time.monotonic() + app.config["SOURCE_LOAD_STALE"]
+    while True:
+        progress = merge_loaded()
+        if len(get_track_index()):
+            return True
+        if progress is None or time.monotonic() > deadline:
+            return False
+        time.sleep(SOURCE_WAIT_INTERVAL)
+
+
+def fetch_new_liked_songs(spotify_client, tracks, track_index):
+    """
+    Return the liked songs added since the tracks were loaded (newest first).
+
+    Liked songs are sorted by added_at, newest first, so fetch pages until the
+    newest loaded song that's still liked (not removed by the user). Return
+    None if that isn't found, or if songs were removed (unliked) elsewhere:
+    then the liked songs have to be loaded again.
+    """
+    if not tracks:
+        return None
+    # (a song we removed isn't liked anymore, skipped items are still there)
+    anchor = next(
+        (
+            track
+            for track in tracks
+            if track.uri
+            and track.added_at
+            and (track.skip or track.position in track_index)
+        ),
+        None,
+    )
+    if anchor is None:
+        return None
+    removed = removed_count(tracks, track_index)
+
+    fetch_page, page_size = source_pages(spotify_client, "liked_songs")
+    new_items = []
+    offset = 0
+    while True:
+        page = fetch_page(limit=page_size, offset=offset)
+        for item in page["items"]:
+            track = item.get("track") or {}
+            if track.get("uri") == anchor.uri and item["added_at"] == anchor.added_at:
+                # no other changes: the new songs and the loaded ones left
+                if page["total"] != len(new_items) + len(tracks) - removed:
+                    return None
+                return new_items
+            new_items.append(item)
+        offset += len(page["items"])
+        # (if a lot was added, loading it all at once is faster)
+        if not page["next"] or offset >= len(tracks) // 2:
+            return None
+
+
+def removed_count(tracks, track_index):
+    """Return the number of tracks moved/removed since the tracks were loaded."""
+    return sum(not track.skip for track in tracks) - len(track_index)
+
+
+def resume_at(track_index, track_counter):
+    """Return the track counter, or the next track left if it's moved/removed."""
+    if track_counter in track_index:
+        return track_counter
+    return track_index.next(track_counter)
+
+
+def fetch_targets(spotify_client, uid, playlist_ids):
+    """
+    Fetch the track ids of the target playlists, to mark the ones with the track.
+
+    Runs in the background (see TargetLoader). Only the playlists that aren't
+    loaded yet, or that are changed by something else than the app since,
+    are fetched: their snapshot_id isn't the one they were loaded at, nor the
+    one after the app's own last change (or the number of items doesn't add
+    up). The snapshot_ids are fetched at the same time; if that fails, the
+    playlist just isn't marked. Returns the snapshot_ids of the playlists
+    that are still current, and per fetched playlist its snapshot_id, total,
+    track ids and what its centroid is computed from (see merge_targets).
+    """
+    membership = track_store.get(uid, "membership") or PlaylistMembership()
+    centroids = track_store.get(uid, "centroids") or PlaylistCentroids()
+    snapshots = {}
+    loaded = {}  # playlist id -> tracks (id and artists)
+
+    playlists = fan_out.run(
+        {
+            playlist_id: partial(
+                spotify_client.playlist, playlist_id, fields="snapshot_id,tracks.total"
+            )
+            for playlist_id in playlist_ids
+        },
+        timeout=app.config["RENDER_LOOKUP_TIMEOUT"],
+    )
+    totals = {}
+    for playlist_id, playlist in playlists.items():
+        snapshot_id = playlist["snapshot_id"]
+        total = playlist["tracks"]["total"]
+        if (
+            membership.total(playlist_id) == total
+            and snapshot_id
+            in (
+                membership.snapshot_id(playlist_id),
+                action_queue.snapshot_id(uid, playlist_id),
+            )
+            and playlist_id in centroids
+        ):
+            snapshots[playlist_id] = snapshot_id
+            continue
+
+        items = paginator.fetch_all(
+            partial(
+                spotify_client.playlist_tracks,
+                playlist_id,
+                fields="items(track(id,artists(id))),total",
+            ),
+            100,
+        )
+        totals[playlist_id] = (snapshot_id, len(items))
+        loaded[playlist_id] = [
+            item["track"]
+            for item in items
+            if item.get("track") and item["track"].get("id")
+        ]
+
+    centroid_data = load_centroids(spotify_client, uid, loaded)
+    return {
+        "snapshots": snapshots,
+        "loaded": {
+            playlist_id: {
+                "snapshot_id": totals[playlist_id][0],
+                "total": totals[playlist_id][1],
+                "track_ids": [track["id"] for track in playlist_tracks],
+                "vectors": centroid_data[playlist_id][0],
+                "genres": centroid_data[playlist_id][1],
+            }
+            for playlist_id, playlist_tracks in loaded.items()
+        },
+    }
+
+
+def merge_targets():
+    """
+    Mark the target playlists loaded in the background (see TargetLoader).
+
+    Only the requests of the user change the membership and centroids (a
+    divide action adds the track to them), so the divide requests set the
+    playlists loaded since the last time first, if the load is done.
+    """
+    uid = session.get("uuid")
+    progress = target_loader.take(uid)
+    if not progress or progress["state"] != "done":
+        return
+    playlist_ids = session.get("target_playlist_ids") or []
+    membership = get_membership()
+    centroids = get_centroids()
+    membership.keep(playlist_ids)
+    centroids.keep(playlist_ids)
+    result = progress["result"]
+    for playlist_id, snapshot_id in result["snapshots"].items():
+        if playlist_id in membership:
+            membership.set_snapshot_id(playlist_id, snapshot_id)
+    for playlist_id, playlist in result["loaded"].items():
+        if playlist_id not in playlist_ids:
+            continue
+        membership.set(
+            playlist_id,
+            playlist["snapshot_id"],
+            playlist["total"],
+            playlist["track_ids"],
+        )
+        centroids.set(playlist_id, playlist["vectors"], playlist["genres"])
+    track_store.set(uid, "membership", membership)
+    track_store.set(uid, "centroids", centroids)
+
+
+def load_centroids(spotify_client, uid, loaded):
+    """
+    Return what the centroids of the (re)loaded target playlists are computed from.
+
+    Per playlist the feature vectors and the genres of all its tracks. The
+    audio features and artist genres are fetched in batches, except the
+    ones known already (of the source tracks, or in the metadata cache). If
+    fetching them fails, the centroids go without them (there are just fewer
+    suggestions, until the targets are loaded again).
+    """
+    tracks = [track for playlist_tracks in loaded.values() for track in playlist_tracks]
+    features = track_store.get(uid, "features", {})
+    track_ids = list(dict.fromkeys(track["id"] for track in tracks))
+    missing = [track_id for track_id in track_ids if track_id not in features]
+    fetched = {}
+    try:
+        for track_ids_chunk in chunks(missing, 100):
+            for track_features in spotify_client.audio_features(track_ids_chunk):
+                if track_features:
+                    fetched[track_features["id"]] = compact_features(track_features)
+    except LOOKUP_ERRORS:
+        pass
+    try:
+        genres = fetch_artist_genres(
+            spotify_client,
+            (artist["id"] for track in tracks for artist in track.get("artists", [])),
+        )
+    except LOOKUP_ERRORS:
+        genres = {}
+
+    return {
+        playlist_id: (
+            [
+                feature_vector(features.get(track["id"]) or fetched.get(track["id"]))
+                for track in playlist_tracks
+            ],
+            [
+                [
+                    genre
+                    for artist in track.get("artists", [])
+                    for genre in genres.get(artist["id"], [])
+                ]
+                for track in playlist_tracks
+            ],
+        )
+        for playlist_id, playlist_tracks in loaded.items()
+    }
+
+
+def prefetch_metadata(spotify_client, tracks):
+    """
+    Fetch the metadata of all tracks in as few (batched) API calls as possible.
+
+    Album labels and artist genres go in the shared metadata cache (so only the
+    ones not cached yet are fetched), the audio features of the tracks go in
+    the 'features' lookup table of the user in the track store (so only the
+    ones of new tracks are fetched), and in the FeatureMatrix of all tracks
+    (to filter and sort them). After this, the divide page can be rendered
+    without any API call. If the calls of one of them fail, the rest of that
+    one is skipped; the page looks them up per track (see get_track_metadata).
+    """
+    uid = session.get("uuid")
+    # (the features of tracks that aren't in the source anymore are dropped)
+    features = track_store.get(uid, "features", {})
+    features = {
+        track.id: features[track.id]
+        for track in tracks
+        if not track.skip and track.id in features
+    }
+    fetched = fetch_metadata(spotify_client, tracks, features)
+    features.update(fetched)
+    track_store.set(uid, "features", features)
+
+    if fetched or track_store.get(uid, "feature_matrix") is None:
+        track_store.set(uid, "feature_matrix", FeatureMatrix(tracks, features))
+
+
+def prefetch_loaded(spotify_client, uid, tracks):
+    """Fetch the metadata of tracks loaded in the background (see SourceLoader)."""
+    return fetch_metadata(spotify_client, tracks, track_store.get(uid, "features", {}))
+
+
+def fetch_metadata(spotify_client, tracks, features):
+    """
+    Fetch the labels and genres of the tracks, return the audio features fetched.
+
+    The labels and genres go in the metadata cache, the audio features are
+    only fetched for the tracks that aren't in features (see prefetch_metadata).
+    """
+    tracks = [track for track in tracks if not track.skip]
+
+    album_ids = list(dict.fromkeys(track.album_id for track in tracks))
+    cached = album_label_cache.get_many(album_ids)
+    album_ids = [album_id for album_id in album_ids if album_id not in cached]
+    try:
+        for album_ids_chunk in chunks(album_ids, 20):
+            albums = spotify_client.albums(album_ids_chunk)["albums"]
+            album_label_cache.set_many(
+                {album["id"]: album["label"] for album in albums if album}
+            )
+    except LOOKUP_ERRORS:
+        pass
+
+    try:
+        fetch_artist_genres(
+            spotify_client,
+            (artist_id for track in tracks for artist_id in track.artist_ids),
+        )
+    except LOOKUP_ERRORS:
+        pass
+
+    track_ids = [
+        track_id
+        for track_id in dict.fromkeys(track.id for track in tracks)
+        if track_id not in features
+    ]
+    fetched = {}
+    try:
+        for track_ids_chunk in chunks(track_ids, 100):
+            for track_features in spotify_client.audio_features(track_ids_chunk):
+                if track_features:
+                    fetched[track_features["id"]] = compact_features(track_features)
+    except LOOKUP_ERRORS:
+        pass
+    return fetched
+
+
+def fetch_artist_genres(spotify_client, artist_ids):
+    """Return the genres of the artists, only fetching the ones that aren't cached."""
+    artist_ids = list(dict.fromkeys(artist_ids))
+    genres = artist_genres_cache.get_many(artist_ids)
+    missing = [artist_id for artist_id in artist_ids if artist_id not in genres]
+    for artist_ids_chunk in chunks(missing, 50):
+        artists = spotify_client.artists(artist_ids_chunk)["artists"]
+        fetched = {artist["id"]: artist["genres"] for artist in artists if artist}
+        artist_genres_cache.set_many(fetched)
+        genres.update(fetched)
+    return genres
+
+
+def compact_features(track_features):
+    """Only keep the audio features that are shown on the divide page."""
+    return {
+        key: track_features[key] for key in ["key", "mode", "tempo", *FEATURE_STRINGS]
+    }
+
+
+def track_genres(track):
+    """Return the genres of the artists of the track (cached ones only)."""
+    genres = artist_genres_cache.get_many(track.artist_ids)
+    return [
+        genre for artist_id in track.artist_ids for genre in genres.get(artist_id, [])
+    ]
+
+
+def get_track_metadata(spotify_client, track):
+    """
+    Return the album label, artist genres and audio features of the track.
+
+    Normally these are all prefetched (see prefetch_metadata). Whatever isn't,
+    is fetched from the API with the calls running at the same time, so the
+    page waits for the slowest call, not for all of them after each other.
+    Calls that fail or don't return within the lookup budget of the request
+    (see lookup_budget) are shown as 'n/a' (empty), instead of failing or
+    holding up the page; the ones that return later are kept for next time
+    (see store_metadata). Also returns if all of it came in time.
+    """
+    uid = session.get("uuid")
+    label = album_label_cache.get(track.album_id)
+    cached_genres = artist_genres_cache.get_many(track.artist_ids)
+    missing_artist_ids = [
+        artist_id for artist_id in track.artist_ids if artist_id not in cached_genres
+    ]
+    features = merge_late_features(uid)
+    track_features = features.get(track.id)
+
+    calls = {}
+    if label is None:
+        calls["album"] = partial(spotify_client.album, track.album_id)
+    if missing_artist_ids:
+        calls["artists"] = partial(spotify_client.artists, missing_artist_ids)
+    if track_features is None:
+        calls["audio_features"] = partial(spotify_client.audio_features, [track.id])
+    results = fan_out.run(
+        calls,
+        timeout=lookup_budget(),
+        on_late=partial(store_metadata, uid, track, late=True),
+    )
+
+    for name, result in results.items():
+        metadata = store_metadata(uid, track, name, result)
+        if name == "album":
+            label = metadata
+        elif name == "artists":
+            cached_genres.update(metadata)
+        else:
+            track_features = metadata
+    genres = [
+        genre
+        for artist_id in track.artist_ids
+        for genre in cached_genres.get(artist_id, [])
+    ]
+
+    # not every track has audio features, show them as empty/'n/a'
+    if track_features is None:
+        track_features = {
+            "key": -1,
+            "mode": -1,
+            **dict.fromkeys(["tempo", *FEATURE_STRINGS], 0),
+        }
+
+    return label or "n/a", genres, track_features, len(results) == len(calls)
+
+
+def lookup_budget():
+    """
+    Return the seconds left to look up metadata in this request (at least 0).
+
+    All lookups of a request (the divide page shows one track, its JSON API
+    a few) share RENDER_LOOKUP_BUDGET seconds, from the first lookup on.
+    """
+    if "lookup_deadline" not in g:
+        g.lookup_deadline = time.perf_counter() + app.config["RENDER_LOOKUP_BUDGET"]
+    return max(g.lookup_deadline - time.perf_counter(), 0)
+
+
+def store_metadata(uid, track, name, result, late=False):
+    """
+    Keep the result of a metadata lookup of the track (see get_track_metadata).
+
+    The label and genres go in the metadata cache, the audio features in the
+    'features' of the user in the track store. Returns the label, the genres
+    (artist id -> genres) or the (compact) audio features, None if it has none.
+    Also called after the request (late), for lookups that came in too late:
+    only the requests change the features, so then the audio features go in
+    the part 'late_features', for the next request to add (merge_late_features).
+    """
+    if name == "album":
+        album_label_cache.set(track.album_id, result["label"])
+        return result["label"]
+
+    if name == "artists":
+        genres = {
+            artist["id"]: artist["genres"] for artist in result["artists"] if artist
+        }
+        artist_genres_cache.set_many(genres)
+        return genres
+
+    track_features = (result or [None])[0]
+    if not track_features:
+        return None
+    track_features = compact_features(track_features)
+    if late:
+        with late_features_lock:
+            late_features = dict(track_store.get(uid, "late_features", {}))
+            late_features[track.id] = track_features
+            track_store.set(uid, "late_features", late_features)
+        return track_features
+    features = track_store.get(uid, "features", {})
+    features[track.id] = track_features
+    track_store.set(uid, "features", features)
+    return track_features
+
+
+def merge_late_features(uid):
+    """Add the audio features that came in after their request, return all features."""
+    features = track_store.get(uid, "features", {})
+    with late_features_lock:
+        late_features = track_store.get(uid, "late_features")
+        if late_features:
+            track_store.delete(uid, "late_features")
+    if late_features:
+        features.update(late_features)
+        track_store.set(uid, "features", features)
+    return features
+
+
+# what compact_playlist reads of a playlist, and of a page of the playlists of
+# the user (see Paginator)
+PLAYLIST = Projection("id,name,images,owner(id),collaborative,snapshot_id")
+PLAYLISTS_PAGE = Projection(f"items({PLAYLIST.fields}),total")
+
+
 def get_all_playlists_of_user(spotify_client):
     """Return all the playlists of the current user (logged in the Spotify Client)."""
-    current_user_playlists = spotify_client.current_user_playlists()
-    playlists = current_user_playlists["items"]
+    # (the endpoint has no fields parameter, the rest is dropped once parsed)
+    return paginator.fetch_all(
+        PLAYLISTS_PAGE.trimmed(spotify_client.current_user_playlists), 50
+    )
+
+
+def compact_playlist(playlist):
+    """Only keep what we use of a (simplified) playlist object."""
+    return {
+        "id": playlist["id"],
+        "name": playlist["name"],
+        # the templates show the smallest image; the last one
+        "images": (playlist.get("images") or [])[-1:],
+        "owner_id": playlist["owner"]["id"],
+        "collaborative": playlist["collaborative"],
+        "snapshot_id": playlist.get("snapshot_id"),
+    }
+
+
+def get_playlist_index(spotify_client, refresh=False):
+    """
+    Return the playlist index of the current user: the user id and all playlists.
+
+    The index is kept in the track store, so step 1, step 2 and divide share
+    it. It's reused for PLAYLIST_INDEX_MAX_AGE seconds (unless refresh), after
+    that the playlists are listed again; playlists with the same snapshot_id
+    keep their indexed entry, only new or changed playlists are replaced.
+    """
+    uid = session.get("uuid")
+    index = track_store.get(uid, "playlists")
+    if (
+        index
+        and not refresh
+        and time.time() - index["fetched_at"] < app.config["PLAYLIST_INDEX_MAX_AGE"]
+    ):
+        return index
+
+    if index:
+        user_id = index["user_id"]
+        indexed = {playlist["id"]: playlist for playlist in index["playlists"]}
+    else:
+        user_id = spotify_client.me()["id"]
+        indexed = {}
+
+    playlists = []
+    for playlist in get_all_playlists_of_user(spotify_client):
+        known = indexed.get(playlist["id"])
+        if known and known["snapshot_id"] == playlist.get("snapshot_id"):
+            playlists.append(known)
+        else:
+            playlists.append(compact_playlist(playlist))
+
+    index = {"fetched_at": time.time(), "user_id": user_id, "playlists": playlists}
+    track_store.set(uid, "playlists", index)
+    return index
 
-    # loop till we get all playlists...
-    while current_user_playlists["next"]:
-        current_user_playlists = spotify_client.next(current_user_playlists)
-        playlists.extend(current_user_playlists["items"])
 
-    return playlists
+def find_playlist(spotify_client, playlist_index, playlist_id):
+    """Return the playlist from the index, or from the API if it's not in there."""
+    for playlist in playlist_index["playlists"]:
+        if playlist["id"] == playlist_id:
+            return playlist
+    # (without fields, the first 100 tracks of the playlist come with it)
+    return compact_playlist(PLAYLIST.request(spotify_client.playlist)(playlist_id))
 
 
-def update_count(btn_clicked):
+def remove_duplicates():
+    """
+    Remove the extra copies of all tracks from the source (keep the first).
+
+    Only copies of the same recording (same track id or ISRC), not similar
+    versions, those are for the user to divide. The removals are queued, so
+    they're sent in batches. Returns the divide page.
+    """
+    if not session.get("move_remove_enabled"):
+        flash("Can't remove tracks, you do not own the source playlist.")
+        return render_divide()
+
+    uid = session.get("uuid")
+    source_playlist = session.get("source_playlist")
+    tracks = get_tracks()
+    track_index = get_track_index()
+    extras = get_duplicates().extra_copies(track_index)
+    for position in extras:
+        if source_playlist == "liked_songs":
+            action_queue.unlike(uid, tracks[position].id)
+        else:
+            action_queue.remove(uid, source_playlist, tracks[position].uri, position)
+        track_index.remove(position)
+    track_store.set(uid, "track_index", track_index)
+
+    flash(f"Removed {len(extras)} extra copies of tracks from the source playlist.")
+    # (the track may have been an extra copy itself)
+    session["track_counter"] = resume_at(track_index, session.get("track_counter"))
+    return render_divide()
+
+
+def divide_track(radio_action, action_playlist_ids, forward):
+    """
+    Divide the current track, and go to the next (or previous) track left.
+
+    radio_action is radio_move, radio_copy, radio_remove or None (no action,
+    only go to the next track). Used by the divide page and its JSON API
+    (see divide_action); tells the user what went wrong with flash. The track
+    counter is -1 if there are no tracks left.
+    """
+    if radio_action is None:
+        session["track_counter"] = update_count(forward)
+        return
+
+    # on empty playlist and 'move' return alert (please use delete), do not change
+    # song number
+    if not action_playlist_ids and radio_action == "radio_move":
+        flash(
+            "No action taken as you've selected 'Move', but without a "
+            "target playlist."
+        )
+        session["track_counter"] = update_count(forward)
+        return
+
+    # on empty playlist and 'copy' return alert (no playlist selected). do change
+    # song number
+    if not action_playlist_ids and radio_action == "radio_copy":
+        flash(
+            "No action taken as you've selected 'Copy', but without a "
+            "target playlist."
+        )
+        session["track_counter"] = update_count(forward)
+        return
+        # we're not removing songs, so always one (this) song remains,
+        # so no need to check for -1
+
+    # If we do have a target playlist selected, and we're on the remove, that's
+    # probably a mistake to, as nothing will be done with the target playlist
+    # let's warn the user and do nothing
+    if action_playlist_ids and radio_action == "radio_remove":
+        flash(
+            "No action taken as you've selected 'Remove', but you also have a "
+            "target playlist selected. Deselect all playlist to remove, or "
+            "select the 'Copy' or 'Move' action."
+        )
+        return
+
+    track_data = get_tracks()[session.get("track_counter")]
+
+    # add song to target playlists (move and copy); queued, and sent in
+    # batches in the background (see action_queue.py). Not to the
+    # playlists that have the song already, no duplicates.
+    uid = session.get("uuid")
+    if radio_action == "radio_move" or radio_action == "radio_copy":
+        membership = get_membership()
+        # (the centroids of the playlists now have the track too)
+        centroids = get_centroids()
+        vector = feature_vector(track_store.get(uid, "features", {}).get(track_data.id))
+        genres = track_genres(track_data)
+        for action_playlist in action_playlist_ids:
+            if membership.contains(action_playlist, track_data.id):
+                continue
+            action_queue.add(uid, action_playlist, track_data.uri)
+            membership.add(action_playlist, track_data.id)
+            centroids.add(action_playlist, vector, genres)
+        track_store.set(uid, "membership", membership)
+        track_store.set(uid, "centroids", centroids)
+        # for move, the update count is updated in the next loop
+        if radio_action == "radio_copy":
+            session["track_counter"] = update_count(forward)
+            # we're not removing songs, so always one (this) song remains,
+            # so no need to check for -1
+
+    # delete song from source playlist + delete from sessiontracks (move and delete)
+    if radio_action == "radio_move" or radio_action == "radio_remove":
+        # delete from playlist...
+        # ...case liked songs
+        if session.get("source_playlist") == "liked_songs":
+            action_queue.unlike(uid, track_data.id)
+        # ...case playlist
+        else:
+            # TODO: double check if user is owner? Tho 'Copy' should be
+            # only option in that case, and this will just return an error
+            # so not destructive..
+            # (the position in the playlist when it was loaded, the queue
+            # takes care of earlier removals)
+            action_queue.remove(
+                uid,
+                session.get("source_playlist"),
+                track_data.uri,
+                track_data.position,
+            )
+        # delete from the tracks left (move and delete); the track list
+        # itself stays as loaded, only the (small) index is rewritten
+        track_index = get_track_index()
+        track_index.remove(session.get("track_counter"))
+        track_store.set(session.get("uuid"), "track_index", track_index)
+        # go to the next (or previous) track left, -1 if there are none
+        session["track_counter"] = update_count(forward)
+
+        if session.get("track_counter") == -1:
+            flash(
+                "No (more) tracks in source playlist, "
+                "select another source playlist."
+            )
+
+
+def update_count(forward):
     """
     Update the track counter; at which track are we in the track list.
 
-    Returns the updated counter; the integer where we are.
+    Returns the updated counter; the position (in the loaded track list) of
+    the next or previous track left, skipping non-track items and removed
+    tracks, or -1 if there are no tracks left (and none are loading, see
+    wait_for_source).
     """
-    number_of_tracks = len(session.get("tracks"))
+    track_index = get_track_index()
     track_counter = session.get("track_counter")
-    tracks = session.get("tracks")
 
-    # iter counter to break infinite loop (e.g. only non-track tracks (all skip))
-    iter_count = 0
+    # only through the tracks that match the filter, in its order
+    if session.get("divide_filter"):
+        order = filter_order()
+        if order is not None:
+            position = next_position(track_counter, forward, track_index, order)
+            if position != -1:
+                return position
+        session["divide_filter"] = None
+        if len(track_index):
+            flash("No (more) tracks match the filter, showing all tracks.")
 
-    # do while emulation, for skipping non-track songs
-    condition = True
-    while condition:
-        if btn_clicked == "btn_next" or btn_clicked == "btn_next_no_action":
-            if track_counter + 1 >= number_of_tracks:
-                track_counter = 0
-            else:
-                track_counter += 1
-        elif btn_clicked == "btn_prev" or btn_clicked == "btn_prev_no_action":
-            if track_counter - 1 < 0:
-                track_counter = number_of_tracks - 1
-            else:
-                track_counter -= 1
-        # infinite loop if we delete all non-skip tracks
-        # use counter and number of tracks
-        iter_count += 1
-        if iter_count >= number_of_tracks:
-            track_counter = -1
-            break
-        else:
-            # update condition for while loop, to do the next iteration, until
-            # we find a song that has skip = false
-            condition = tracks[track_counter]["skip"]
+    position = next_position(track_counter, forward, track_index)
+    # (the first tracks are all divided, but the rest of the source is loading)
+    if position == -1 and wait_for_source():
+        return update_count(forward)
+    return position
 
-    return track_counter
 
+def filter_order():
+    """Return the positions that match the filter in its order, None if no filter."""
+    if not session.get("divide_filter"):
+        return None
+    return track_store.get(session.get("uuid"), "filter_order")
 
-def render_divide():
-    """Render the divide page. Gets info from session. Return html code."""
-    # Get the track information from the current track
-    track = session.get("tracks")[session.get("track_counter")]["track"]
-    # date_added = session.get(
-    #   "tracks")[session.get("track_counter")]["added_at"]
-    # added_by = date_added = session.get(
-    #   "tracks")[session.get("track_counter")]["added_by"]
 
-    # specifically to retreive label info...
-    spotify_client = get_spotify()
-    albuminfo = spotify_client.album(track["album"]["id"])
+def next_position(track_counter, forward, track_index, order=None):
+    """
+    Return the next (or previous) position left, -1 if there are none.
+
+    Through the positions in order (see filter_order) if given, otherwise
+    through all tracks left. Unlike update_count, the session isn't changed.
+    """
+    if order is not None:
+        return step_in_order(order, track_index.flags(), track_counter, forward)
+    if forward:
+        return track_index.next(track_counter)
+    return track_index.previous(track_counter)
+
+
+# how the divide page can sort the tracks (see FeatureMatrix)
+SORT_OPTIONS = {
+    "": "Playlist order",
+    "tempo": "BPM",
+    "energy": "Energy",
+    "danceability": "Danceability",
+    "valence": "Valence",
+    "popularity": "Popularity",
+}
+
+
+def parse_filter(form):
+    """
+    Return the filter of the divide page form (see FeatureMatrix.select).
+
+    An empty field doesn't filter; the Camelot key 'this' is the key of the
+    current track. Raises ValueError for a value that isn't a number, etc.
+    """
+
+    def number(name, what):
+        value = form.get(name, "").strip()
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"the {what} isn't a number.") from None
+
+    camelot = form.get("filter_camelot") or None
+    if camelot == "this":
+        track = get_tracks()[session.get("track_counter")]
+        track_features = track_store.get(session.get("uuid"), "features", {}).get(
+            track.id
+        )
+        if not track_features or track_features["key"] == -1:
+            raise ValueError("the key of this track isn't known.")
+        camelot = get_key(track_features["key"], track_features["mode"])
+    elif camelot and camelot not in CAMELOT_KEYS:
+        raise ValueError(f"unknown Camelot key '{camelot}'.")
+
+    energy_min = number("filter_energy_min", "minimum energy")
+    sort = form.get("filter_sort") or None
+    if sort and sort not in COLUMNS:
+        raise ValueError(f"can't sort by '{sort}'.")
+    return {
+        "bpm_min": number("filter_bpm_min", "minimum BPM"),
+        "bpm_max": number("filter_bpm_max", "maximum BPM"),
+        "camelot": camelot,
+        # (the page shows energy from 0 to 100)
+        "energy_min": energy_min / 100 if energy_min is not None else None,
+        "sort": sort,
+        "descending": bool(form.get("filter_descending")),
+    }
+
+
+def apply_filter():
+    """
+    Store the order of the tracks that match the filter, and go to the first.
+
+    Returns False (and removes the filter) if no track that's left matches.
+    """
+    uid = session.get("uuid")
+    matrix = track_store.get(uid, "feature_matrix")
+    track_index = get_track_index()
+    order = matrix.select(**session["divide_filter"]) if matrix else None
+    if order is None or step_in_order(order, track_index.flags(), -1) == -1:
+        session["divide_filter"] = None
+        return False
+
+    track_store.set(uid, "filter_order", order)
+    # stay at the track if it matches, else the first track that does
+    track_counter = session.get("track_counter")
+    if track_counter not in order or track_counter not in track_index:
+        session["track_counter"] = step_in_order(order, track_index.flags(), -1)
+    return True
 
-    genres = []
-    for artist in track["artists"]:
-        genres.extend(spotify_client.artist(artist["id"])["genres"])
+
+def user_checked(action_playlist_ids, suggested_playlist_ids):
+    """
+    Return the playlists the user checked on the divide page.
+
+    Of the checked playlists, leave out the ones that were only checked as
+    suggested (suggested_playlist_ids, separated by commas, or a list), so
+    they aren't checked for the next track.
+    """
+    if isinstance(suggested_playlist_ids, str):
+        suggested_playlist_ids = suggested_playlist_ids.split(",")
+    suggested_playlist_ids = set(suggested_playlist_ids or [])
+    return [
+        playlist_id
+        for playlist_id in action_playlist_ids
+        if playlist_id not in suggested_playlist_ids
+    ]
+
+
+def render_divide():
+    """Render the divide page. Gets info from session. Return html code."""
+    prefetch_analysis(session.get("track_counter"))
+    view = track_view(get_spotify(), session.get("track_counter"))
 
     # set up page as it was (initialize, action, select all, action lists)
     # the action button and select_all check box are in the session already
-
-    for playlist in session.get("target_playlists"):
-        if playlist["id"] in session.get("action_playlist_ids"):
-            playlist["checked"] = True
-        else:
-            playlist["checked"] = False
+    # (copies of the playlists, the ones in the session are only saved when
+    # they are replaced, see session_backend.py)
+    # (and mark the playlists that have the track already). The playlists
+    # that fit the track best are suggested, and checked too if the user wants
+    # (the ones the user checked stay checked).
+    has_track, suggested = view.pop("has_track"), view.pop("suggested")
+    suggest = session.get("suggest")
+    checked = session.get("action_playlist_ids") or []
+    suggested_checked = [
+        playlist_id
+        for playlist_id in suggested
+        if suggest and playlist_id not in checked
+    ]
+    act_playlists = [
+        dict(
+            playlist,
+            checked=playlist["id"] in checked or playlist["id"] in suggested_checked,
+            has_track=playlist["id"] in has_track,
+            suggested=playlist["id"] in suggested,
+            suggested_check=playlist["id"] in suggested_checked,
+        )
+        for playlist in session.get("target_playlists")
+    ]
 
     # TODO: uri/link for track, album and artist (once hoveredd over)?
     #   needs seperate artists.. but can be achieved with jinja for loop
     # TODO: add hover over info on how to enable autoplay
     # TODO: add hover over info on valence etc.
-    # TODO: Added to playlist info?...
-
-    track_features = spotify_client.audio_features(track["id"])
-    key = track_features[0]["key"]
-    mode = track_features[0]["mode"]
-
-    # tic = time.perf_counter()
-    # track_analysis = spotify_client.audio_analysis(track["id"])
-    # toc = time.perf_counter()
-    # print(toc - tic)
-    # print(
-    #     "key: "
-    #     + str(key)
-    #     + " (conf: "
-    #     + str(track_analysis["track"]["key_confidence"])
-    #     + "), mode: "
-    #     + str(mode)
-    #     + " (conf: "
-    #     + str(track_analysis["track"]["mode_confidence"])
-    #     + ")"
-    # )
-
-    feature_strings = [
-        "energy",
-        "danceability",
-        "valence",
-        "speechiness",
-        "acousticness",
-        "instrumentalness",
-        "liveness",
-    ]
 
-    bar_colors = [
-        "#4000F5",
-        "#CDF563",
-        "#CB1381",
-        "#9CF0E1",
-        "#EF891C",
-        "#EC5541",
-        "#CC200E",
-        "#721107",
+    # uri = "https://embed.spotify.com/?uri=" + track["uri"]
+    return render_template(
+        "divide.html",
+        act_playlists=act_playlists,
+        track_counter=session.get("track_counter"),
+        move_remove_enabled=session.get("move_remove_enabled"),
+        radio_action=session.get("radio_action"),
+        select_all=session.get("select_all"),
+        suggest=suggest,
+        suggested_playlist_ids=",".join(suggested_checked),
+        divide_filter=session.get("divide_filter") or {},
+        loading=loading_view(),
+        camelot_keys=CAMELOT_KEYS,
+        sort_options=SORT_OPTIONS,
+        **view,
+    )
+
+
+# the colors of the feature bars on the divide page (popularity first)
+BAR_COLORS = [
+    "#4000F5",
+    "#CDF563",
+    "#CB1381",
+    "#9CF0E1",
+    "#EF891C",
+    "#EC5541",
+    "#CC200E",
+    "#721107",
+]
+
+
+def track_view(spotify_client, position):
+    """
+    Return what the divide page shows of the track at the (loaded) position.
+
+    Used for the page itself (see render_divide) and for the JSON API of the
+    page (see divide_tracks), so both show the same. has_track are the ids of
+    the target playlists with the track, suggested the ones that fit it best;
+    complete is False if some metadata didn't come in time, or the targets
+    are still loading (see TargetLoader), so ask again later.
+    """
+    # Get the track information from the track
+    track = get_tracks()[position]
+
+    # specifically to retreive label info...
+    label, genres, track_features, complete = get_track_metadata(spotify_client, track)
+    complete = complete and not target_loader.running(session.get("uuid"))
+
+    # the copies (and similar versions) of the track that are left
+    duplicates = get_duplicates().similar(position, get_track_index())
+
+    membership = get_membership()
+    has_track = [
+        playlist["id"]
+        for playlist in session.get("target_playlists")
+        if membership.contains(playlist["id"], track.id)
     ]
+    suggested = get_centroids().suggest(
+        feature_vector(track_features), genres, exclude=has_track
+    )
+
+    key = track_features["key"]
+    mode = track_features["mode"]
+
+    # the audio analysis is too slow to wait for, so it's only shown once
+    # it's fetched in the background (see prefetch_analysis)
+    analysis = analysis_prefetcher.get(track.id)
 
     feature_list = []
     popularity_data = {
         "name": "Popularity",
-        "value": track["popularity"],
-        "color": bar_colors[0],
+        "value": track.popularity,
+        "color": BAR_COLORS[0],
     }
     feature_list.append(popularity_data)
 
-    for i, feature in enumerate(feature_strings, start=1):
+    for i, feature in enumerate(FEATURE_STRINGS, start=1):
         data = {
             "name": feature.title()[:12],
-            "value": round(float(track_features[0][feature]) * 100),
-            "color": bar_colors[i],
+            "value": round(float(track_features[feature]) * 100),
+            "color": BAR_COLORS[i],
         }
         feature_list.append(data)
 
-    # uri = "https://embed.spotify.com/?uri=" + track["uri"]
-    return render_template(
-        "divide.html",
-        act_playlists=session.get("target_playlists"),
-        title=track["name"],
-        album=track["album"]["name"],
-        album_type=track["album"]["album_type"],
-        track_type=track["type"],
-        image_url=track["album"]["images"][0]["url"],
-        artist_str=", ".join([artist["name"] for artist in track["artists"]]),
-        # preview_url=track["preview_url"],
-        uri=track["uri"],
-        label=albuminfo["label"],
-        release_date=track["album"]["release_date"],
-        duration_str=time_string(int(track["duration_ms"])),
+    return dict(
+        title=track.name,
+        album=track.album_name,
+        album_type=track.album_type,
+        track_type=track.type,
+        image_url=track.image_url,
+        artist_str=", ".join(track.artist_names),
+        uri=track.uri,
+        label=label,
+        release_date=track.release_date,
+        duration_str=time_string(int(track.duration_ms)),
         genres_str=", ".join(genres),
-        bpm=track_features[0]["tempo"],
+        bpm=track_features["tempo"],
         key_tone=get_key(key, mode, key_type="tonal"),
         key_cam=get_key(key, mode, key_type="camelot"),
+        analysis_str=analysis_string(analysis),
         feature_list=feature_list,
-        move_remove_enabled=session.get("move_remove_enabled"),
-        radio_action=session.get("radio_action"),
-        select_all=session.get("select_all"),
+        duplicate_count=len(duplicates),
+        duplicate_number=duplicates.index(position) + 1 if duplicates else 0,
+        has_track=has_track,
+        suggested=suggested,
+        complete=complete,
+    )
+
+
+def prefetch_analysis(track_counter):
+    """
+    Fetch the audio analysis of the track and the ones after it in the background.
+
+    The next AUDIO_ANALYSIS_AHEAD tracks, the way the buttons go (see
+    next_position); further ahead than the divide page fetches the tracks
+    (see tracks_ahead), so they're shown with their analysis.
+    """
+    if track_counter is None or track_counter < 0:
+        return
+    tracks = get_tracks()
+    track_index = get_track_index()
+    order = filter_order()
+
+    positions = [track_counter]
+    position = track_counter
+    while len(positions) <= app.config["AUDIO_ANALYSIS_AHEAD"]:
+        position = next_position(position, True, track_index, order)
+        if position in (-1, track_counter) or position in positions:
+            break
+        positions.append(position)
+    analysis_prefetcher.prefetch(
+        session.get("uuid"),
+        [tracks[position].id for position in positions if position < len(tracks)],
+    )
+
+
+def analysis_string(analysis):
+    """
+    Transform the (compact) audio analysis into text for the divide page.
+
+    How sure the analysis is of the key and mode, and the Camelot keys of the
+    sections (when the key changes); empty if there is no analysis (yet).
+    """
+    if not analysis:
+        return ""
+    section_keys = []
+    for _, _, key, mode, _ in analysis["sections"]:
+        section_key = get_key(int(key), int(mode), key_type="camelot")
+        if not section_keys or section_keys[-1] != section_key:
+            section_keys.append(section_key)
+    return "Key confidence: %d%% (mode %d%%), %d sections: %s" % (
+        round(analysis["key_confidence"] * 100),
+        round(analysis["mode_confidence"] * 100),
+        len(analysis["sections"]),
+        " > ".join(section_keys),
     )
 
 
@@ -747,6 +2307,9 @@ def time_string(dur):
         return "%2d hr %2d min" % (hours, minutes)
 
 
+CAMELOT_KEYS = [f"{number}{letter}" for number in range(1, 13) for letter in "AB"]
+
+
 def get_key(key, mode, key_type="camelot"):
     """
     Transform the spotify key into something understandable key_type options.
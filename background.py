@@ -0,0 +1,111 @@
+"""Run the Spotify calls of the users in the background (and keep their progress)."""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from rate_limit import BACKGROUND
+
+
+class BackgroundWorker:
+    """
+    A pool of threads that call the Spotify API for the users, in the background.
+
+    get_client(uid) must return the Spotify client of the user, or None if the
+    user isn't logged in. With a scheduler, the calls of the threads are
+    background calls (interactive calls go first, see background_priority).
+    """
+
+    def __init__(self, get_client, max_workers=2, scheduler=None, name="background"):
+        self.get_client = get_client
+        self.scheduler = scheduler
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+
+    def background_priority(self):
+        """Return a context manager that makes the calls in it background calls."""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.priority(BACKGROUND)
+
+
+class BackgroundJobs(BackgroundWorker):
+    """
+    Run one job per user in the background, and keep its progress.
+
+    The progress is a dict with the id of the job, its state (running, done
+    or failed) and the fields of the job (e.g. its error, see _fail), stored
+    in the part of the track store (so every worker can see it). A new job of
+    the user replaces the last one: the progress of a job that is replaced
+    (or forgotten) isn't saved anymore. A job is the method _job(uid, progress,
+    spotify_client, *args); it always ends with a state (see _run).
+    """
+
+    part = None  # the part of the track store with the progress
+
+    def __init__(
+        self, get_client, track_store, max_workers=2, scheduler=None, name=None
+    ):
+        super().__init__(
+            get_client,
+            max_workers=max_workers,
+            scheduler=scheduler,
+            name=name or self.part,
+        )
+        self.track_store = track_store
+
+    def progress(self, uid):
+        """Return the progress of the last job of the user, or None."""
+        return self.track_store.get(uid, self.part)
+
+    def running(self, uid):
+        """Return if a job of the user is running."""
+        progress = self.progress(uid)
+        return bool(progress) and progress["state"] == "running"
+
+    def _start(self, uid, *args, **fields):
+        """Start a job (with the fields in its progress), return the progress."""
+        progress = {
+            "id": str(uuid.uuid4()),
+            "state": "running",
+            **fields,
+            "updated_at": time.time(),
+        }
+        self._save(uid, progress, new=True)
+        self._executor.submit(self._run, uid, progress, *args)
+        return progress
+
+    def _save(self, uid, progress, new=False):
+        """Store the progress, unless the job is replaced (or forgotten) since."""
+        with self._lock:
+            current = self.progress(uid)
+            if not new and (not current or current["id"] != progress["id"]):
+                return
+            progress["updated_at"] = time.time()
+            self.track_store.set(uid, self.part, dict(progress))
+
+    def _fail(self, progress, message):
+        """Keep the error of the job."""
+        progress["error"] = message
+
+    def _run(self, uid, progress, *args):
+        with self.background_priority():
+            spotify_client = self.get_client(uid)
+            if spotify_client is None:
+                self._fail(progress, "Not logged in to Spotify anymore.")
+                progress["state"] = "failed"
+            else:
+                try:
+                    self._job(uid, progress, spotify_client, *args)
+                    progress["state"] = "done"
+                except Exception as e:  # a job must always end with a state
+                    self._fail(progress, str(e))
+                    progress["state"] = "failed"
+        self._save(uid, progress)
+
+    def _job(self, uid, progress, spotify_client, *args):
+        raise NotImplementedError
@@ -0,0 +1 @@
+"""Benchmarks for Divide for Spotify, run them as: python -m benchmarks.<name>."""
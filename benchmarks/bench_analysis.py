@@ -0,0 +1,107 @@
+"""
+Benchmark showing the audio analysis of the tracks on the divide page.
+
+Against the local mock API, where the audio analysis endpoint takes --slow
+seconds longer (a real analysis is often over a megabyte). Loads the divide
+page and clicks through it (next, no action, a click every --pause seconds)
+as a new user with another source playlist per setting: fetching the
+analysis of every track shown while the page waits (like the code that was
+commented out in track_view), and in the background for the tracks ahead
+(see AnalysisPrefetcher). Reports the p50/p95 time per click and how many
+of the tracks were shown with their analysis.
+
+Run: python -m benchmarks.bench_analysis [--slow 0.5] [--clicks 40] [--pause 0.5]
+"""
+
+import argparse
+import math
+import statistics
+import time
+
+from analysis_prefetcher import compact_analysis
+from benchmarks.bench_routes import Recorder, import_app, log_in
+from benchmarks.mock_api import MockLibrary, start_mock_api
+
+# (sources of other tracks, so the analyses cached before don't help)
+SOURCES = (2, 3)
+TARGET = 6
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tracks", type=int, default=100, help="per playlist")
+    parser.add_argument("--clicks", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=20, help="ms per API call")
+    parser.add_argument(
+        "--slow", type=float, default=0.5, help="seconds the analysis takes longer"
+    )
+    parser.add_argument("--pause", type=float, default=0.5, help="between clicks")
+    return parser.parse_args()
+
+
+def click_through(app_module, server, source, clicks, pause):
+    """Click through the divide page as a new user, return the clicks' seconds."""
+    library = server.library
+    recorder = Recorder(app_module, server)
+    log_in(recorder, app_module)
+    recorder.request(
+        "POST", "/select_source", data={"playlist_btn": library.playlist_id(source)}
+    )
+    recorder.request(
+        "POST",
+        "/select_target",
+        data={"target_playlist_ids": [library.playlist_id(TARGET)]},
+    )
+    recorder.request("GET", "/divide")
+    results = []
+    for _ in range(clicks):
+        time.sleep(pause)
+        tic = time.perf_counter()
+        response = recorder.request(
+            "POST",
+            "/divide",
+            data={"btn_clicked": "btn_next_no_action", "radio_action": "radio_copy"},
+        )
+        results.append((time.perf_counter() - tic, b"Key confidence" in response.data))
+    return results
+
+
+def main():
+    arguments = parse_arguments()
+    server = start_mock_api(
+        latency=arguments.latency / 1000,
+        library=MockLibrary(playlist_tracks=arguments.tracks),
+        faults={"audio_analysis": (arguments.slow, None)},
+    )
+    app_module = import_app(server)
+    prefetcher = app_module.analysis_prefetcher
+    get, prefetch = prefetcher.get, prefetcher.prefetch
+
+    def get_inline(track_id):
+        return compact_analysis(app_module.get_spotify().audio_analysis(track_id))
+
+    print(
+        f"{arguments.clicks} clicks (every {arguments.pause} s), the analysis "
+        f"takes {arguments.slow} s longer"
+    )
+    print(f"  {'':<28}{'per click: p50 ms':>19}{'p95 ms':>9}{'shown':>8}")
+    for source, (name, inline) in zip(
+        SOURCES, [("before (while waiting)", True), ("in the background", False)]
+    ):
+        prefetcher.get = get_inline if inline else get
+        prefetcher.prefetch = (lambda uid, track_ids: None) if inline else prefetch
+        results = click_through(
+            app_module, server, source, arguments.clicks, arguments.pause
+        )
+        times = sorted(seconds for seconds, _ in results)
+        shown = sum(shown for _, shown in results)
+        print(
+            f"  {name:<28}{1000 * statistics.median(times):>19.0f}"
+            f"{1000 * times[math.ceil(0.95 * len(times)) - 1]:>9.0f}"
+            f"{f'{shown}/{len(results)}':>8}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark the divide page while the metadata endpoints fail or are slow.
+
+Against the local mock API with faults (see mock_api.py): the album and
+audio features endpoints answer 503 (or take --slow seconds longer), so
+prefetching them fails (or takes long) and the tracks shown look them up
+again. Loads the divide page and clicks through it (next, no action) as a
+new user with another source playlist per setting: as before (waiting up
+to 5 seconds per track, no circuit breakers), with the lookup budget
+(RENDER_LOOKUP_BUDGET), and with the budget and the circuit breakers.
+Reports the time to load the page, and the p50/p95 time and the API calls
+per click.
+
+Run: python -m benchmarks.bench_degraded [--slow 4] [--clicks 30]
+"""
+
+import argparse
+import math
+import statistics
+import time
+
+from benchmarks.bench_routes import Recorder, import_app, log_in
+from benchmarks.mock_api import MockLibrary, start_mock_api
+from circuit_breaker import CircuitBreakers
+
+FAULTY = ("album", "albums", "audio_features", "audio_features_one")
+# (sources of other tracks, so the metadata cached before doesn't help)
+SOURCES = (2, 3, 5)
+TARGET = 6
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tracks", type=int, default=100, help="per playlist")
+    parser.add_argument("--clicks", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=20, help="ms per API call")
+    parser.add_argument(
+        "--slow", type=float, help="seconds the endpoints take longer (no 503s)"
+    )
+    return parser.parse_args()
+
+
+def click_through(app_module, server, source, clicks):
+    """Load the divide page as a new user, return its seconds and the clicks'."""
+    library = server.library
+    recorder = Recorder(app_module, server)
+    log_in(recorder, app_module)
+    recorder.request(
+        "POST", "/select_source", data={"playlist_btn": library.playlist_id(source)}
+    )
+    recorder.request(
+        "POST",
+        "/select_target",
+        data={"target_playlist_ids": [library.playlist_id(TARGET)]},
+    )
+    tic = time.perf_counter()
+    recorder.request("GET", "/divide")
+    load = time.perf_counter() - tic
+    results = []
+    for _ in range(clicks):
+        calls = server.calls
+        tic = time.perf_counter()
+        recorder.request(
+            "POST",
+            "/divide",
+            data={"btn_clicked": "btn_next_no_action", "radio_action": "radio_copy"},
+        )
+        results.append((time.perf_counter() - tic, server.calls - calls))
+    return load, results
+
+
+def main():
+    arguments = parse_arguments()
+    fault = (arguments.slow, None) if arguments.slow else (0, 503)
+    server = start_mock_api(
+        latency=arguments.latency / 1000,
+        library=MockLibrary(playlist_tracks=arguments.tracks),
+        faults=dict.fromkeys(FAULTY, fault),
+    )
+    app_module = import_app(server)
+    config = app_module.app.config
+    budget = config["RENDER_LOOKUP_BUDGET"]
+
+    print(
+        f"{arguments.tracks} tracks, {arguments.clicks} clicks, album "
+        "and audio features "
+        + (f"{arguments.slow:.0f} s slower" if arguments.slow else "answer 503")
+    )
+    print(f"  {'':<28}{'load s':>8}{'per click: p50 ms':>19}{'p95 ms':>9}{'calls':>7}")
+    for source, (name, config["RENDER_LOOKUP_BUDGET"], breakers) in zip(
+        SOURCES,
+        [
+            ("before (5 s, no breakers)", 5, False),
+            (f"budget ({budget} s)", budget, False),
+            ("budget + circuit breakers", budget, True),
+        ],
+    ):
+        # (the clients of new users get the breakers of the registry)
+        app_module.spotify_clients.breakers = (
+            CircuitBreakers(
+                failures=config["SPOTIFY_BREAKER_FAILURES"],
+                cool_down=config["SPOTIFY_BREAKER_COOL_DOWN"],
+                slow=config["SPOTIFY_BREAKER_SLOW_CALL"],
+                endpoints=config["SPOTIFY_BREAKER_ENDPOINTS"],
+            )
+            if breakers
+            else None
+        )
+        load, results = click_through(app_module, server, source, arguments.clicks)
+        times = sorted(seconds for seconds, _ in results)
+        print(
+            f"  {name:<28}{load:>8.1f}{1000 * statistics.median(times):>19.0f}"
+            f"{1000 * times[math.ceil(0.95 * len(times)) - 1]:>9.0f}"
+            f"{statistics.mean(calls for _, calls in results):>7.1f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark a click on the divide page: the form (a whole page) or the JSON API.
+
+Against the local mock API, loads the divide page and clicks through it the
+same way (moves, copies and skips, see bench_routes.CLICKS), first with the
+form (POST /divide, which renders the page again), then as the page does
+with the JSON API: POST /divide/action, which returns the track that isn't
+fetched ahead yet (see divide.html). Reports per click the p50/p95 time on
+the server and the response bytes. (With the API the page doesn't wait for
+it: it shows the next track right away, from the tracks fetched ahead.)
+
+Run: python -m benchmarks.bench_divide_api [--liked-songs 20000] [--clicks 200]
+"""
+
+import argparse
+import math
+import statistics
+import time
+
+from benchmarks.bench_routes import CLICKS, Recorder, import_app, log_in
+from benchmarks.mock_api import MockLibrary, start_mock_api
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--playlists", type=int, default=200)
+    parser.add_argument("--liked-songs", type=int, default=20000)
+    parser.add_argument("--targets", type=int, default=10)
+    parser.add_argument("--clicks", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=20, help="ms per API call")
+    return parser.parse_args()
+
+
+def form_clicks(recorder, targets, clicks):
+    """Click through the divide page with the form, return (seconds, bytes)."""
+    results = []
+    for click in range(clicks):
+        button, action, checked = CLICKS[click % len(CLICKS)]
+        tic = time.perf_counter()
+        response = recorder.request(
+            "POST",
+            "/divide",
+            name="POST /divide",
+            data={
+                "btn_clicked": button,
+                "radio_action": action,
+                "action_playlist_ids": targets[click % len(targets) :][:checked],
+            },
+        )
+        results.append((time.perf_counter() - tic, len(response.data)))
+    return results
+
+
+def api_clicks(recorder, targets, clicks):
+    """Click through the divide page with the JSON API, like divide.html does."""
+    response = recorder.request("GET", "/divide/tracks")
+    state = response.get_json()
+    have = {int(position) for position in state["tracks"]}
+    results = []
+    for click in range(clicks):
+        button, action, checked = CLICKS[click % len(CLICKS)]
+        if not button.endswith("_no_action"):
+            # (the page fetches the track again, its playlists changed)
+            have.discard(state["track_counter"])
+        tic = time.perf_counter()
+        response = recorder.request(
+            "POST",
+            "/divide/action",
+            json={
+                "btn_clicked": button,
+                "radio_action": action,
+                "action_playlist_ids": targets[click % len(targets) :][:checked],
+                "track_counter": state["track_counter"],
+                "have": sorted(have),
+            },
+        )
+        results.append((time.perf_counter() - tic, len(response.data)))
+
+        state = response.get_json()
+        have = (have | {int(position) for position in state["tracks"]}) & {
+            state["track_counter"],
+            state["previous"],
+            *state["upcoming"],
+        }
+    return results
+
+
+def report(name, results):
+    times = sorted(seconds for seconds, _ in results)
+    print(
+        f"  {name:<22}{1000 * statistics.median(times):>9.1f}"
+        f"{1000 * times[math.ceil(0.95 * len(times)) - 1]:>9.1f}"
+        f"{statistics.mean(size for _, size in results):>12.0f}"
+    )
+
+
+def main():
+    arguments = parse_arguments()
+    library = MockLibrary(
+        playlists=arguments.playlists, liked_songs=arguments.liked_songs
+    )
+    server = start_mock_api(latency=arguments.latency / 1000, library=library)
+    app_module = import_app(server)
+    targets = [
+        library.playlist_id(number)
+        for number in range(library.playlists)
+        if number % 4 and number % 10 != 1
+    ][: arguments.targets]
+
+    recorder = Recorder(app_module, server)
+    log_in(recorder, app_module)
+    recorder.request("POST", "/select_source", data={"playlist_btn": "liked_songs"})
+    recorder.request("POST", "/select_target", data={"target_playlist_ids": targets})
+    recorder.request("GET", "/divide")
+    form = form_clicks(recorder, targets, arguments.clicks)
+    api = api_clicks(recorder, targets, arguments.clicks)
+
+    print(
+        f"{arguments.liked_songs} liked songs, {len(targets)} targets, "
+        f"{arguments.clicks} clicks, {arguments.latency:.0f} ms per API call"
+    )
+    print(f"  {'per click':<22}{'p50 ms':>9}{'p95 ms':>9}{'response B':>12}")
+    report("form (whole page)", form)
+    report("JSON API", api)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark building the DuplicateIndex of a large source playlist.
+
+The index is built once when the source is loaded: one pass over the tracks
+for the copies (same id or ISRC) and one for similar versions (title, artist
+and duration), so the time per track should stay the same for more tracks.
+Reports the build time and the memory of the index (pickled, as stored).
+
+Run: python -m benchmarks.bench_duplicates [number_of_tracks ...]
+"""
+
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic import fake_playlist_item
+from duplicate_index import DuplicateIndex
+from track_store import Track
+
+
+def make_tracks(number_of_tracks):
+    """Return tracks with 1 in 20 a copy, and 1 in 20 a remaster of another track."""
+    items = []
+    for position in range(number_of_tracks):
+        item = fake_playlist_item(position)
+        if position and random.random() < 0.05:
+            item = fake_playlist_item(random.randrange(position))
+        elif position and random.random() < 0.05:
+            original = fake_playlist_item(random.randrange(position))["track"]
+            item["track"].update(
+                name=f"{original['name']} - Remastered 2011",
+                artists=original["artists"],
+                duration_ms=original["duration_ms"] + 1500,
+            )
+        items.append(item)
+    return [Track.from_item(item, position) for position, item in enumerate(items)]
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 10000, 50000]
+    random.seed(1)
+    for number_of_tracks in sizes:
+        tracks = make_tracks(number_of_tracks)
+
+        tic = time.perf_counter()
+        duplicates = DuplicateIndex(tracks)
+        seconds = time.perf_counter() - tic
+        # (again, as tracing the memory slows it down)
+        tracemalloc.start()
+        DuplicateIndex(tracks)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stored = len(pickle.dumps(duplicates))
+
+        print(
+            f"{number_of_tracks:>6} tracks: build {1000 * seconds:7.1f} ms "
+            f"({1e6 * seconds / number_of_tracks:.1f} us/track), "
+            f"peak {peak / 1e6:.1f} MB, stored {stored / 1e3:.0f} kB, "
+            f"{len(duplicates._copies)} copy groups, "
+            f"{len(duplicates._similar)} similar groups"
+        )
+
+
+if __name__ == "__main__":
+    main()
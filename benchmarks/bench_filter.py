@@ -0,0 +1,106 @@
+"""
+Benchmark filtering and sorting a large source playlist by its audio features.
+
+Compares a loop over the features of every track (a dict per track, as in
+the 'features' table of the track store) with the FeatureMatrix, which
+filters and sorts whole columns with NumPy. Also times a step of the
+filtered navigation (step_in_order) and building the matrix when loading.
+
+Run: python -m benchmarks.bench_filter [number_of_tracks]
+"""
+
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.synthetic import fake_playlist_item
+from feature_matrix import CAMELOT_NUMBERS, FeatureMatrix, step_in_order
+from track_index import TrackIndex
+from track_store import Track
+
+FILTER = {"bpm_min": 110, "bpm_max": 130, "energy_min": 0.5, "camelot": "8A"}
+REPEAT = 20
+
+
+def random_features():
+    """Return (compact) audio features, with random values."""
+    return {
+        "key": random.randrange(12),
+        "mode": random.randrange(2),
+        "tempo": random.uniform(60, 200),
+        **{
+            feature: random.random()
+            for feature in (
+                "energy",
+                "danceability",
+                "valence",
+                "speechiness",
+                "acousticness",
+                "instrumentalness",
+                "liveness",
+            )
+        },
+    }
+
+
+def select_by_loop(tracks, features, bpm_min, bpm_max, energy_min, camelot):
+    """The same filter (sorted by tempo) with a loop over the tracks."""
+    number, mode = int(camelot[:-1]), 1 if camelot[-1] == "B" else 0
+    matches = []
+    for track in tracks:
+        track_features = features.get(track.id)
+        if track.skip or not track_features:
+            continue
+        if not bpm_min <= track_features["tempo"] <= bpm_max:
+            continue
+        if track_features["energy"] < energy_min:
+            continue
+        key_number = CAMELOT_NUMBERS[track_features["key"]]
+        distance = abs(key_number - number)
+        if key_number != number and (
+            track_features["mode"] != mode or distance not in (1, 11)
+        ):
+            continue
+        matches.append(track)
+    matches.sort(key=lambda track: features[track.id]["tempo"])
+    return [track.position for track in matches]
+
+
+def timed(function):
+    times = []
+    for _ in range(REPEAT):
+        tic = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - tic)
+    return result, 1000 * statistics.median(times)
+
+
+def main():
+    number_of_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    random.seed(1)
+    tracks = [
+        Track.from_item(fake_playlist_item(position), position)
+        for position in range(number_of_tracks)
+    ]
+    features = {track.id: random_features() for track in tracks}
+
+    matrix, build_ms = timed(lambda: FeatureMatrix(tracks, features))
+    loop_order, loop_ms = timed(lambda: select_by_loop(tracks, features, **FILTER))
+    order, matrix_ms = timed(lambda: matrix.select(sort="tempo", **FILTER))
+    assert sorted(loop_order) == sorted(order.tolist())
+
+    track_index = TrackIndex(not track.skip for track in tracks)
+    flags = track_index.flags()
+    position = int(order[len(order) // 2])
+    _, step_ms = timed(lambda: step_in_order(order, flags, position))
+
+    print(f"{number_of_tracks} tracks, {len(order)} match {FILTER}, sorted by BPM")
+    print(f"  build matrix (on load): {build_ms:7.2f} ms")
+    print(f"  filter + sort, loop:    {loop_ms:7.2f} ms")
+    print(f"  filter + sort, matrix:  {matrix_ms:7.2f} ms")
+    print(f"  next matching track:    {step_ms:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark next/previous and move/remove clicks on a large source playlist.
+
+Before, a click scanned the track list for the next track that isn't a skip
+item, and a move/remove popped the track from the list and rewrote the whole
+list in the track store. After, the TrackIndex finds the next track and
+removes it in O(log n), and only the index is rewritten.
+
+Run: python -m benchmarks.bench_navigation [number_of_tracks]
+"""
+
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import fake_playlist_item
+from track_index import TrackIndex
+from track_store import Track, TrackStore
+
+CLICKS = 200
+UID = "0b7e4f2c-1c1f-4a5e-9b7e-4f2c1c1f4a5e"
+
+
+def next_by_scan(tracks, track_counter):
+    """The old update_count for btn_next: scan for the next track to divide."""
+    for _ in range(len(tracks)):
+        track_counter = track_counter + 1 if track_counter + 1 < len(tracks) else 0
+        if not tracks[track_counter].skip:
+            return track_counter
+    return -1
+
+
+def run_scan(track_store, tracks, removes):
+    track_store.set(UID, "tracks", tracks)
+    track_counter = next_by_scan(tracks, -1)
+    times = []
+    for remove in removes:
+        tic = time.perf_counter()
+        tracks = track_store.get(UID, "tracks")
+        if remove:
+            tracks.pop(track_counter)
+            track_store.set(UID, "tracks", tracks)
+            track_counter -= 1
+        track_counter = next_by_scan(tracks, track_counter)
+        times.append(time.perf_counter() - tic)
+    return times
+
+
+def run_index(track_store, tracks, removes):
+    track_store.set(UID, "tracks", tracks)
+    track_store.set(UID, "track_index", TrackIndex(not track.skip for track in tracks))
+    track_counter = track_store.get(UID, "track_index").select(0)
+    times = []
+    for remove in removes:
+        tic = time.perf_counter()
+        track_index = track_store.get(UID, "track_index")
+        if remove:
+            track_index.remove(track_counter)
+            track_store.set(UID, "track_index", track_index)
+        track_counter = track_index.next(track_counter)
+        times.append(time.perf_counter() - tic)
+    return times
+
+
+def main():
+    number_of_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    random.seed(1)
+    tracks = [
+        Track.from_item(fake_playlist_item(position), position)
+        for position in range(number_of_tracks)
+    ]
+    # a run of unavailable tracks (skip), like a playlist with old local files
+    for track in tracks[number_of_tracks // 2 : number_of_tracks // 2 + 500]:
+        track.skip = True
+    # half of the clicks move or remove the track
+    removes = [random.random() < 0.5 for _ in range(CLICKS)]
+
+    print(f"{number_of_tracks} tracks, {CLICKS} clicks (half move/remove)")
+    for name, run in (("scan", run_scan), ("index", run_index)):
+        with tempfile.TemporaryDirectory() as folder:
+            times = sorted(run(TrackStore(folder), list(tracks), removes))
+        print(
+            f"{name:>6}: p50 {1000 * statistics.median(times):7.2f} ms, "
+            f"p95 {1000 * times[int(0.95 * len(times))]:7.2f} ms per click"
+        )
+
+
+if __name__ == "__main__":
+    main()
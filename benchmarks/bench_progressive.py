@@ -0,0 +1,88 @@
+"""
+Benchmark the divide page of a large source while the rest of it loads.
+
+Against the local mock API, opens the divide page of the liked songs (only
+the first page is loaded before it's shown, see SourceLoader), then clicks
+through it (next, no action) while the other pages load in the background,
+and after. Reports the time to the first track, until all tracks are
+loaded, and the p50/p95 time per click during and after the load.
+
+Run: python -m benchmarks.bench_progressive [--liked-songs 20000] [--latency 100]
+"""
+
+import argparse
+import math
+import statistics
+import time
+
+from benchmarks.bench_routes import Recorder, import_app, log_in
+from benchmarks.mock_api import MockLibrary, start_mock_api
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--liked-songs", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=50, help="ms per API call")
+    parser.add_argument("--clicks", type=int, default=50, help="after the load")
+    return parser.parse_args()
+
+
+def click(recorder):
+    tic = time.perf_counter()
+    recorder.request(
+        "POST",
+        "/divide",
+        data={"btn_clicked": "btn_next_no_action", "radio_action": "radio_copy"},
+    )
+    return time.perf_counter() - tic
+
+
+def report(name, times):
+    if not times:
+        print(f"  {name:<28}{'-':>9}{'-':>9}")
+        return
+    times = sorted(times)
+    print(
+        f"  {name:<28}{1000 * statistics.median(times):>9.1f}"
+        f"{1000 * times[math.ceil(0.95 * len(times)) - 1]:>9.1f}"
+    )
+
+
+def main():
+    arguments = parse_arguments()
+    library = MockLibrary(liked_songs=arguments.liked_songs)
+    server = start_mock_api(latency=arguments.latency / 1000, library=library)
+    app_module = import_app(server)
+
+    recorder = Recorder(app_module, server)
+    log_in(recorder, app_module)
+    recorder.request("POST", "/select_source", data={"playlist_btn": "liked_songs"})
+    recorder.request(
+        "POST", "/select_target", data={"target_playlist_ids": [library.playlist_id(2)]}
+    )
+    tic = time.perf_counter()
+    recorder.request("GET", "/divide")
+    first_track = time.perf_counter() - tic
+
+    # (a click a second, like a user, until the load is done)
+    during = []
+    while recorder.request("GET", "/divide/loading").get_json():
+        during.append(click(recorder))
+        time.sleep(1)
+    loaded = time.perf_counter() - tic
+    after = [click(recorder) for _ in range(arguments.clicks)]
+
+    print(
+        f"{arguments.liked_songs} liked songs, "
+        f"{arguments.latency:.0f} ms per API call"
+    )
+    print(f"  first track shown after {first_track:.2f} s")
+    print(f"  all tracks loaded after {loaded:.2f} s")
+    print(f"  {'per click':<28}{'p50 ms':>9}{'p95 ms':>9}")
+    report(f"while loading ({len(during)})", during)
+    report(f"after ({len(after)})", after)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark the Spotify reads of the app with and without their projections.
+
+Against the local mock API (which answers only the fields asked for, like
+the API): calls each read the way it was before (the full objects) and
+with its projection (see projection.py): the fields parameter for the
+playlist endpoints, trimmed after parsing for the others. Reports per call
+the bytes sent by the API, the time to parse the JSON, and the memory the
+response takes (kept) and takes at most while parsing (peak).
+
+Run: python -m benchmarks.bench_projection [--calls 50] [--playlist-tracks 100]
+"""
+
+import argparse
+import statistics
+import time
+import tracemalloc
+from functools import partial
+
+import requests
+
+from benchmarks.bench_routes import import_app
+from benchmarks.mock_api import MockLibrary, mock_spotify_client, start_mock_api
+from source_loader import source_pages
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=50, help="per read")
+    parser.add_argument("--playlist-tracks", type=int, default=100)
+    return parser.parse_args()
+
+
+def reads(app_module, spotify_client, playlist_id):
+    """Return the reads of the app: name -> (before, with projection)."""
+    return {
+        "playlist (find_playlist)": (
+            partial(spotify_client.playlist, playlist_id),
+            partial(app_module.PLAYLIST.request(spotify_client.playlist), playlist_id),
+        ),
+        "playlist tracks page": (
+            partial(spotify_client.playlist_tracks, playlist_id, limit=100),
+            partial(source_pages(spotify_client, playlist_id)[0], limit=100),
+        ),
+        "liked songs page": (
+            partial(spotify_client.current_user_saved_tracks, limit=50),
+            partial(source_pages(spotify_client, "liked_songs")[0], limit=50),
+        ),
+        "playlists page": (
+            partial(spotify_client.current_user_playlists, limit=50),
+            partial(
+                app_module.PLAYLISTS_PAGE.trimmed(
+                    spotify_client.current_user_playlists
+                ),
+                limit=50,
+            ),
+        ),
+    }
+
+
+def measure(server, read, calls):
+    """Return the bytes, parse ms, kept and peak KB per call of read."""
+    parse_times = []
+    json = requests.models.Response.json
+
+    def timed_json(response, **kwargs):
+        tic = time.perf_counter()
+        try:
+            return json(response, **kwargs)
+        finally:
+            parse_times.append(time.perf_counter() - tic)
+
+    requests.models.Response.json = timed_json
+    try:
+        sent = server.bytes_sent
+        for _ in range(calls):
+            read()
+        sent = server.bytes_sent - sent
+    finally:
+        requests.models.Response.json = json
+
+    # (the memory of all responses kept at once, and of the largest call)
+    tracemalloc.start()
+    try:
+        kept = []
+        before = tracemalloc.get_traced_memory()[0]
+        peak = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            kept.append(read())
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - start)
+        kept_bytes = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return (
+        sent / calls,
+        1000 * statistics.median(parse_times),
+        kept_bytes / calls / 1024,
+        peak / 1024,
+    )
+
+
+def main():
+    arguments = parse_arguments()
+    server = start_mock_api(
+        latency=0, library=MockLibrary(playlist_tracks=arguments.playlist_tracks)
+    )
+    app_module = import_app(server)
+    spotify_client = mock_spotify_client(server)
+    playlist_id = server.library.playlist_id(2)
+
+    print(f"per call ({arguments.calls} calls), before -> with the projection")
+    print(
+        f"  {'read':<26}{'bytes sent':>22}{'parse ms':>17}"
+        f"{'kept KB':>19}{'peak KB':>19}"
+    )
+    for name, (before, after) in reads(app_module, spotify_client, playlist_id).items():
+        old = measure(server, before, arguments.calls)
+        new = measure(server, after, arguments.calls)
+        print(
+            f"  {name:<26}{old[0]:>11.0f} ->{new[0]:>7.0f}"
+            f"{old[1]:>8.2f} ->{new[1]:>6.2f}"
+            f"{old[2]:>9.1f} ->{new[2]:>7.1f}"
+            f"{old[3]:>9.1f} ->{new[3]:>7.1f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark the metadata lookups of the divide page when they aren't prefetched.
+
+Compares the calls one after another (album, each artist, audio features,
+like render_divide used to do) with the concurrent fan-out of
+get_track_metadata (album, all artists, audio features at the same time),
+against a local mock API with a fixed latency per call.
+
+Run: python -m benchmarks.bench_render [latency_in_ms] [number_of_artists]
+"""
+
+import statistics
+import sys
+import time
+from functools import partial
+
+from benchmarks.mock_api import mock_spotify_client, start_mock_api
+from fan_out import FanOut
+
+RENDERS = 50
+
+
+def serial_lookups(spotify_client, album_id, artist_ids, track_id):
+    """Look up the label, genres and features one call after another."""
+    label = spotify_client.album(album_id)["label"]
+    genres = []
+    for artist_id in artist_ids:
+        genres.extend(spotify_client.artist(artist_id)["genres"])
+    features = spotify_client.audio_features([track_id])[0]
+    return label, genres, features
+
+
+def fan_out_lookups(fan_out, spotify_client, album_id, artist_ids, track_id):
+    """Look up the label, genres and features with concurrent calls."""
+    results = fan_out.run(
+        {
+            "album": partial(spotify_client.album, album_id),
+            "artists": partial(spotify_client.artists, artist_ids),
+            "audio_features": partial(spotify_client.audio_features, [track_id]),
+        },
+        timeout=5,
+    )
+    genres = [
+        genre for artist in results["artists"]["artists"] for genre in artist["genres"]
+    ]
+    return results["album"]["label"], genres, results["audio_features"][0]
+
+
+def run(name, lookups, server, number_of_artists):
+    """Time RENDERS lookups of different tracks, print p50/p95 and calls/render."""
+    calls = server.calls
+    times = []
+    for render in range(RENDERS):
+        artist_ids = [f"artist{render}x{i}" for i in range(number_of_artists)]
+        tic = time.perf_counter()
+        lookups(f"album{render}", artist_ids, f"track{render}")
+        times.append(time.perf_counter() - tic)
+
+    times.sort()
+    print(
+        f"{name:>8}: p50 {1000 * statistics.median(times):7.1f} ms, "
+        f"p95 {1000 * times[int(0.95 * len(times))]:7.1f} ms, "
+        f"{(server.calls - calls) / RENDERS:.1f} calls per render"
+    )
+
+
+def main():
+    latency = (float(sys.argv[1]) if len(sys.argv) > 1 else 50) / 1000
+    number_of_artists = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    server = start_mock_api(latency)
+    spotify_client = mock_spotify_client(server)
+    fan_out = FanOut(8)
+
+    print(
+        f"{RENDERS} renders, {1000 * latency:.0f} ms latency per call, "
+        f"{number_of_artists} artists per track"
+    )
+    run("serial", partial(serial_lookups, spotify_client), server, number_of_artists)
+    run(
+        "fan-out",
+        partial(fan_out_lookups, fan_out, spotify_client),
+        server,
+        number_of_artists,
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
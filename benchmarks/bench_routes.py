@@ -0,0 +1,214 @@
+"""
+Benchmark the routes of the app, end to end, against the local mock API.
+
+Logs in (with the OAuth flow of the mock), then per round: step 1 (select
+the source), step 2 (select the targets), loads the divide page and clicks
+through it (moves, copies and skips). Reports per route the p50/p95 latency,
+the Spotify API calls, the response bytes and the session bytes written per
+request. Divide actions are sent in the background, so their calls count for
+the request that was running when they were sent.
+
+Run: python -m benchmarks.bench_routes [--playlists 2000] [--liked-songs 20000]
+     (see --help for the latency, 429s, number of clicks, etc.)
+"""
+
+import argparse
+import math
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import requests
+
+from benchmarks.mock_api import MockLibrary, mock_api_environ, start_mock_api
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (button, action, number of target playlists checked) of the clicks, in turn
+CLICKS = [
+    ("btn_next", "radio_move", 1),
+    ("btn_next", "radio_copy", 2),
+    ("btn_next_no_action", "radio_copy", 0),
+    ("btn_next", "radio_move", 1),
+    ("btn_prev_no_action", "radio_move", 0),
+]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--playlists", type=int, default=2000)
+    parser.add_argument("--liked-songs", type=int, default=20000)
+    parser.add_argument("--playlist-tracks", type=int, default=100)
+    parser.add_argument(
+        "--source", default="liked_songs", help="liked_songs or a playlist number"
+    )
+    parser.add_argument("--targets", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--clicks", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=20, help="ms per API call")
+    parser.add_argument("--every-429", type=int, default=0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument(
+        "--rate", type=float, help="calls per second (default: SPOTIFY_RATE_LIMIT)"
+    )
+    return parser.parse_args()
+
+
+def import_app(server):
+    """Import the app in a temporary folder, pointed at the mock API."""
+    os.environ.update(mock_api_environ(server))
+    os.environ.setdefault("SECRET_SESSION_KEY", "benchmark")
+    os.environ.setdefault("SPOTIPY_CLIENT_ID", "benchmark")
+    os.environ.setdefault("SPOTIPY_CLIENT_SECRET", "benchmark")
+    # (the app keeps its sessions, tracks and caches in the working directory)
+    os.chdir(tempfile.mkdtemp(prefix="bench_routes"))
+    sys.path.insert(0, REPOSITORY)
+    import app
+
+    return app
+
+
+class Recorder:
+    """Time the requests of the test client, with their API calls and bytes."""
+
+    def __init__(self, app_module, server):
+        self.client = app_module.app.test_client()
+        self.server = server
+        self.times = defaultdict(list)
+        self.calls = defaultdict(list)
+        self.session_bytes = defaultdict(list)
+        self.response_bytes = defaultdict(list)
+        self._written = 0
+
+        interface = app_module.app.session_interface
+        if hasattr(interface, "_write"):
+            write = interface._write
+
+            def counting_write(sid, part, data):
+                self._written += len(data)
+                return write(sid, part, data)
+
+            interface._write = counting_write
+
+    def request(self, method, url, name=None, **kwargs):
+        name = name or f"{method} {url.split('?')[0]}"
+        calls, written = self.server.calls, self._written
+        tic = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        self.times[name].append(time.perf_counter() - tic)
+        self.calls[name].append(self.server.calls - calls)
+        self.session_bytes[name].append(self._written - written)
+        self.response_bytes[name].append(len(response.data))
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} returned {response.status_code}")
+        return response
+
+    def report(self):
+        print(
+            f"{'route':<32}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'calls/req':>11}{'response B/req':>16}{'session B/req':>15}"
+        )
+        for name, times in self.times.items():
+            times = sorted(times)
+            print(
+                f"{name:<32}{len(times):>5}"
+                f"{1000 * statistics.median(times):>10.1f}"
+                f"{1000 * times[math.ceil(0.95 * len(times)) - 1]:>10.1f}"
+                f"{statistics.mean(self.calls[name]):>11.1f}"
+                f"{statistics.mean(self.response_bytes[name]):>16.0f}"
+                f"{statistics.mean(self.session_bytes[name]):>15.0f}"
+            )
+
+
+def log_in(recorder, app_module):
+    """Log in through the OAuth flow of the mock."""
+    recorder.request("GET", "/login")
+    with recorder.client.session_transaction() as session:
+        uid = session["uuid"]
+    auth_manager = app_module.spotify_clients.get(uid).auth_manager
+    response = requests.get(auth_manager.get_authorize_url(), allow_redirects=False)
+    code = re.search(r"code=([^&]+)", response.headers["Location"]).group(1)
+    recorder.request("GET", f"/login?code={code}", name="GET /login (token)")
+    recorder.request("GET", "/login", name="GET /login (me)")
+
+
+def main():
+    arguments = parse_arguments()
+    library = MockLibrary(
+        playlists=arguments.playlists,
+        liked_songs=arguments.liked_songs,
+        playlist_tracks=arguments.playlist_tracks,
+    )
+    server = start_mock_api(
+        latency=arguments.latency / 1000,
+        library=library,
+        every_429=arguments.every_429,
+        retry_after=arguments.retry_after,
+    )
+    app_module = import_app(server)
+    if arguments.rate:
+        app_module.spotify_scheduler.rate = arguments.rate
+        app_module.spotify_scheduler.burst = 2 * arguments.rate
+
+    if arguments.source == "liked_songs":
+        source = "liked_songs"
+    else:
+        source = library.playlist_id(int(arguments.source))
+    # playlists the user can add to (see MockLibrary)
+    targets = [
+        library.playlist_id(number)
+        for number in range(library.playlists)
+        if number % 4 and number % 10 != 1
+    ][: arguments.targets]
+
+    print(
+        f"{arguments.playlists} playlists, {arguments.liked_songs} liked songs, "
+        f"source {source}, {len(targets)} targets, {arguments.rounds} rounds of "
+        f"{arguments.clicks} clicks, {arguments.latency:.0f} ms per API call"
+        + (f", a 429 every {arguments.every_429} calls" if arguments.every_429 else "")
+    )
+
+    recorder = Recorder(app_module, server)
+    tic = time.perf_counter()
+    log_in(recorder, app_module)
+    for _ in range(arguments.rounds):
+        recorder.request("GET", "/select_source")
+        recorder.request("POST", "/select_source", data={"playlist_btn": source})
+        recorder.request("GET", "/select_target")
+        recorder.request(
+            "POST", "/select_target", data={"target_playlist_ids": targets}
+        )
+        recorder.request("GET", "/divide")
+        for click in range(arguments.clicks):
+            button, action, checked = CLICKS[click % len(CLICKS)]
+            recorder.request(
+                "POST",
+                "/divide",
+                name=f"POST /divide {button}",
+                data={
+                    "btn_clicked": button,
+                    "radio_action": action,
+                    "action_playlist_ids": targets[click % len(targets) :][:checked],
+                },
+            )
+    # leaving the divide page sends the divide actions that are left
+    recorder.request("GET", "/select_source", name="GET /select_source (flush)")
+    with recorder.client.session_transaction() as session:
+        app_module.action_queue.flush(session["uuid"], wait=True)
+    total = time.perf_counter() - tic
+
+    recorder.report()
+    print(f"\ntotal {total:.1f} s, {server.calls} API calls:")
+    for name, count in server.call_counts.most_common():
+        print(f"  {name:<22}{count:>6}")
+    if server.stale_removes:
+        print(f"  ({server.stale_removes} removes against an old snapshot_id)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark the time spent on session load and save per divide POST.
+
+Compares Flask-Session's filesystem backend (which rewrites the whole session
+on every change) with the split session backend (which only rewrites the
+parts that changed). The session holds what divide() stores in it, with the
+given number of target playlists.
+
+Run: python -m benchmarks.bench_session [number_of_target_playlists]
+"""
+
+import statistics
+import sys
+import tempfile
+import time
+
+from flask import Flask, session
+from flask_session import Session
+
+from session_backend import SplitSessionInterface
+
+CLICKS = 200
+
+
+class Timer:
+    """Wrap open_session and save_session of a session interface to time them."""
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.open_times = []
+        self.save_times = []
+
+        def timed(method, times):
+            def wrapper(*args, **kwargs):
+                tic = time.perf_counter()
+                result = method(*args, **kwargs)
+                times.append(time.perf_counter() - tic)
+                return result
+
+            return wrapper
+
+        interface.open_session = timed(interface.open_session, self.open_times)
+        interface.save_session = timed(interface.save_session, self.save_times)
+
+
+def make_app(folder, session_type, number_of_playlists):
+    """Return a flask app with a /divide route changing the session like divide()."""
+    app = Flask(__name__)
+    app.secret_key = "benchmark"
+    app.config["SESSION_FILE_DIR"] = folder
+    if session_type == "split":
+        app.session_interface = SplitSessionInterface(
+            folder, large_keys=["target_playlists", "target_playlist_ids"]
+        )
+    else:
+        app.config["SESSION_TYPE"] = session_type
+        Session(app)
+
+    @app.route("/load")
+    def load():
+        session["uuid"] = "0b7e4f2c-1c1f-4a5e-9b7e-4f2c1c1f4a5e"
+        session["spotify_logged_in"] = True
+        session["source_playlist"] = "liked_songs"
+        session["target_playlist_ids"] = [
+            f"playlist{i:014d}" for i in range(number_of_playlists)
+        ]
+        session["target_playlists"] = [
+            {
+                "id": f"playlist{i:014d}",
+                "name": f"Playlist number {i}",
+                "images": [
+                    {"url": f"https://i.scdn.co/image/ab67616d0000b273{i:024d}"}
+                ],
+                "owner_id": "user",
+                "collaborative": False,
+                "snapshot_id": f"MTYyNDUzNjAwMCwwMDAwMDAwMDAwMDAwMDAw{i:08d}",
+            }
+            for i in range(number_of_playlists)
+        ]
+        session["move_remove_enabled"] = True
+        session["track_counter"] = 0
+        return ""
+
+    @app.route("/divide", methods=["POST"])
+    def divide():
+        session["action_playlist_ids"] = ["playlist00000000000001"]
+        session["radio_action"] = "radio_move"
+        session["select_all"] = None
+        session["track_counter"] += 1
+        return ""
+
+    return app
+
+
+def bench(session_type, number_of_playlists):
+    with tempfile.TemporaryDirectory() as folder:
+        app = make_app(folder, session_type, number_of_playlists)
+        client = app.test_client()
+        client.get("/load")
+        timer = Timer(app.session_interface)
+        for _ in range(CLICKS):
+            client.post("/divide")
+    return timer
+
+
+def main():
+    number_of_playlists = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    print(f"{number_of_playlists} target playlists, {CLICKS} divide POSTs")
+    print(f"{'':24}{'load ms (p50)':>15}{'save ms (p50)':>15}{'total ms':>10}")
+    for session_type in ["filesystem", "split"]:
+        timer = bench(session_type, number_of_playlists)
+        load = statistics.median(timer.open_times) * 1000
+        save = statistics.median(timer.save_times) * 1000
+        print(f"{session_type:24}{load:>15.3f}{save:>15.3f}{load + save:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark scoring tracks against the centroids of the target playlists.
+
+Builds the PlaylistCentroids of a number of target playlists (random audio
+features, genres from a small vocabulary), then times scoring one track (as
+the divide page does for every track), scoring a whole source in one pass,
+and adding a track to a playlist (as the app does for every copy or move).
+
+Run: python -m benchmarks.bench_suggestions [number_of_tracks] [number_of_targets]
+"""
+
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from suggestions import FEATURES, PlaylistCentroids
+
+GENRES = [f"genre {number}" for number in range(300)]
+TRACKS_PER_TARGET = 200
+REPEAT = 20
+
+
+def random_track():
+    """Return a feature vector and genres, like feature_vector and track_genres."""
+    return np.random.random(len(FEATURES)), random.sample(GENRES, 3)
+
+
+def timed(function, repeat=REPEAT):
+    times = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - tic)
+    return 1000 * statistics.median(times)
+
+
+def main():
+    number_of_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    number_of_targets = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    random.seed(1)
+    np.random.seed(1)
+
+    centroids = PlaylistCentroids()
+    tic = time.perf_counter()
+    for target in range(number_of_targets):
+        tracks = [random_track() for _ in range(TRACKS_PER_TARGET)]
+        centroids.set(f"playlist{target}", *zip(*tracks))
+    build_ms = 1000 * (time.perf_counter() - tic)
+
+    vectors, genre_lists = zip(*(random_track() for _ in range(number_of_tracks)))
+    vectors = np.array(vectors)
+    vector, genres = vectors[0], genre_lists[0]
+
+    print(
+        f"{number_of_targets} targets of {TRACKS_PER_TARGET} tracks, "
+        f"{len(GENRES)} genres"
+    )
+    print(f"  build centroids:             {build_ms:8.2f} ms")
+    print(
+        f"  suggest for one track:       "
+        f"{timed(lambda: centroids.suggest(vector, genres)):8.2f} ms"
+    )
+    print(
+        f"  add a track to a playlist:   "
+        f"{timed(lambda: centroids.add('playlist0', vector, genres)):8.2f} ms"
+    )
+    print(
+        f"  score {number_of_tracks} tracks in one pass: "
+        f"{timed(lambda: centroids.score(vectors, genre_lists), repeat=3):8.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark the session cost per divide click, before and after the track store.
+
+Before, the raw playlist items were part of the session, so every click read
+and rewrote the full pickle. After, the session only holds the small state and
+the compact tracks live in the track store (written once, when loaded); a move
+or remove only rewrites the index of the tracks left (see TrackIndex).
+
+Run: python -m benchmarks.bench_track_store [number_of_tracks]
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import fake_playlist_item
+from track_index import TrackIndex
+from track_store import Track, TrackStore
+
+CLICKS = 20
+
+
+def small_session_state():
+    """Return the session keys that are there besides the tracks."""
+    return {
+        "uuid": "0b7e4f2c-1c1f-4a5e-9b7e-4f2c1c1f4a5e",
+        "spotify_logged_in": True,
+        "source_playlist": "liked_songs",
+        "target_playlist_ids": [f"playlist{i:014d}" for i in range(10)],
+        "target_playlists": [
+            {
+                "id": f"playlist{i:014d}",
+                "name": f"Playlist {i}",
+                "images": [{"url": f"https://i.scdn.co/image/pl{i}"}],
+            }
+            for i in range(10)
+        ],
+        "action_playlist_ids": [],
+        "radio_action": "radio_move",
+        "select_all": None,
+        "move_remove_enabled": True,
+        "track_counter": 0,
+    }
+
+
+def click(path, session):
+    """Load and save the session file once, like a request that modifies it."""
+    with open(path, "rb") as file:
+        session = pickle.load(file)
+    session["track_counter"] += 1
+    data = pickle.dumps(session)
+    with open(path, "wb") as file:
+        file.write(data)
+    return len(data)
+
+
+def bench_before(folder, items):
+    session = small_session_state()
+    for item in items:
+        item["skip"] = False
+    session["tracks"] = items
+    path = os.path.join(folder, "before")
+    with open(path, "wb") as file:
+        pickle.dump(session, file)
+
+    tic = time.perf_counter()
+    for _ in range(CLICKS):
+        size = click(path, session)
+    return size, (time.perf_counter() - tic) / CLICKS
+
+
+def bench_after(folder, items, move=False):
+    store = TrackStore(os.path.join(folder, "store"))
+    tracks = [Track.from_item(item) for item in items]
+    store.set("uuid", "tracks", tracks)
+    store.set("uuid", "track_index", TrackIndex(not track.skip for track in tracks))
+    path = os.path.join(folder, "after")
+    with open(path, "wb") as file:
+        pickle.dump(small_session_state(), file)
+
+    size = 0
+    tic = time.perf_counter()
+    for position in range(CLICKS):
+        size = click(path, None)
+        track_index = store.get("uuid", "track_index")
+        if move:
+            # (like divide_track: the track list stays, the index is rewritten)
+            track_index.remove(position)
+            store.set("uuid", "track_index", track_index)
+            size += os.path.getsize(os.path.join(store.folder, "uuid.track_index"))
+    return size, (time.perf_counter() - tic) / CLICKS
+
+
+def main():
+    number_of_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    items = [fake_playlist_item(i) for i in range(number_of_tracks)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        results = [
+            ("session with raw tracks", bench_before(folder, items)),
+            ("track store, next/prev", bench_after(folder, items)),
+            ("track store, move/remove", bench_after(folder, items, move=True)),
+        ]
+
+    print(f"{number_of_tracks} tracks, average over {CLICKS} clicks")
+    print(f"{'':28}{'bytes/click':>14}{'ms/click':>12}")
+    for name, (size, seconds) in results:
+        print(f"{name:28}{size:>14,}{seconds * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
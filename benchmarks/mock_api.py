@@ -0,0 +1,512 @@
+"""
+A local mock of the Spotify Web API (and accounts service) the app uses.
+
+Serves a synthetic library (made up on the fly from synthetic.py, so 20,000
+liked songs cost no memory until they're changed): the user's playlists,
+playlist items, liked songs, albums, artists, audio features and analysis,
+adding and removing items, and the OAuth authorization code flow. Every call
+waits latency seconds, and every every_429th call is answered with a 429 and
+a Retry-After, to test the rate limiting. Endpoints can be made slow or fail
+with faults: handler name (see MockApiHandler.ROUTES) -> (extra seconds,
+status or None), e.g. {"audio_features": (0, 503)}. Like the API, the
+playlist endpoints only answer the fields asked for with the fields
+parameter (see projection.py); server.bytes_sent counts the bytes answered.
+
+Point the app at it with the environment variables SPOTIFY_API_URL and
+SPOTIFY_ACCOUNTS_URL (see mock_api_environ), or a client with
+mock_spotify_client.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from benchmarks.synthetic import fake_playlist_item, fake_track
+from projection import parse_fields, project
+from spotify_client import Spotify, build_http_session
+
+USER_ID = "user"
+# all scopes the app asks for, granted to every token
+SCOPES = (
+    "playlist-read-private playlist-modify-private playlist-read-collaborative "
+    "playlist-modify-public user-library-read user-library-modify"
+)
+
+
+def track_number(uri_or_id):
+    """Return the number of a synthetic track from its uri or id."""
+    return int(uri_or_id.rsplit(":", 1)[-1][len("track") :])
+
+
+class MockLibrary:
+    """
+    The synthetic library of the mock user.
+
+    Playlist p has playlist_tracks tracks; 1 in 4 playlists is owned by
+    someone else and 1 in 10 is collaborative. A playlist (or Liked Songs) is
+    only stored as a list of track numbers once it is changed, every change
+    gives it a new snapshot_id.
+    """
+
+    def __init__(self, playlists=50, liked_songs=1000, playlist_tracks=100):
+        self.playlists = playlists
+        self.liked_songs = liked_songs
+        self.playlist_tracks = playlist_tracks
+        self._lock = threading.Lock()
+        self._changed = {}  # playlist id (or 'liked_songs') -> track numbers
+        self._snapshots = Counter()
+        self._liked_at = {}  # track number -> when it was liked (see like)
+
+    def playlist_id(self, number):
+        """Return the id of playlist number."""
+        return f"playlist{number:014d}"
+
+    def playlist_number(self, playlist_id):
+        """Return the number of a playlist id, or None if there is no such playlist."""
+        digits = playlist_id[len("playlist") :]
+        if not playlist_id.startswith("playlist") or not digits.isdigit():
+            return None
+        number = int(digits)
+        return number if number < self.playlists else None
+
+    def track_numbers(self, key):
+        """Return the track numbers of a playlist (id) or 'liked_songs'."""
+        with self._lock:
+            if key in self._changed:
+                return self._changed[key]
+        if key == "liked_songs":
+            return range(self.liked_songs)
+        start = self.playlist_number(key) * self.playlist_tracks
+        return range(start, start + self.playlist_tracks)
+
+    def change(self, key, change):
+        """Change the track numbers of a playlist: change(numbers) edits the list."""
+        numbers = list(self.track_numbers(key))
+        with self._lock:
+            change(numbers)
+            self._changed[key] = numbers
+            self._snapshots[key] += 1
+
+    def like(self, numbers):
+        """Like tracks (by number) now: they go on top of the liked songs."""
+        now = time.time()
+        with self._lock:
+            self._liked_at.update(dict.fromkeys(numbers, now))
+
+        def add_on_top(liked):
+            liked[:0] = numbers
+
+        self.change("liked_songs", add_on_top)
+
+    def snapshot_id(self, key):
+        """Return the current snapshot_id of the playlist."""
+        return f"{key}snapshot{self._snapshots[key]:08d}"
+
+    def simplified_playlist(self, number):
+        """Return a simplified playlist object, as in the list of playlists."""
+        playlist_id = self.playlist_id(number)
+        return {
+            "collaborative": number % 10 == 1,
+            "description": "",
+            "href": f"https://api.spotify.com/v1/playlists/{playlist_id}",
+            "id": playlist_id,
+            "images": [
+                {"height": size, "url": f"https://i.scdn.co/{playlist_id}{size}"}
+                for size in (640, 300, 60)
+            ],
+            "name": f"Playlist {number}",
+            "owner": {
+                "display_name": "Mock User",
+                "id": USER_ID if number % 4 else "someone_else",
+                "type": "user",
+            },
+            "public": number % 10 != 1,
+            "snapshot_id": self.snapshot_id(playlist_id),
+            "tracks": {"total": len(self.track_numbers(playlist_id))},
+            "type": "playlist",
+            "uri": f"spotify:playlist:{playlist_id}",
+        }
+
+    def item(self, number, liked=False):
+        """Return a playlist item (or saved track item) of track number."""
+        if liked:
+            # newest first, one a minute (unless liked later, see like)
+            liked_at = self._liked_at.get(number, 1625000000 - 60 * number)
+            added_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(liked_at))
+            return {"added_at": added_at, "track": fake_track(number)}
+        return fake_playlist_item(number)
+
+
+def paging(items, total, limit, offset, url):
+    """Return a Spotify paging object."""
+    next_offset = offset + limit
+    return {
+        "href": f"{url}?{urlencode({'offset': offset, 'limit': limit})}",
+        "items": items,
+        "limit": limit,
+        "next": (
+            f"{url}?{urlencode({'offset': next_offset, 'limit': limit})}"
+            if next_offset < total
+            else None
+        ),
+        "offset": offset,
+        "previous": None,
+        "total": total,
+    }
+
+
+def mock_album(album_id):
+    """Return an album object with a label."""
+    return {"id": album_id, "name": f"Album {album_id}", "label": f"Label {album_id}"}
+
+
+def mock_artist(artist_id):
+    """Return an artist object with genres."""
+    return {"id": artist_id, "name": f"Artist {artist_id}", "genres": ["pop", "dance"]}
+
+
+def mock_audio_features(track_id):
+    """Return an audio features object (made up from the id)."""
+    number = sum(track_id.encode())
+    return {
+        "id": track_id,
+        "key": number % 12,
+        "mode": number % 2,
+        "tempo": 80.0 + number % 100,
+        "danceability": (number % 97) / 97,
+        "energy": (number % 89) / 89,
+        "speechiness": (number % 13) / 100,
+        "acousticness": (number % 83) / 83,
+        "instrumentalness": (number % 7) / 10,
+        "liveness": (number % 11) / 20,
+        "valence": (number % 79) / 79,
+    }
+
+
+def mock_audio_analysis(track_id):
+    """Return a (small) audio analysis object."""
+    features = mock_audio_features(track_id)
+    return {
+        "track": {
+            "key": features["key"],
+            "key_confidence": 0.6,
+            "mode": features["mode"],
+            "mode_confidence": 0.7,
+            "tempo": features["tempo"],
+            "tempo_confidence": 0.8,
+            "time_signature": 4,
+        },
+        "sections": [
+            {
+                "start": 30.0 * section,
+                "duration": 30.0,
+                "loudness": -8.0,
+                "tempo": features["tempo"],
+                "key": features["key"],
+                "mode": features["mode"],
+            }
+            for section in range(6)
+        ],
+    }
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    """Answer requests like the Spotify API, after the latency of the server."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    # (method, path pattern, handler); the groups of the pattern are the arguments
+    ROUTES = [
+        ("GET", r"/authorize", "authorize"),
+        ("POST", r"/api/token", "token"),
+        ("GET", r"/v1/me", "me"),
+        ("GET", r"/v1/me/playlists", "my_playlists"),
+        ("GET", r"/v1/users/[^/]+/playlists", "my_playlists"),
+        ("GET", r"/v1/me/tracks", "saved_tracks"),
+        ("DELETE", r"/v1/me/tracks", "saved_tracks_delete"),
+        ("DELETE", r"/v1/me/library", "saved_tracks_delete"),
+        ("GET", r"/v1/playlists/([^/]+)", "playlist"),
+        ("GET", r"/v1/playlists/([^/]+)/(?:tracks|items)", "playlist_items"),
+        ("POST", r"/v1/playlists/([^/]+)/(?:tracks|items)", "playlist_add"),
+        ("DELETE", r"/v1/playlists/([^/]+)/(?:tracks|items)", "playlist_remove"),
+        ("GET", r"/v1/albums/([^/]+)", "album"),
+        ("GET", r"/v1/albums", "albums"),
+        ("GET", r"/v1/artists/([^/]+)", "artist"),
+        ("GET", r"/v1/artists", "artists"),
+        ("GET", r"/v1/audio-features/([^/]+)", "audio_features_one"),
+        ("GET", r"/v1/audio-features", "audio_features"),
+        ("GET", r"/v1/audio-analysis/([^/]+)", "audio_analysis"),
+    ]
+    # the handlers of the endpoints with a fields parameter
+    FIELDS_ROUTES = ("playlist", "playlist_items")
+
+    def do_GET(self):
+        self.handle_call("GET")
+
+    def do_POST(self):
+        self.handle_call("POST")
+
+    def do_PUT(self):
+        self.handle_call("PUT")
+
+    def do_DELETE(self):
+        self.handle_call("DELETE")
+
+    def handle_call(self, method):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        self.query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length) if length else b""
+
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                break
+        else:
+            self.send_json(404, {"error": {"status": 404, "message": "Not found"}})
+            return
+
+        server = self.server
+        delay, status = server.faults.get(name, (0, None))
+        time.sleep(server.latency + delay)
+        with server.lock:
+            server.calls += 1
+            server.call_counts[name] += 1
+            too_many = server.every_429 and server.calls % server.every_429 == 0
+        if status:
+            self.send_json(status, {"error": {"status": status, "message": "Fault"}})
+            return
+        if too_many:
+            self.send_json(
+                429,
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                {"Retry-After": str(server.retry_after)},
+            )
+            return
+
+        status, body, *headers = getattr(self, name)(*match.groups())
+        if status == 200 and name in self.FIELDS_ROUTES and "fields" in self.query:
+            try:
+                body = project(body, parse_fields(self.query["fields"]))
+            except ValueError as e:
+                status, body = 400, {"error": {"status": 400, "message": str(e)}}
+        self.send_json(status, body, *headers)
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        with self.server.lock:
+            self.server.bytes_sent += len(data)
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+    def ids(self):
+        # (newer endpoints take uris instead of ids)
+        ids = self.query.get("ids") or self.query.get("uris", "")
+        return [id_.rsplit(":", 1)[-1] for id_ in ids.split(",") if id_]
+
+    def page(self, default_limit):
+        """Return the limit and offset of a paged call."""
+        return (
+            int(self.query.get("limit", default_limit)),
+            int(self.query.get("offset", 0)),
+        )
+
+    @property
+    def library(self):
+        return self.server.library
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    # accounts service
+
+    def authorize(self):
+        query = {"code": "mock-authorization-code"}
+        if "state" in self.query:
+            query["state"] = self.query["state"]
+        location = f"{self.query['redirect_uri']}?{urlencode(query)}"
+        return 302, {}, {"Location": location}
+
+    def token(self):
+        return 200, {
+            "access_token": f"mock-access-token-{time.time()}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "refresh_token": "mock-refresh-token",
+            "scope": SCOPES,
+        }
+
+    # user and library
+
+    def me(self):
+        return 200, {"id": USER_ID, "display_name": "Mock User", "type": "user"}
+
+    def my_playlists(self):
+        limit, offset = self.page(20)
+        items = [
+            self.library.simplified_playlist(number)
+            for number in range(offset, min(offset + limit, self.library.playlists))
+        ]
+        url = f"{self.base_url}/v1/me/playlists"
+        return 200, paging(items, self.library.playlists, limit, offset, url)
+
+    def saved_tracks(self):
+        limit, offset = self.page(20)
+        numbers = self.library.track_numbers("liked_songs")
+        items = [
+            self.library.item(number, liked=True)
+            for number in numbers[offset : offset + limit]
+        ]
+        url = f"{self.base_url}/v1/me/tracks"
+        return 200, paging(items, len(numbers), limit, offset, url)
+
+    def saved_tracks_delete(self):
+        removed = {track_number(track_id) for track_id in self.ids()}
+
+        def remove(numbers):
+            numbers[:] = [number for number in numbers if number not in removed]
+
+        self.library.change("liked_songs", remove)
+        return 200, {}
+
+    # playlists
+
+    def not_found(self):
+        return 404, {"error": {"status": 404, "message": "Invalid playlist Id"}}
+
+    def playlist(self, playlist_id):
+        number = self.library.playlist_number(playlist_id)
+        if number is None:
+            return self.not_found()
+        playlist = self.library.simplified_playlist(number)
+        playlist["tracks"] = self.playlist_items(playlist_id)[1]
+        playlist["followers"] = {"href": None, "total": 0}
+        return 200, playlist
+
+    def playlist_items(self, playlist_id):
+        if self.library.playlist_number(playlist_id) is None:
+            return self.not_found()
+        limit, offset = self.page(100)
+        numbers = self.library.track_numbers(playlist_id)
+        items = [
+            self.library.item(number) for number in numbers[offset : offset + limit]
+        ]
+        url = f"{self.base_url}/v1/playlists/{playlist_id}/tracks"
+        return 200, paging(items, len(numbers), limit, offset, url)
+
+    def playlist_add(self, playlist_id):
+        if self.library.playlist_number(playlist_id) is None:
+            return self.not_found()
+        body = json.loads(self.body or b"[]")
+        uris = body["uris"] if isinstance(body, dict) else body
+        added = [track_number(uri) for uri in uris]
+        position = self.query.get("position")
+
+        def add(numbers):
+            at = len(numbers) if position is None else int(position)
+            numbers[at:at] = added
+
+        self.library.change(playlist_id, add)
+        return 201, {"snapshot_id": self.library.snapshot_id(playlist_id)}
+
+    def playlist_remove(self, playlist_id):
+        if self.library.playlist_number(playlist_id) is None:
+            return self.not_found()
+        body = json.loads(self.body or b"{}")
+        snapshot_id = body.get("snapshot_id")
+        if snapshot_id and snapshot_id != self.library.snapshot_id(playlist_id):
+            # (Spotify would apply the positions to that older version)
+            with self.server.lock:
+                self.server.stale_removes += 1
+
+        positions = set()
+        removed = set()
+        # (the items endpoint takes "items", the older tracks endpoint "tracks")
+        for track in body.get("items", body.get("tracks", [])):
+            if "positions" in track:
+                positions.update(track["positions"])
+            else:
+                removed.add(track_number(track["uri"]))
+
+        def remove(numbers):
+            numbers[:] = [
+                number
+                for position, number in enumerate(numbers)
+                if position not in positions and number not in removed
+            ]
+
+        self.library.change(playlist_id, remove)
+        return 200, {"snapshot_id": self.library.snapshot_id(playlist_id)}
+
+    # metadata
+
+    def album(self, album_id):
+        return 200, mock_album(album_id)
+
+    def albums(self):
+        return 200, {"albums": [mock_album(album_id) for album_id in self.ids()]}
+
+    def artist(self, artist_id):
+        return 200, mock_artist(artist_id)
+
+    def artists(self):
+        return 200, {"artists": [mock_artist(artist_id) for artist_id in self.ids()]}
+
+    def audio_features_one(self, track_id):
+        return 200, mock_audio_features(track_id)
+
+    def audio_features(self):
+        return 200, {
+            "audio_features": [mock_audio_features(track_id) for track_id in self.ids()]
+        }
+
+    def audio_analysis(self, track_id):
+        return 200, mock_audio_analysis(track_id)
+
+
+def start_mock_api(latency=0.05, library=None, every_429=0, retry_after=1, faults=None):
+    """Start the mock API in a background thread, return the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockApiHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.library = library or MockLibrary()
+    server.every_429 = every_429
+    server.retry_after = retry_after
+    server.faults = faults or {}
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.call_counts = Counter()
+    server.bytes_sent = 0
+    server.stale_removes = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def mock_api_environ(server):
+    """Return the environment variables that point the app at the mock API."""
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    return {"SPOTIFY_API_URL": f"{base_url}/v1/", "SPOTIFY_ACCOUNTS_URL": base_url}
+
+
+def mock_spotify_client(server, pool_size=32):
+    """Return a Spotify client (like the app's) that calls the mock API."""
+    spotify_client = Spotify(
+        auth="mock-token", requests_session=build_http_session(pool_size)
+    )
+    spotify_client.prefix = mock_api_environ(server)["SPOTIFY_API_URL"]
+    return spotify_client
@@ -0,0 +1,86 @@
+"""Synthetic Spotify API objects, shaped like the real responses, for benchmarks."""
+
+import random
+
+# the real available_markets list has about 180 entries, that's what makes the
+# raw track objects so large
+MARKETS = [f"{a}{b}" for a in "ABCDEFGHIJKLMNOP" for b in "ABCDEFGHIJK"][:180]
+
+
+def fake_artist(number):
+    """Return a simplified artist object."""
+    artist_id = f"artist{number:018d}"[:22]
+    return {
+        "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"},
+        "href": f"https://api.spotify.com/v1/artists/{artist_id}",
+        "id": artist_id,
+        "name": f"Artist {number}",
+        "type": "artist",
+        "uri": f"spotify:artist:{artist_id}",
+    }
+
+
+def fake_album(number, artists):
+    """Return a simplified album object."""
+    album_id = f"album{number:017d}"[:22]
+    return {
+        "album_type": random.choice(["album", "single", "compilation"]),
+        "artists": artists,
+        "available_markets": MARKETS,
+        "external_urls": {"spotify": f"https://open.spotify.com/album/{album_id}"},
+        "href": f"https://api.spotify.com/v1/albums/{album_id}",
+        "id": album_id,
+        "images": [
+            {
+                "height": size,
+                "url": f"https://i.scdn.co/image/{album_id}{size}",
+                "width": size,
+            }
+            for size in (640, 300, 64)
+        ],
+        "name": f"Album {number}",
+        "release_date": "2021-06-24",
+        "release_date_precision": "day",
+        "total_tracks": 12,
+        "type": "album",
+        "uri": f"spotify:album:{album_id}",
+    }
+
+
+def fake_track(number, albums=None, artists=None):
+    """Return a full track object, with an album of 1 in 10 tracks."""
+    albums = albums or max(number // 10, 1)
+    artists = artists or max(number // 5, 1)
+    track_artists = [fake_artist(number % artists), fake_artist((number * 7) % artists)]
+    track_id = f"track{number:017d}"[:22]
+    return {
+        "album": fake_album(number % albums, track_artists[:1]),
+        "artists": track_artists,
+        "available_markets": MARKETS,
+        "disc_number": 1,
+        "duration_ms": 120000 + (number * 7919) % 240000,
+        "explicit": False,
+        "external_ids": {"isrc": f"NL{number:010d}"},
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+        "href": f"https://api.spotify.com/v1/tracks/{track_id}",
+        "id": track_id,
+        "is_local": False,
+        "name": f"Track {number}",
+        "popularity": number % 100,
+        "preview_url": f"https://p.scdn.co/mp3-preview/{track_id}",
+        "track_number": 1 + number % 12,
+        "type": "track",
+        "uri": f"spotify:track:{track_id}",
+    }
+
+
+def fake_playlist_item(number, **kwargs):
+    """Return a playlist item (track with added_at/added_by) as in playlist_tracks."""
+    return {
+        "added_at": "2021-06-24T12:00:00Z",
+        "added_by": {"id": "user", "type": "user", "uri": "spotify:user:user"},
+        "is_local": False,
+        "primary_color": None,
+        "track": fake_track(number, **kwargs),
+        "video_thumbnail": {"url": None},
+    }
@@ -0,0 +1,90 @@
+"""Circuit breakers per Spotify API endpoint: stop calling an endpoint that fails."""
+
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreakers:
+    """
+    Keep track of the failures of each endpoint, and stop calling failing ones.
+
+    After failures failed (or slow) calls in a row, the circuit of the
+    endpoint opens: for cool_down seconds its calls fail right away (allow()
+    is False), instead of every user waiting for a timeout. After that one
+    call is let through (half open); if it succeeds the circuit closes, if it
+    fails (or ends without a result, see release) it opens again. A call
+    counts as failed if it takes longer than slow seconds, even if it
+    succeeds. Only the endpoints given are guarded (all if None), the others
+    are always called. Shared by all threads.
+    """
+
+    def __init__(self, failures=5, cool_down=30, slow=None, endpoints=None):
+        self.failures = failures
+        self.cool_down = cool_down
+        self.slow = slow
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+        # endpoint -> [state, failures in a row, opened at]
+        self._circuits = {}
+        self._opened = 0
+
+    def allow(self, endpoint):
+        """Return if a call to the endpoint may be sent (else it fails right away)."""
+        if self.endpoints is not None and endpoint not in self.endpoints:
+            return True
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None or circuit[0] == CLOSED:
+                return True
+            if circuit[0] == OPEN and time.monotonic() - circuit[2] >= self.cool_down:
+                # (only this call, the others fail until it's done)
+                circuit[0] = HALF_OPEN
+                return True
+            return False
+
+    def record(self, endpoint, ok, seconds=0):
+        """Record how a call to the endpoint went (and how long it took)."""
+        if self.endpoints is not None and endpoint not in self.endpoints:
+            return
+        if self.slow is not None and seconds > self.slow:
+            ok = False
+        with self._lock:
+            circuit = self._circuits.setdefault(endpoint, [CLOSED, 0, 0.0])
+            if ok:
+                circuit[:2] = [CLOSED, 0]
+                return
+            circuit[1] += 1
+            # (calls that were already running when it opened don't extend it)
+            if circuit[0] != OPEN and (
+                circuit[0] == HALF_OPEN or circuit[1] >= self.failures
+            ):
+                circuit[0], circuit[2] = OPEN, time.monotonic()
+                self._opened += 1
+
+    def release(self, endpoint):
+        """
+        End a call to the endpoint that has no result to record (e.g. a 429).
+
+        If it was the call let through while half open, the circuit opens
+        again (for another cool_down), so a later call is let through.
+        """
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is not None and circuit[0] == HALF_OPEN:
+                circuit[0], circuit[2] = OPEN, time.monotonic()
+
+    def stats(self):
+        """Return the circuits that aren't closed, and how often one opened."""
+        with self._lock:
+            return {
+                "circuits": {
+                    endpoint: circuit[0]
+                    for endpoint, circuit in self._circuits.items()
+                    if circuit[0] != CLOSED
+                },
+                "opened": self._opened,
+            }
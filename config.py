@@ -1,4 +1,5 @@
 """Flask and spotify configuration."""
+
 import os
 
 
@@ -6,11 +7,93 @@ import os
 class Config(object):
     """Flask base config, specifies general settings."""
 
-    SESSION_TYPE = "filesystem"
+    # "split" is our own session backend (session_backend.py), anything else
+    # is passed to Flask-Session
+    SESSION_TYPE = "split"
     SESSION_FILE_DIR = "./.flask_session/"
+    # session keys that are large and hardly change, stored (written) separately
+    SESSION_LARGE_KEYS = ["target_playlists", "target_playlist_ids"]
+    # the loaded tracks are stored next to the session, see track_store.py
+    TRACK_STORE_DIR = "./.track_store/"
+    # remove stored tracks of visitors that haven't been active for a day
+    TRACK_STORE_MAX_AGE = 24 * 60 * 60
+    # album labels and artist genres hardly change, so cache them for a week
+    METADATA_CACHE_PATH = "./.metadata_cache.sqlite"
+    METADATA_CACHE_TTL = 7 * 24 * 60 * 60
+    METADATA_CACHE_MEMORY_ENTRIES = 10000
+    METADATA_CACHE_DISK_ENTRIES = 500000
+    # maximum number of pages fetched from the Spotify API at the same time
+    SPOTIFY_MAX_CONCURRENCY = 8
+    # seconds the divide page waits for the snapshots of the target playlists
+    RENDER_LOOKUP_TIMEOUT = 5
+    # seconds a request of the divide page waits (in all) for metadata that
+    # wasn't prefetched; what isn't there in time is shown as 'n/a', and
+    # filled in by the page once it came in
+    RENDER_LOOKUP_BUDGET = 1.5
+    # the (optional) metadata endpoints aren't called for SPOTIFY_BREAKER_COOL_DOWN
+    # seconds after SPOTIFY_BREAKER_FAILURES calls in a row failed (or took
+    # longer than SPOTIFY_BREAKER_SLOW_CALL seconds), see circuit_breaker.py
+    SPOTIFY_BREAKER_ENDPOINTS = [
+        "GET albums",
+        "GET albums/{id}",
+        "GET artists",
+        "GET artists/{id}",
+        "GET audio-features",
+        "GET audio-features/{id}",
+        "GET audio-analysis/{id}",
+    ]
+    SPOTIFY_BREAKER_FAILURES = 5
+    SPOTIFY_BREAKER_COOL_DOWN = 30
+    SPOTIFY_BREAKER_SLOW_CALL = 3
+    # the divide page is shown once the first page of the source is in, the
+    # other pages load in the background and are added in chunks (at most
+    # every SOURCE_CHUNK_SECONDS), SOURCE_LOAD_CONCURRENCY pages at a time (of
+    # the SPOTIFY_MAX_CONCURRENCY); a load that made no progress for
+    # SOURCE_LOAD_STALE seconds (e.g. the worker restarted) is given up
+    SOURCE_CHUNK_SECONDS = 1
+    SOURCE_LOAD_CONCURRENCY = 4
+    SOURCE_LOAD_STALE = 60
+    # the audio analysis (key and mode confidence, sections) is too slow to
+    # fetch for the divide page, so it's fetched for the next
+    # AUDIO_ANALYSIS_AHEAD tracks in the background (AUDIO_ANALYSIS_WORKERS at
+    # a time, at most AUDIO_ANALYSIS_MAX_PENDING waiting) and shown once it's
+    # cached; it never changes, so it's cached for a month
+    AUDIO_ANALYSIS_AHEAD = 25
+    AUDIO_ANALYSIS_WORKERS = 2
+    AUDIO_ANALYSIS_MAX_PENDING = 200
+    AUDIO_ANALYSIS_CACHE_TTL = 30 * 24 * 60 * 60
+    AUDIO_ANALYSIS_CACHE_DISK_ENTRIES = 200000
+    # reuse the list of playlists of a user for 5 minutes before checking for
+    # changes (add ?refresh=1 to step 1 or 2 to check right away)
+    PLAYLIST_INDEX_MAX_AGE = 5 * 60
+    # the Spotify clients of the users share one pool of (keep-alive) connections
+    SPOTIFY_POOL_SIZE = 32
+    SPOTIFY_MAX_CLIENTS = 1000
+    # calls per second (and at once) to the Spotify API of the worker; on a
+    # 429 all calls wait for the Retry-After (at most SPOTIFY_MAX_PAUSE seconds)
+    SPOTIFY_RATE_LIMIT = 20
+    SPOTIFY_RATE_BURST = 40
+    SPOTIFY_MAX_PAUSE = 60
+    # the tokens of all users, removed when not used for a day
+    TOKEN_STORE_PATH = "./.spotify_tokens.sqlite"
+    TOKEN_MAX_AGE = 24 * 60 * 60
+    # divide actions are sent to Spotify in batches; when a user has this many
+    # pending, or after this many idle seconds (or when leaving the divide page)
+    ACTION_QUEUE_FLUSH_SIZE = 100
+    ACTION_QUEUE_IDLE_SECONDS = 3
+    ACTION_QUEUE_RETRIES = 3
+    # /metrics needs "Authorization: Bearer <METRICS_TOKEN>" if it's set; add a
+    # Server-Timing header (time spent on Spotify, session, rendering) if True
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    SERVER_TIMING = os.environ.get("SERVER_TIMING") == "1"
     SECRET_KEY = os.environ.get("SECRET_SESSION_KEY")
 
     # SPOTIFY
+    # (other urls only to test or benchmark against benchmarks/mock_api.py)
+    SPOTIFY_API_URL = os.environ.get("SPOTIFY_API_URL", "https://api.spotify.com/v1/")
+    SPOTIFY_ACCOUNTS_URL = os.environ.get(
+        "SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com"
+    )
     CLIENT_ID = os.environ.get("SPOTIPY_CLIENT_ID")
     CLIENT_SECRET = os.environ.get("SPOTIPY_CLIENT_SECRET")
     SCOPE = (
@@ -40,6 +123,7 @@ class DevelopmentConfig(Config):
     DEBUG = True
     SHOW_DIALOG = True
     FLASK_ENV = "development"
+    SERVER_TIMING = True
     # REDIRECT_URI = "http://192.168.1.21:5000/login"
     REDIRECT_URI = "http://192.168.1.17:5000/login"
 
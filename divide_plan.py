@@ -0,0 +1,250 @@
+"""Divide plans: apply a whole track -> playlists mapping in one background job."""
+
+import csv
+import io
+import json
+import time
+from collections import OrderedDict
+from functools import partial
+
+from background import BackgroundJobs
+from pagination import chunks
+
+ACTIONS = ("move", "copy", "remove")
+
+# plans larger than this are refused, split them up
+MAX_PLAN_TRACKS = 10000
+# times the source playlist is listed when it changes while it's listed
+SNAPSHOT_ATTEMPTS = 3
+
+
+class PlanError(ValueError):
+    """The uploaded plan can't be read (the message is shown to the user)."""
+
+
+def track_uri(value):
+    """Return the track uri of a track uri, id or open.spotify.com link."""
+    value = value.strip()
+    if value.startswith("spotify:track:"):
+        return value
+    if "open.spotify.com/track/" in value:
+        value = value.split("open.spotify.com/track/")[1].split("?")[0]
+    if not value.isalnum():
+        raise PlanError(f"'{value}' is not a Spotify track.")
+    return f"spotify:track:{value}"
+
+
+def playlist_id(value):
+    """Return the playlist id of a playlist id, uri or open.spotify.com link."""
+    value = value.strip()
+    if value.startswith("spotify:playlist:"):
+        value = value[len("spotify:playlist:") :]
+    if "open.spotify.com/playlist/" in value:
+        value = value.split("open.spotify.com/playlist/")[1].split("?")[0]
+    if not value.isalnum():
+        raise PlanError(f"'{value}' is not a Spotify playlist.")
+    return value
+
+
+def parse_plan(text, default_action="move"):
+    """
+    Read a plan, as JSON or CSV, and return a list of (track uri, playlist ids, action).
+
+    JSON: {"action": "move", "tracks": [{"uri": ..., "playlists": [...],
+    "action": ...}]} (action per track is optional), or a plain mapping
+    {track uri: [playlist ids]}.
+    CSV: rows of track, playlists (separated by ';'), action (optional), with
+    or without a header row.
+    """
+    text = text.strip()
+    if not text:
+        raise PlanError("The plan is empty.")
+
+    if text[0] in "{[":
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise PlanError(f"The plan is not valid JSON ({e}).")
+        if isinstance(data, dict) and "tracks" in data:
+            default_action = data.get("action", default_action)
+            if not isinstance(data["tracks"], list) or not all(
+                isinstance(entry, dict) for entry in data["tracks"]
+            ):
+                raise PlanError(
+                    "The tracks of the JSON plan must be a list of objects."
+                )
+            rows = [
+                (entry.get("uri", ""), entry.get("playlists", []), entry.get("action"))
+                for entry in data["tracks"]
+            ]
+        elif isinstance(data, dict):
+            rows = [(uri, playlists, None) for uri, playlists in data.items()]
+        else:
+            raise PlanError("The JSON plan must be an object.")
+    else:
+        rows = []
+        for row in csv.reader(io.StringIO(text)):
+            if not row or not row[0].strip():
+                continue
+            # skip a header row
+            if not rows and row[0].strip().lower() in ("track", "uri", "track_uri"):
+                continue
+            playlists = row[1].split(";") if len(row) > 1 else []
+            rows.append((row[0], playlists, row[2] if len(row) > 2 else None))
+
+    if len(rows) > MAX_PLAN_TRACKS:
+        raise PlanError(f"The plan has more than {MAX_PLAN_TRACKS} tracks.")
+
+    plan = []
+    for uri, playlists, action in rows:
+        if not isinstance(uri, str):
+            raise PlanError(f"'{uri}' is not a Spotify track.")
+        if not isinstance(playlists, list) or not all(
+            isinstance(value, str) for value in playlists
+        ):
+            raise PlanError(f"The playlists of '{uri}' must be a list of playlists.")
+        if not isinstance(action or default_action, str):
+            raise PlanError(f"The action of '{uri}' must be move, copy or remove.")
+        action = (action or default_action).strip().lower()
+        if action not in ACTIONS:
+            raise PlanError(f"Unknown action '{action}', use move, copy or remove.")
+        playlists = [playlist_id(value) for value in playlists if value.strip()]
+        if action != "remove" and not playlists:
+            raise PlanError(f"No playlists to {action} '{uri}' to.")
+        plan.append((track_uri(uri), playlists, action))
+    return plan
+
+
+class DividePlanRunner(BackgroundJobs):
+    """
+    Run divide plans in the background, and keep their progress.
+
+    All additions are grouped per playlist, in batches of 100. Removals from
+    the source are done after the additions: for Liked Songs in batches of
+    50; for a playlist, the positions of the tracks are looked up in the
+    playlist, and removed from the last position to the first, in batches
+    of 100 pinned to the snapshot_id they were looked up in (see
+    _playlist_items), so every position is exactly the one that was looked
+    up. The progress is the part 'divide_plan' of the track store (see
+    BackgroundJobs), with the errors of the plan; one plan per user at a time.
+    """
+
+    part = "divide_plan"
+
+    def __init__(
+        self, get_client, paginator, track_store, max_workers=2, scheduler=None
+    ):
+        super().__init__(
+            get_client,
+            track_store,
+            max_workers=max_workers,
+            scheduler=scheduler,
+            name="divide_plan",
+        )
+        self.paginator = paginator
+
+    def start(self, uid, plan, source_playlist):
+        """Start running the plan in the background, return its progress."""
+        # (dicts as ordered sets, a track is only added/removed once)
+        adds = OrderedDict()
+        removes = {}
+        for uri, playlists, action in plan:
+            if action in ("move", "copy"):
+                for target_playlist_id in playlists:
+                    adds.setdefault(target_playlist_id, {})[uri] = True
+            if action in ("move", "remove"):
+                removes[uri] = True
+        adds = OrderedDict((key, list(uris)) for key, uris in adds.items())
+        removes = list(removes)
+
+        calls = sum(len(chunks(uris, 100)) for uris in adds.values())
+        calls += len(chunks(removes, 50 if source_playlist == "liked_songs" else 100))
+        return self._start(
+            uid,
+            adds,
+            removes,
+            source_playlist,
+            tracks=len(plan),
+            calls=calls,
+            calls_done=0,
+            added=0,
+            removed=0,
+            errors=[],
+            started_at=time.time(),
+        )
+
+    def _fail(self, progress, message):
+        progress["errors"].append(message)
+
+    def _job(self, uid, progress, spotify_client, adds, removes, source_playlist):
+        for target_playlist_id, uris in adds.items():
+            for uris_chunk in chunks(uris, 100):
+                spotify_client.playlist_add_items(target_playlist_id, uris_chunk)
+                progress["added"] += len(uris_chunk)
+                progress["calls_done"] += 1
+                self._save(uid, progress)
+
+        if source_playlist == "liked_songs":
+            for uris_chunk in chunks(removes, 50):
+                spotify_client.current_user_saved_tracks_delete(uris_chunk)
+                progress["removed"] += len(uris_chunk)
+                progress["calls_done"] += 1
+                self._save(uid, progress)
+        elif removes:
+            self._remove_from_playlist(
+                uid, progress, spotify_client, source_playlist, removes
+            )
+
+    def _remove_from_playlist(self, uid, progress, spotify_client, playlist, removes):
+        snapshot_id, items = self._playlist_items(spotify_client, playlist)
+        removes = set(removes)
+        positions = [
+            (item["track"]["uri"], position)
+            for position, item in enumerate(items)
+            if item.get("track") and item["track"].get("uri") in removes
+        ]
+        positions.sort(key=lambda position: position[1], reverse=True)
+        progress["calls"] = progress["calls_done"] + len(chunks(positions, 100))
+
+        for positions_chunk in chunks(positions, 100):
+            result = spotify_client.playlist_remove_specific_occurrences_of_items(
+                playlist,
+                [
+                    {"uri": uri, "positions": [position]}
+                    for uri, position in positions_chunk
+                ],
+                snapshot_id=snapshot_id,
+            )
+            snapshot_id = result["snapshot_id"]
+            progress["removed"] += len(positions_chunk)
+            progress["calls_done"] += 1
+            self._save(uid, progress)
+
+    def _playlist_items(self, spotify_client, playlist):
+        """
+        Return the snapshot_id of the playlist and its items (their track uris).
+
+        The items are listed in parallel calls, so the snapshot_id is read
+        before and after: if the playlist changed in between (e.g. by the
+        queued actions of the divide page), the items are listed again, so
+        the positions are the ones of the snapshot the removes are pinned to.
+        """
+        for _ in range(SNAPSHOT_ATTEMPTS):
+            snapshot_id = self._snapshot_id(spotify_client, playlist)
+            items = self.paginator.fetch_all(
+                partial(
+                    spotify_client.playlist_items,
+                    playlist,
+                    fields="items(track(uri)),total",
+                ),
+                100,
+            )
+            if self._snapshot_id(spotify_client, playlist) == snapshot_id:
+                return snapshot_id, items
+        raise RuntimeError(
+            "The source playlist kept changing, no tracks were removed from it."
+        )
+
+    @staticmethod
+    def _snapshot_id(spotify_client, playlist):
+        return spotify_client.playlist(playlist, fields="snapshot_id")["snapshot_id"]
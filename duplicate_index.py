@@ -0,0 +1,114 @@
+"""Duplicates in the loaded source tracks: the same recording more than once."""
+
+import re
+from array import array
+
+# a title without what's in brackets, or after ' - ': '(feat. ...)', ' - Remastered'
+VERSION = re.compile(r"\([^)]*\)|\[[^\]]*\]|\s-\s.*$")
+NOT_A_WORD = re.compile(r"\W+")
+
+# tracks with the same title and artist are similar if their durations are
+# within about this many ms (a single/radio edit, a remaster)
+DURATION_BUCKET_MS = 2000
+
+
+def normalize(text):
+    """Return the text without versions and punctuation, in lower case."""
+    return NOT_A_WORD.sub(" ", VERSION.sub("", text or "")).strip().casefold()
+
+
+class DuplicateIndex:
+    """
+    Which loaded tracks (by position) are duplicates of each other.
+
+    Tracks with the same id or the same ISRC are the same recording (copies);
+    tracks with the same normalized title and first artist, and about the
+    same duration, are similar (e.g. the single and the album version). The
+    groups are found in one pass over the tracks (union-find on a dict per
+    key), so building it is linear, and only the groups with more than one
+    track are kept, with an array of the group per position.
+    """
+
+    def __init__(self, tracks):
+        self.size = len(tracks)
+        parent = array("i", range(self.size))
+
+        def find(position):
+            while parent[position] != position:
+                parent[position] = parent[parent[position]]
+                position = parent[position]
+            return position
+
+        def union(first, second):
+            if first == second:
+                return
+            first, second = find(first), find(second)
+            if first != second:
+                parent[max(first, second)] = min(first, second)
+
+        # same recording: same id, or same ISRC
+        first_of = {}
+        for track in tracks:
+            if track.skip:
+                continue
+            for key in (("id", track.id), ("isrc", track.isrc)):
+                if key[1]:
+                    union(first_of.setdefault(key, track.position), track.position)
+        _, self._copies = self._groups(tracks, find)
+
+        # similar: same title and first artist, about the same duration (the
+        # bucket of the track, and a lookup in the buckets next to it)
+        for track in tracks:
+            if track.skip:
+                continue
+            title = normalize(track.name)
+            artist = normalize(track.artist_names[0] if track.artist_names else "")
+            bucket = (track.duration_ms or 0) // DURATION_BUCKET_MS
+            key = (title, artist, bucket)
+            union(first_of.setdefault(key, track.position), track.position)
+            for near in ((title, artist, bucket - 1), (title, artist, bucket + 1)):
+                if near in first_of:
+                    union(first_of[near], track.position)
+        self._similar_of, self._similar = self._groups(tracks, find)
+
+    def _groups(self, tracks, find):
+        """Return the group per position (-1 if none) and the groups, of the unions."""
+        members = {}
+        for track in tracks:
+            if not track.skip:
+                members.setdefault(find(track.position), []).append(track.position)
+        groups = [group for group in members.values() if len(group) > 1]
+        group_of = array("i", [-1]) * self.size
+        for number, group in enumerate(groups):
+            for position in group:
+                group_of[position] = number
+        return group_of, groups
+
+    def similar(self, position, track_index):
+        """Return the positions of the tracks left like the one at the position."""
+        if not 0 <= position < self.size or self._similar_of[position] == -1:
+            return []
+        group = self._similar[self._similar_of[position]]
+        left = [member for member in group if member in track_index]
+        # (no duplicates anymore if the others are moved/removed)
+        return left if len(left) > 1 else []
+
+    def next(self, position, track_index):
+        """Return the position of the next duplicate left (wraps), or -1 if none."""
+        others = [
+            member
+            for member in self.similar(position, track_index)
+            if member != position
+        ]
+        if not others:
+            return -1
+        after = [member for member in others if member > position]
+        return after[0] if after else others[0]
+
+    def extra_copies(self, track_index):
+        """Return the positions of the copies left, except the first of each."""
+        extras = []
+        for group in self._copies:
+            left = [member for member in group if member in track_index]
+            extras.extend(left[1:])
+        return extras
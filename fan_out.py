@@ -0,0 +1,68 @@
+"""Run independent Spotify API calls at the same time, with one timeout for all."""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+import requests
+import spotipy
+
+
+class FanOut:
+    """
+    Run a number of independent calls concurrently, and wait for all of them.
+
+    The calls are run by a (bounded) pool of threads, shared by all requests
+    of the worker, so a fan-out takes about as long as its slowest call,
+    instead of the sum of all calls. Calls that fail, or that aren't done
+    within the timeout, have no result; the caller shows a default instead
+    (and can still use the result of a late call, see run).
+    The calls run in (a copy of) the context of the caller, so they can still
+    use flask.g (e.g. for the timings of the request).
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="fan_out"
+        )
+
+    def run(self, calls, timeout=None, on_late=None):
+        """
+        Run the calls (a dict of name -> function without arguments).
+
+        Return a dict of name -> result, of the calls that succeeded in time.
+        If on_late is given, on_late(name, result) is called (in the thread of
+        the call) when a call that wasn't done in time succeeds after all.
+        """
+        if not calls:
+            return {}
+
+        futures = {
+            name: self._executor.submit(contextvars.copy_context().run, call)
+            for name, call in calls.items()
+        }
+        wait(futures.values(), timeout=timeout)
+
+        results = {}
+        for name, future in futures.items():
+            # (a call that is still running is left to finish)
+            if not future.done():
+                if on_late is None:
+                    future.cancel()
+                else:
+                    future.add_done_callback(partial(self._late, on_late, name))
+                continue
+            try:
+                results[name] = future.result()
+            except (spotipy.exceptions.SpotifyException, requests.RequestException):
+                pass
+        return results
+
+    @staticmethod
+    def _late(on_late, name, future):
+        try:
+            result = future.result()
+        except (spotipy.exceptions.SpotifyException, requests.RequestException):
+            return
+        on_late(name, result)
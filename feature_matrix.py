@@ -0,0 +1,127 @@
+"""Audio features of all loaded tracks as one NumPy matrix, to filter and sort them."""
+
+from operator import itemgetter
+
+import numpy as np
+
+# the columns of the matrix, one row per loaded position
+COLUMNS = (
+    "tempo",
+    "key",
+    "mode",
+    "energy",
+    "danceability",
+    "valence",
+    "speechiness",
+    "acousticness",
+    "instrumentalness",
+    "liveness",
+    "popularity",
+)
+
+# the Camelot number of each Spotify key (0 is C), as on the divide page (get_key)
+CAMELOT_NUMBERS = np.array([8, 3, 10, 5, 12, 7, 2, 9, 4, 11, 6, 1])
+
+
+class FeatureMatrix:
+    """
+    The audio features (and popularity) of the loaded tracks, one row each.
+
+    The row of a track is its loaded position; tracks without audio features
+    (and skipped items) have NaN, so they never match a range. Filtering and
+    sorting are done on whole columns at once, so it takes milliseconds for
+    a source of 20k tracks, without any API call.
+    """
+
+    def __init__(self, tracks, features):
+        feature_values = itemgetter(*COLUMNS[:-1])
+        unknown = (np.nan,) * (len(COLUMNS) - 1)
+        rows = []
+        for track in tracks:
+            track_features = None if track.skip else features.get(track.id)
+            rows.append(
+                (feature_values(track_features) if track_features else unknown)
+                + (np.nan if track.skip else track.popularity or 0,)
+            )
+        self.values = np.array(rows, dtype=np.float32).reshape(
+            len(tracks), len(COLUMNS)
+        )
+
+    def column(self, name):
+        return self.values[:, COLUMNS.index(name)]
+
+    def select(
+        self,
+        bpm_min=None,
+        bpm_max=None,
+        camelot=None,
+        energy_min=None,
+        sort=None,
+        descending=False,
+    ):
+        """
+        Return the positions of the matching tracks, in the order to divide them.
+
+        camelot is a Camelot key (e.g. '8A'): the tracks in that key, or in one
+        that mixes well with it (one number up or down, or the other letter).
+        Energy is from 0 to 1. Sort is a column, or None for the playlist order.
+        """
+        match = np.ones(len(self.values), dtype=bool)
+        tempo = self.column("tempo")
+        if bpm_min is not None:
+            match &= tempo >= bpm_min
+        if bpm_max is not None:
+            match &= tempo <= bpm_max
+        if energy_min is not None:
+            match &= self.column("energy") >= energy_min
+        if camelot is not None:
+            match &= self.compatible_keys(camelot)
+
+        positions = np.flatnonzero(match)
+        if sort:
+            # (stable, so equal values stay in playlist order)
+            values = self.column(sort)[positions]
+            order = np.argsort(-values if descending else values, kind="stable")
+            positions = positions[order]
+        return positions.astype(np.int32)
+
+    def compatible_keys(self, camelot):
+        """Return which tracks have a key that mixes well with the Camelot key."""
+        number, mode = int(camelot[:-1]), 1 if camelot[-1].upper() == "B" else 0
+        keys = self.column("key")
+        known = (keys >= 0) & (keys <= 11)
+        numbers = np.where(
+            known, CAMELOT_NUMBERS[np.where(known, keys, 0).astype(int)], 0
+        )
+        modes = self.column("mode")
+
+        same_mode = known & (modes == mode)
+        # (12 and 1 are next to each other)
+        distance = np.abs(numbers - number)
+        return (same_mode & ((distance <= 1) | (distance == 11))) | (
+            known & (numbers == number)
+        )
+
+
+def step_in_order(order, live, position, forward=True):
+    """
+    Return the next (or previous) position in order that's left, -1 if none.
+
+    order are the positions to go through (see FeatureMatrix.select), live
+    the flag per loaded position if it's left (see TrackIndex.flags). Wraps
+    around, like the TrackIndex; from a position that isn't in order (any
+    more), it starts at the first (or last).
+    """
+    left = np.frombuffer(live, dtype=np.uint8)[order].astype(bool)
+    if not left.any():
+        return -1
+    at = np.flatnonzero(order == position)
+    if forward:
+        start = at[0] + 1 if at.size else 0
+        after = np.flatnonzero(left[start:])
+        index = start + after[0] if after.size else np.flatnonzero(left)[0]
+    else:
+        end = at[0] if at.size else len(order)
+        before = np.flatnonzero(left[:end])
+        index = before[-1] if before.size else np.flatnonzero(left)[-1]
+    return int(order[index])
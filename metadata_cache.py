@@ -0,0 +1,179 @@
+"""Two-tier cache (in-process LRU over a shared SQLite file) for Spotify metadata."""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MetadataCache:
+    """
+    Cache for rarely changing metadata, like album labels and artist genres.
+
+    The first tier is an LRU in the memory of the worker, the second tier is a
+    SQLite database on disk, which is shared by all (gunicorn) workers and
+    survives restarts. Both tiers expire entries after ttl seconds and are
+    bounded in size; the least recently used (memory) or first expiring
+    (disk) entries are evicted. Values must be JSON serializable.
+    """
+
+    # only count the rows on disk every so many writes, counting isn't free
+    EVICT_CHECK_INTERVAL = 500
+
+    def __init__(
+        self,
+        path,
+        namespace,
+        ttl,
+        max_memory_entries=10000,
+        max_disk_entries=500000,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS metadata_expires_at "
+                "ON metadata (namespace, expires_at)"
+            )
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads, so one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            # WAL lets the workers read while another worker writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        """Return the cached value of key, or None if not cached (or expired)."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Return a dict with the cached values of the keys that are cached."""
+        now = time.time()
+        found = {}
+        missing = []
+
+        with self._lock:
+            for key in keys:
+                cached = self._memory.get(key)
+                if cached and cached[0] > now:
+                    self._memory.move_to_end(key)
+                    found[key] = cached[1]
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+
+        # look the rest up on disk, in chunks to stay below sqlite's variable limit
+        for start in range(0, len(missing), 500):
+            chunk = missing[start : start + 500]
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT key, value, expires_at FROM metadata "
+                    f"WHERE namespace = ? AND key IN ({', '.join('?' * len(chunk))}) "
+                    "AND expires_at > ?",
+                    [self.namespace, *chunk, now],
+                )
+                .fetchall()
+            )
+            for key, value, expires_at in rows:
+                found[key] = json.loads(value)
+                self._remember(key, found[key], expires_at)
+
+        with self._lock:
+            disk_hits = len(found) - (len(keys) - len(missing))
+            self.disk_hits += disk_hits
+            self.misses += len(missing) - disk_hits
+
+        return found
+
+    def set(self, key, value):
+        """Cache value under key (in both tiers)."""
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        """Cache all key-value pairs of the dict values (in both tiers)."""
+        if not values:
+            return
+
+        expires_at = time.time() + self.ttl
+        for key, value in values.items():
+            self._remember(key, value, expires_at)
+
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO metadata (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (self.namespace, key, json.dumps(value), expires_at)
+                    for key, value in values.items()
+                ],
+            )
+
+        self._writes += len(values)
+        if self._writes >= self.EVICT_CHECK_INTERVAL:
+            self._writes = 0
+            self.evict()
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def evict(self):
+        """Remove expired entries from disk, and the first expiring if too many."""
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "DELETE FROM metadata WHERE namespace = ? AND expires_at <= ?",
+                (self.namespace, time.time()),
+            )
+            (count,) = connection.execute(
+                "SELECT COUNT(*) FROM metadata WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            if count > self.max_disk_entries:
+                connection.execute(
+                    "DELETE FROM metadata WHERE rowid IN ("
+                    " SELECT rowid FROM metadata WHERE namespace = ?"
+                    " ORDER BY expires_at LIMIT ?)",
+                    (self.namespace, count - self.max_disk_entries),
+                )
+
+    def stats(self):
+        """Return the hit and miss counters (and size of the memory tier)."""
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
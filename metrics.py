@@ -0,0 +1,176 @@
+"""In-process latency histograms, in the Prometheus text format, and Server-Timing."""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_app_context
+
+# seconds, from a lookup in memory to loading a huge library
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """Counts of observations per bucket (upper bound), with their count and sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    Latency histograms of the worker, per metric name and labels.
+
+    Every observation can also be given a timing name: then it's added to the
+    timings of the current request (in flask.g), to report in a Server-Timing
+    header. Gauges and counters kept elsewhere are read from a function when
+    the metrics are rendered.
+    The histograms are per worker process, like the rest of the app's state;
+    Prometheus adds up the workers.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._help = {}
+        self._histograms = {}  # name -> labels -> Histogram
+        self._gauges = {}  # name -> function returning {labels: value}
+        self._counters = {}  # name -> function returning {labels: value}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        """Set the help text of a metric."""
+        self._help[name] = help_text
+
+    def gauge(self, name, help_text, collect):
+        """Add a gauge; collect() returns {labels (a dict's items as tuple): value}."""
+        self._help[name] = help_text
+        self._gauges[name] = collect
+
+    def counter(self, name, help_text, collect):
+        """Add a counter (name ends in _total), collected like a gauge."""
+        self._help[name] = help_text
+        self._counters[name] = collect
+
+    def observe(self, name, seconds, timing=None, **labels):
+        """Add an observation of seconds to the histogram of name and labels."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            if key not in histograms:
+                histograms[key] = Histogram(self.buckets)
+            histograms[key].observe(seconds)
+
+        if timing and has_app_context():
+            g.setdefault("timings", []).append((timing, seconds))
+
+    @contextmanager
+    def time(self, name, timing=None, **labels):
+        """Observe the time spent in the with block."""
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - tic, timing=timing, **labels)
+
+    def timed(self, name, timing=None, **labels):
+        """Decorate a function, to observe the time of every call."""
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.time(name, timing=timing, **labels):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def server_timing(self, total=None):
+        """Return the Server-Timing header of the current request's timings."""
+        durations = {}
+        counts = {}
+        for timing, seconds in g.get("timings", []):
+            durations[timing] = durations.get(timing, 0) + seconds
+            counts[timing] = counts.get(timing, 0) + 1
+
+        entries = [
+            f'{timing};dur={1000 * seconds:.1f};desc="{counts[timing]}x"'
+            for timing, seconds in durations.items()
+        ]
+        if total is not None:
+            entries.append(f"total;dur={1000 * total:.1f}")
+        return ", ".join(entries)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = {
+                name: {
+                    key: (list(h.bucket_counts), h.count, h.sum)
+                    for key, h in by_labels.items()
+                }
+                for name, by_labels in self._histograms.items()
+            }
+
+        for name, by_labels in sorted(histograms.items()):
+            self._header(lines, name, "histogram")
+            for key, (bucket_counts, count, total) in sorted(by_labels.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    labels = format_labels(key + (("le", format_value(bound)),))
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+                labels = format_labels(key + (("le", "+Inf"),))
+                lines.append(f"{name}_bucket{labels} {count}")
+                lines.append(f"{name}_sum{format_labels(key)} {format_value(total)}")
+                lines.append(f"{name}_count{format_labels(key)} {count}")
+
+        for metric_type, collected in (
+            ("gauge", self._gauges),
+            ("counter", self._counters),
+        ):
+            for name, collect in sorted(collected.items()):
+                self._header(lines, name, metric_type)
+                for key, value in sorted(collect().items()):
+                    lines.append(f"{name}{format_labels(key)} {format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, metric_type):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+
+def format_labels(key):
+    """Return labels (tuple of name, value) as {name="value",...}."""
+    if not key:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in key
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value):
+    """Return a number as Prometheus writes it."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
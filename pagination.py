@@ -0,0 +1,73 @@
+"""Fetch all pages of a paged Spotify API endpoint in parallel."""
+
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+
+def chunks(items, size):
+    """Split the list of items in lists of (at most) size items."""
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+class Paginator:
+    """
+    Fetch all items of a paged endpoint, using the total of the first page.
+
+    Instead of following 'next' one page at a time, the remaining offsets are
+    fetched at the same time by a (bounded) pool of threads, which is shared
+    by all requests of the worker. So at most max_workers calls are made at
+    the same time. The pages are put back together in the original order.
+    The pages are fetched in (a copy of) the context of the caller.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="paginator"
+        )
+
+    def fetch_all(self, fetch_page, page_size):
+        """
+        Return all items of the endpoint, as one list.
+
+        fetch_page is called as fetch_page(limit=..., offset=...) and must return
+        a Spotify paging object (with 'items' and 'total').
+        """
+        first_page = fetch_page(limit=page_size, offset=0)
+        items = list(first_page["items"])
+        for page_items in self.pages(
+            fetch_page, page_size, first_page["total"], start=page_size
+        ):
+            items.extend(page_items)
+        return items
+
+    def pages(self, fetch_page, page_size, total, start=0, ahead=None):
+        """
+        Yield the items of each page from offset start up to total, in order.
+
+        The pages are fetched at the same time (like fetch_all), at most ahead
+        of them (all if None, so others can use the pool too), and each is
+        yielded as soon as it and the ones before it are in. The pages that
+        aren't fetched yet are cancelled if the caller stops early.
+        """
+        offsets = iter(range(start, total, page_size))
+        futures = deque()
+        try:
+            while True:
+                for offset in islice(offsets, (ahead or total) - len(futures)):
+                    futures.append(
+                        self._executor.submit(
+                            contextvars.copy_context().run,
+                            fetch_page,
+                            limit=page_size,
+                            offset=offset,
+                        )
+                    )
+                if not futures:
+                    return
+                yield futures.popleft().result()["items"]
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,51 @@
+"""Which tracks the target playlists contain already, to mark them when dividing."""
+
+
+class PlaylistMembership:
+    """
+    The track ids of each target playlist, with the snapshot_id they're from.
+
+    Loaded once per playlist, in the background (and again only when it's
+    changed by something else than the app, see fetch_targets and
+    merge_targets in app.py), and kept current when the app adds a track.
+    So 'does this playlist have the track' is a set lookup, instead of a
+    scan of the playlist. The number of items is kept
+    too, as a check that nothing else changed the playlist.
+    """
+
+    def __init__(self):
+        self._playlists = {}  # playlist id -> [snapshot_id, total, set of track ids]
+
+    def __contains__(self, playlist_id):
+        return playlist_id in self._playlists
+
+    def snapshot_id(self, playlist_id):
+        """Return the snapshot_id of the playlist when it was (last) loaded."""
+        return self._playlists[playlist_id][0] if playlist_id in self else None
+
+    def total(self, playlist_id):
+        """Return the number of items in the playlist (as far as the app knows)."""
+        return self._playlists[playlist_id][1] if playlist_id in self else None
+
+    def set(self, playlist_id, snapshot_id, total, track_ids):
+        """Set the track ids of the playlist, as of snapshot_id."""
+        self._playlists[playlist_id] = [snapshot_id, total, set(track_ids)]
+
+    def set_snapshot_id(self, playlist_id, snapshot_id):
+        """Set the snapshot_id of the playlist, when its track ids are still current."""
+        self._playlists[playlist_id][0] = snapshot_id
+
+    def keep(self, playlist_ids):
+        """Forget the playlists that aren't in playlist_ids (no targets anymore)."""
+        for playlist_id in set(self._playlists) - set(playlist_ids):
+            del self._playlists[playlist_id]
+
+    def contains(self, playlist_id, track_id):
+        """Return if the playlist has the track (False if it isn't loaded)."""
+        return playlist_id in self and track_id in self._playlists[playlist_id][2]
+
+    def add(self, playlist_id, track_id):
+        """Add the track to the playlist (the app added it)."""
+        if playlist_id in self:
+            self._playlists[playlist_id][1] += 1
+            self._playlists[playlist_id][2].add(track_id)
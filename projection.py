@@ -0,0 +1,118 @@
+"""Only keep (or ask for) the fields of a Spotify API response that are used."""
+
+from functools import wraps
+
+
+def parse_fields(fields):
+    """
+    Parse a fields expression of the Spotify API into a tree of field names.
+
+    The syntax of the fields parameter: field names separated by commas, a
+    dot to go into an object and parentheses for the fields of an object (or
+    of each object in a list), e.g. "total,items(added_at,track(id,album.id))".
+    The tree is a dict of field name -> tree of its fields, or None for all of
+    it. Raises ValueError if the expression isn't valid.
+    """
+    tree, end = _parse(fields, 0)
+    if end != len(fields):
+        raise ValueError(f"unexpected {fields[end]!r} at {end} in {fields!r}")
+    return tree
+
+
+def _parse(fields, position):
+    """Parse fields separated by commas, up to a closing parenthesis (or the end)."""
+    tree = {}
+    while True:
+        name, subtree, position = _parse_field(fields, position)
+        _merge(tree, name, subtree)
+        if position < len(fields) and fields[position] == ",":
+            position += 1
+        else:
+            return tree, position
+
+
+def _parse_field(fields, position):
+    """Parse one field: its name, and a dot or parentheses with its fields."""
+    start = position
+    while position < len(fields) and fields[position] not in ",.()":
+        position += 1
+    name = fields[start:position].strip()
+    if not name:
+        raise ValueError(f"missing a field name at {position} in {fields!r}")
+
+    if position < len(fields) and fields[position] == ".":
+        child, subtree, position = _parse_field(fields, position + 1)
+        return name, {child: subtree}, position
+    if position < len(fields) and fields[position] == "(":
+        subtree, position = _parse(fields, position + 1)
+        if position >= len(fields) or fields[position] != ")":
+            raise ValueError(f"missing ')' at {position} in {fields!r}")
+        return name, subtree, position + 1
+    return name, None, position
+
+
+def _merge(tree, name, subtree):
+    """Add the field to the tree (all of a field wins from some of it)."""
+    if name not in tree:
+        tree[name] = subtree
+    elif tree[name] is not None:
+        if subtree is None:
+            tree[name] = None
+        else:
+            for child, child_tree in subtree.items():
+                _merge(tree[name], child, child_tree)
+
+
+def project(value, tree):
+    """Return the fields of the tree of value (of each item if it's a list)."""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {
+            name: project(value[name], subtree)
+            for name, subtree in tree.items()
+            if name in value
+        }
+    return value
+
+
+class Projection:
+    """
+    The fields one call site reads of a response of the Spotify API.
+
+    Defined once per call site, as a fields expression (see parse_fields).
+    For an endpoint with a fields parameter, request asks the API for only
+    these fields, so less is sent and parsed; for other endpoints, trimmed
+    drops the rest right after parsing, so less is kept in memory.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.tree = parse_fields(fields)
+
+    def __call__(self, value):
+        """Return only the fields of the projection of value."""
+        return project(value, self.tree)
+
+    def request(self, call):
+        """Wrap an endpoint with a fields parameter, to ask for these fields."""
+
+        @wraps(call)
+        def requested(*args, **kwargs):
+            return call(*args, fields=self.fields, **kwargs)
+
+        return requested
+
+    def trimmed(self, call):
+        """Wrap an endpoint without a fields parameter, to drop the other fields."""
+
+        @wraps(call)
+        def trimmed(*args, **kwargs):
+            return self(call(*args, **kwargs))
+
+        return trimmed
+
+    def __repr__(self):
+        return f"Projection({self.fields!r})"
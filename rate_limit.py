@@ -0,0 +1,133 @@
+"""One scheduler for all Spotify API calls of the worker: rate, 429 pauses, fairness."""
+
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# priorities of the calls, the lower the sooner
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+class RequestScheduler:
+    """
+    Decide when each Spotify API call of the worker may be sent.
+
+    A token bucket keeps the calls at (on average) rate per second, with at
+    most burst at once. When Spotify answers 429, pause() stops all calls of
+    all users until the Retry-After has passed (and the bucket starts empty).
+    Calls that have to wait are queued per priority, and within a priority
+    per user: users take turns, so one user loading a huge playlist can't make
+    the others wait for all of its calls. Interactive calls (made while the
+    user waits for a page) go before background calls (like prefetching);
+    the priority of the calls is set with priority(); it's kept in a context
+    variable, so the pools that run calls in a copy of the context of the
+    caller (see Paginator and FanOut) make them with the same priority.
+    """
+
+    def __init__(self, rate, burst=None, max_pause=60):
+        self.rate = rate
+        self.burst = burst or rate
+        self.max_pause = max_pause
+
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+        # per priority: uid -> queue of waiting calls, in turn order of the users
+        self._queues = [OrderedDict() for _ in PRIORITIES]
+        self._priority = contextvars.ContextVar(
+            f"spotify_priority_{id(self)}", default=INTERACTIVE
+        )
+        self._pauses = 0
+
+    @contextmanager
+    def priority(self, priority):
+        """Give the calls in the with block (and in copies of its context) priority."""
+        token = self._priority.set(priority)
+        try:
+            yield
+        finally:
+            self._priority.reset(token)
+
+    def acquire(self, uid):
+        """Wait until the user may send a call (and take a token from the bucket)."""
+        priority = self._priority.get()
+        ticket = object()
+        with self._condition:
+            self._queues[priority].setdefault(uid, deque()).append(ticket)
+            while True:
+                wait = self._wait_time()
+                if wait <= 0 and self._next() is ticket:
+                    break
+                # (when a token is available, the next call in line takes it and
+                # wakes the others up)
+                self._condition.wait(wait if wait > 0 else None)
+
+            self._tokens -= 1
+            self._dispatched()
+            self._condition.notify_all()
+
+    def _wait_time(self):
+        """Refill the bucket, return the seconds until a call may be sent."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def _next(self):
+        """Return the call that is next in line."""
+        for queue in self._queues:
+            if queue:
+                return next(iter(queue.values()))[0]
+        return None
+
+    def _dispatched(self):
+        """Remove the next call from its queue; it's the next user's turn."""
+        for queue in self._queues:
+            if queue:
+                uid, tickets = next(iter(queue.items()))
+                tickets.popleft()
+                if tickets:
+                    queue.move_to_end(uid)
+                else:
+                    del queue[uid]
+                return
+
+    def pause(self, seconds):
+        """Stop sending calls for (at most max_pause) seconds, e.g. after a 429."""
+        with self._condition:
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + min(seconds, self.max_pause)
+            )
+            # don't send a full burst right after the pause
+            self._tokens = 0
+            self._pauses += 1
+
+    def stats(self):
+        """Return the number of waiting calls (per priority), pauses and pause left."""
+        with self._condition:
+            return {
+                "waiting": [
+                    sum(len(tickets) for tickets in queue.values())
+                    for queue in self._queues
+                ],
+                "pauses": self._pauses,
+                "paused_for": max(self._paused_until - time.monotonic(), 0),
+            }
+
+
+def retry_after(spotify_exception, default=1):
+    """Return the seconds to wait of a 429 SpotifyException (its Retry-After)."""
+    headers = getattr(spotify_exception, "headers", None) or {}
+    try:
+        return max(float(headers.get("Retry-After", default)), 0)
+    except ValueError:
+        return default
@@ -0,0 +1,238 @@
+"""Server-side session, large and small parts stored apart, only changes written."""
+
+import os
+import pickle
+import secrets
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+
+class SplitSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and what was loaded from disk."""
+
+    def __init__(self, initial=None, sid=None, small_data=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # the stored bytes of the small part and the loaded large values, to
+        # find out what changed when saving
+        self.small_data = small_data
+        self.loaded = dict(initial or {})
+
+
+class SplitSessionInterface(SessionInterface):
+    """
+    File based server-side session, split in a small part and large parts.
+
+    Each key in large_keys (like the target playlists) is stored in its own
+    file, all other (small) keys together in one file. A large part is only
+    written when it was (re)assigned in the request, so just like with the
+    default flask session, change a large value by assigning a new one, not
+    by changing it in place. The small part is only written when its
+    serialized bytes differ. Parts are pickled, and compressed if they're
+    larger than compress_from bytes. The decoded large parts are kept in
+    memory, so they're only read again when another worker changed them.
+    """
+
+    SMALL_PART = "_small"
+    # touch the small part (to keep the session alive) at most once a minute
+    TOUCH_INTERVAL = 60
+
+    def __init__(
+        self,
+        folder,
+        large_keys=(),
+        compress_level=1,
+        compress_from=1024,
+        max_memory_entries=256,
+    ):
+        self.folder = folder
+        self.large_keys = tuple(large_keys)
+        self.compress_level = compress_level
+        self.compress_from = compress_from
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()  # (sid, key) -> (mtime_ns, value)
+        self._lock = threading.Lock()
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    # (de)serialization of the parts
+
+    def dumps(self, value):
+        """Serialize a part to compact (and if large, compressed) bytes."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) >= self.compress_from:
+            return b"z" + zlib.compress(data, self.compress_level)
+        return b"p" + data
+
+    def loads(self, data):
+        """Deserialize a part serialized with dumps."""
+        if data[:1] == b"z":
+            return pickle.loads(zlib.decompress(data[1:]))
+        return pickle.loads(data[1:])
+
+    def _path(self, sid, part):
+        return os.path.join(self.folder, f"{sid}.{part}")
+
+    def _read(self, sid, part):
+        try:
+            with open(self._path(sid, part), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def _write(self, sid, part, data):
+        path = self._path(sid, part)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        return os.stat(path).st_mtime_ns
+
+    def _delete(self, sid, parts=None):
+        for part in parts or (self.SMALL_PART, *self.large_keys):
+            with self._lock:
+                self._memory.pop((sid, part), None)
+            try:
+                os.remove(self._path(sid, part))
+            except OSError:
+                pass
+
+    def _load_large(self, sid, key):
+        """Return the large part from memory (if not changed on disk), or disk."""
+        try:
+            mtime_ns = os.stat(self._path(sid, key)).st_mtime_ns
+        except OSError:
+            return None
+
+        with self._lock:
+            cached = self._memory.get((sid, key))
+            if cached and cached[0] == mtime_ns:
+                self._memory.move_to_end((sid, key))
+                return cached
+
+        data = self._read(sid, key)
+        if data is None:
+            return None
+        value = self.loads(data)
+        self._remember(sid, key, mtime_ns, value)
+        return mtime_ns, value
+
+    def _remember(self, sid, key, mtime_ns, value):
+        with self._lock:
+            self._memory[(sid, key)] = (mtime_ns, value)
+            self._memory.move_to_end((sid, key))
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    # session id in the cookie (signed)
+
+    def _signer(self, app):
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt="split-session")
+
+    def _sid_from_cookie(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return None
+        signer = self._signer(app)
+        if signer is None:
+            return cookie
+        try:
+            return signer.unsign(cookie).decode()
+        except BadSignature:
+            return None
+
+    # flask session interface
+
+    def open_session(self, app, request):
+        """Load the session of the cookie's session id, or start a new one."""
+        sid = self._sid_from_cookie(app, request)
+        if not sid or not sid.isalnum():
+            return SplitSession(sid=secrets.token_hex(16), new=True)
+
+        small_data = self._read(sid, self.SMALL_PART)
+        if small_data is None:
+            return SplitSession(sid=sid, new=True)
+
+        # expired sessions (not saved for a lifetime) start over
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        if os.path.getmtime(self._path(sid, self.SMALL_PART)) < time.time() - lifetime:
+            self._delete(sid)
+            return SplitSession(sid=sid, new=True)
+
+        data = self.loads(small_data)
+        for key in self.large_keys:
+            loaded = self._load_large(sid, key)
+            if loaded is not None:
+                data[key] = loaded[1]
+        return SplitSession(data, sid=sid, small_data=small_data)
+
+    def save_session(self, app, session, response):
+        """Write the parts of the session that changed, and set the cookie."""
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        name = self.get_cookie_name(app)
+
+        if not session:
+            if session.modified:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        small_data = self.dumps(
+            {key: value for key, value in session.items() if key not in self.large_keys}
+        )
+        small_path = self._path(session.sid, self.SMALL_PART)
+        if small_data != session.small_data:
+            self._write(session.sid, self.SMALL_PART, small_data)
+        elif os.path.getmtime(small_path) < time.time() - self.TOUCH_INTERVAL:
+            os.utime(small_path)
+
+        for key in self.large_keys:
+            if key not in session:
+                if key in session.loaded:
+                    self._delete(session.sid, [key])
+            elif session[key] is not session.loaded.get(key):
+                mtime_ns = self._write(session.sid, key, self.dumps(session[key]))
+                self._remember(session.sid, key, mtime_ns, session[key])
+
+        if not self.should_set_cookie(app, session) and not session.new:
+            return
+
+        signer = self._signer(app)
+        cookie = session.sid
+        if signer is not None:
+            cookie = signer.sign(session.sid).decode()
+        response.set_cookie(
+            name,
+            cookie,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def purge(self, max_age):
+        """Remove all sessions that haven't been saved for max_age seconds."""
+        oldest = time.time() - max_age
+        for filename in os.listdir(self.folder):
+            if filename.endswith(f".{self.SMALL_PART}"):
+                try:
+                    if os.path.getmtime(os.path.join(self.folder, filename)) < oldest:
+                        self._delete(filename.split(".")[0])
+                except OSError:
+                    pass
@@ -0,0 +1,142 @@
+"""Load the rest of a large source playlist in the background, after its first page."""
+
+import time
+from functools import partial
+
+from background import BackgroundJobs
+from projection import Projection
+from track_store import Track
+
+# what is read of a page of a source: the items (see Track.from_item), the
+# total (see Paginator) and next (see fetch_new_liked_songs in app.py)
+SOURCE_PAGE = Projection(f"items({Track.ITEM_FIELDS}),total,next")
+
+
+def source_pages(spotify_client, source_playlist):
+    """
+    Return the fetch_page function and page size of a source (see Paginator).
+
+    A page only has the fields of SOURCE_PAGE: a playlist asks the API for
+    only those, Liked Songs (which can't) drops the others once parsed.
+    """
+    if source_playlist == "liked_songs":
+        return SOURCE_PAGE.trimmed(spotify_client.current_user_saved_tracks), 50
+    # possibly 'playlist_items', we can also move podcasts, quite difficult tho.
+    return (
+        SOURCE_PAGE.request(partial(spotify_client.playlist_tracks, source_playlist)),
+        100,
+    )
+
+
+class SourceLoader(BackgroundJobs):
+    """
+    Fetch the pages after the first page of a source in the background.
+
+    The divide page is shown as soon as the first page is in (see load_source
+    in app.py), the other pages are fetched by the paginator, concurrency at
+    a time (its pool is shared with the requests). They are turned into
+    Tracks (numbered on from the first page) and written to the track store
+    in chunks, at most every chunk_seconds: the part 'source_chunk<n>', with
+    the audio features of the tracks if fetch_features is given (called as
+    fetch_features(spotify_client, uid, tracks), which may also fill the
+    metadata caches). The requests of the user add the chunks to the loaded
+    tracks (they are the only ones that change those). The progress is the
+    part 'source_loading' (see BackgroundJobs); one source per user at a
+    time, a load stops once another one is started (or it's forgotten).
+    """
+
+    part = "source_loading"
+
+    def __init__(
+        self,
+        get_client,
+        paginator,
+        track_store,
+        max_workers=2,
+        scheduler=None,
+        fetch_features=None,
+        chunk_seconds=1,
+        concurrency=4,
+    ):
+        super().__init__(
+            get_client,
+            track_store,
+            max_workers=max_workers,
+            scheduler=scheduler,
+            name="source_loader",
+        )
+        self.paginator = paginator
+        self.fetch_features = fetch_features
+        self.chunk_seconds = chunk_seconds
+        self.concurrency = concurrency
+
+    def take_chunk(self, uid, number):
+        """Return chunk number of the load (its id, tracks and features), once."""
+        chunk = self.track_store.get(uid, f"source_chunk{number}")
+        self.track_store.delete(uid, f"source_chunk{number}")
+        return chunk
+
+    def forget(self, uid):
+        """Forget the load of the user (a running load stops), and its chunks."""
+        progress = self.progress(uid)
+        if progress is None:
+            return
+        with self._lock:
+            self.track_store.delete(uid, self.part)
+        for number in range(progress["chunks"]):
+            self.track_store.delete(uid, f"source_chunk{number}")
+
+    def start(self, uid, source_playlist, loaded, total):
+        """Start loading the source after the loaded items, return the progress."""
+        return self._start(
+            uid,
+            playlist=source_playlist,
+            loaded=loaded,
+            total=total,
+            chunks=0,
+            error=None,
+        )
+
+    def _job(self, uid, progress, spotify_client):
+        fetch_page, page_size = source_pages(spotify_client, progress["playlist"])
+        pages = self.paginator.pages(
+            fetch_page,
+            page_size,
+            progress["total"],
+            start=progress["loaded"],
+            ahead=self.concurrency,
+        )
+        tracks = []
+        written_at = time.monotonic()
+        try:
+            for items in pages:
+                current = self.progress(uid)
+                if not current or current["id"] != progress["id"]:
+                    return  # (another source is loading now)
+                position = progress["loaded"] + len(tracks)
+                tracks.extend(
+                    Track.from_item(item, position + number)
+                    for number, item in enumerate(items)
+                )
+                if time.monotonic() - written_at >= self.chunk_seconds:
+                    self._write_chunk(uid, progress, spotify_client, tracks)
+                    tracks = []
+                    written_at = time.monotonic()
+            if tracks:
+                self._write_chunk(uid, progress, spotify_client, tracks)
+        finally:
+            pages.close()
+
+    def _write_chunk(self, uid, progress, spotify_client, tracks):
+        """Write the tracks as the next chunk (first the chunk, then the progress)."""
+        features = {}
+        if self.fetch_features is not None:
+            features = self.fetch_features(spotify_client, uid, tracks)
+        self.track_store.set(
+            uid,
+            f"source_chunk{progress['chunks']}",
+            {"id": progress["id"], "tracks": tracks, "features": features},
+        )
+        progress["chunks"] += 1
+        progress["loaded"] += len(tracks)
+        self._save(uid, progress)
@@ -0,0 +1,188 @@
+"""Spotify API clients: one per user, sharing one keep-alive connection pool."""
+
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+import spotipy
+from urllib3.util.retry import Retry
+
+from rate_limit import retry_after
+
+
+def build_http_session(pool_size):
+    """
+    Return a requests session to share between all Spotify clients of the worker.
+
+    The retries are the same as spotipy uses for the sessions it creates,
+    except for 429 (too many requests): that is left to the RequestScheduler,
+    so all users wait for the Retry-After together, see Spotify below.
+    """
+    http_session = requests.Session()
+    retry = Retry(
+        total=spotipy.Spotify.max_retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+        status=spotipy.Spotify.max_retries,
+        backoff_factor=0.3,
+        status_forcelist=[
+            code for code in spotipy.Spotify.default_retry_codes if code != 429
+        ],
+        # (otherwise urllib3 still retries a 429 that has a Retry-After)
+        respect_retry_after_header=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=4, pool_maxsize=pool_size, max_retries=retry
+    )
+    http_session.mount("https://", adapter)
+    http_session.mount("http://", adapter)
+    return http_session
+
+
+def endpoint_name(method, url):
+    """Return the endpoint of a call without its ids, e.g. GET playlists/{id}/tracks."""
+    parts = urlparse(url).path.strip("/").split("/")
+    if parts[0] == "v1":
+        parts = parts[1:]
+    # resource/{id}/subresource, except for the endpoints of the current user
+    if parts[0] != "me" and len(parts) > 1:
+        parts[1] = "{id}"
+    return f"{method} {'/'.join(parts)}"
+
+
+class Spotify(spotipy.Spotify):
+    """
+    Spotify client that doesn't close its (shared) HTTP session when discarded.
+
+    If it has a scheduler, every call waits for its turn (as a call of uid);
+    on a 429 the scheduler pauses all calls and the call is sent again (at
+    most retries times). If it has metrics, the time of every call (per
+    endpoint) and of waiting for the scheduler is observed. If it has
+    breakers, a call to an endpoint whose circuit is open fails right away
+    (with a 503), see circuit_breaker.py.
+    """
+
+    scheduler = None
+    metrics = None
+    breakers = None
+    uid = None
+    retries = 3
+
+    def __del__(self):
+        pass
+
+    def _internal_call(self, method, url, payload, params):
+        endpoint = endpoint_name(method, url)
+        if self.breakers is not None and not self.breakers.allow(endpoint):
+            raise spotipy.exceptions.SpotifyException(
+                503, -1, f"{endpoint}: not called, it failed too often (circuit open)"
+            )
+        for attempt in range(self.retries + 1):
+            if self.scheduler is not None:
+                tic = time.perf_counter()
+                self.scheduler.acquire(self.uid)
+                self._observe("spotify_scheduler_wait_seconds", tic, "spotify-wait")
+
+            tic = time.perf_counter()
+            status = "error"
+            try:
+                # (spotipy removes content_type from the params, so pass a copy)
+                result = super()._internal_call(method, url, payload, dict(params))
+                status = "ok"
+                return result
+            except spotipy.exceptions.SpotifyException as e:
+                status = str(e.http_status)
+                if e.http_status == 429 and not e.headers:
+                    # (spotipy raises a 429 without headers when the retries
+                    # of the session ran out, but it never retries a 429)
+                    status = "retries"
+                if self.scheduler is None or status != "429" or attempt == self.retries:
+                    raise
+                self.scheduler.pause(retry_after(e))
+            finally:
+                self._observe(
+                    "spotify_api_call_seconds",
+                    tic,
+                    "spotify",
+                    endpoint=endpoint,
+                    status=status,
+                )
+                # (a 429 is the rate limit, not the endpoint failing; other
+                # client errors mean the endpoint works)
+                if self.breakers is not None and status == "429":
+                    self.breakers.release(endpoint)
+                elif self.breakers is not None:
+                    self.breakers.record(
+                        endpoint,
+                        ok=status == "ok" or status.isdigit() and int(status) < 500,
+                        seconds=time.perf_counter() - tic,
+                    )
+
+    def _observe(self, name, tic, timing, **labels):
+        if self.metrics is not None:
+            self.metrics.observe(
+                name, time.perf_counter() - tic, timing=timing, **labels
+            )
+
+
+class ClientRegistry:
+    """
+    Keep one Spotify client per user (uuid) in the worker.
+
+    Every user has its own auth manager and cache handler, so tokens are never
+    shared between users; only the HTTP session (connection pool) is shared.
+    The least recently used clients are dropped when there are too many.
+    All clients send their calls through the scheduler (if given), to api_url
+    (if given, instead of spotipy's), observe them in metrics (if given) and
+    skip endpoints that fail (with breakers, if given).
+    """
+
+    def __init__(
+        self,
+        make_auth_manager,
+        http_session,
+        max_clients=1000,
+        scheduler=None,
+        api_url=None,
+        metrics=None,
+        breakers=None,
+    ):
+        self.make_auth_manager = make_auth_manager
+        self.http_session = http_session
+        self.max_clients = max_clients
+        self.scheduler = scheduler
+        self.api_url = api_url
+        self.metrics = metrics
+        self.breakers = breakers
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+        """Return the Spotify client of the user, create it if needed."""
+        with self._lock:
+            spotify_client = self._clients.get(uid)
+            if spotify_client is None:
+                spotify_client = Spotify(
+                    auth_manager=self.make_auth_manager(uid),
+                    requests_session=self.http_session,
+                )
+                spotify_client.scheduler = self.scheduler
+                spotify_client.metrics = self.metrics
+                spotify_client.breakers = self.breakers
+                spotify_client.uid = uid
+                if self.api_url:
+                    spotify_client.prefix = self.api_url
+                self._clients[uid] = spotify_client
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(uid)
+            return spotify_client
+
+    def discard(self, uid):
+        """Forget the client of the user (e.g. on log out)."""
+        with self._lock:
+            self._clients.pop(uid, None)
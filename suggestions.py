@@ -0,0 +1,174 @@
+"""Suggest target playlists for a track, by the audio features and genres they have."""
+
+import numpy as np
+
+# the audio features compared (all from 0 to 1, tempo is scaled, see feature_vector)
+FEATURES = (
+    "energy",
+    "danceability",
+    "valence",
+    "speechiness",
+    "acousticness",
+    "instrumentalness",
+    "liveness",
+    "tempo",
+)
+MAX_TEMPO = 250
+
+# suggest at most this many playlists, with at least this score (0 to 1), that
+# have at least this many tracks (to compare with)
+TOP = 3
+MIN_SCORE = 0.75
+MIN_TRACKS = 3
+
+# tracks scored at the same time
+CHUNK = 1024
+
+
+def feature_vector(track_features):
+    """Return the audio features (see compact_features in app.py) as a vector."""
+    if not track_features or track_features.get("key") == -1:
+        return None
+    vector = np.array([track_features[name] for name in FEATURES], dtype=np.float64)
+    vector[-1] = min(vector[-1] / MAX_TEMPO, 1)
+    return vector
+
+
+class PlaylistCentroids:
+    """
+    The average audio features and the genres of each target playlist.
+
+    Kept as sums and counts per playlist, so adding a track (the app adds it)
+    only adds its features and genres, and the centroids never have to be
+    fetched again. Scoring tracks against all playlists is one vectorized
+    pass: the features score is 1 minus the mean absolute difference with
+    the centroid, the genre score the share of the playlist's tracks with
+    the genres of the track; the score is their average.
+    """
+
+    def __init__(self):
+        self.playlist_ids = []
+        self._row = {}  # playlist id -> row
+        self._genre_column = {}  # genre -> column
+        self._sums = np.zeros((0, len(FEATURES)))
+        self._counts = np.zeros(0)  # tracks with audio features, per playlist
+        self._tracks = np.zeros(0)  # tracks with genres, per playlist
+        self._genres = np.zeros((0, 0))  # tracks per playlist and genre
+
+    def __contains__(self, playlist_id):
+        return playlist_id in self._row
+
+    def _add_row(self, playlist_id):
+        self._row[playlist_id] = len(self.playlist_ids)
+        self.playlist_ids.append(playlist_id)
+        self._sums = np.vstack([self._sums, np.zeros(len(FEATURES))])
+        self._counts = np.append(self._counts, 0)
+        self._tracks = np.append(self._tracks, 0)
+        self._genres = np.vstack([self._genres, np.zeros(self._genres.shape[1])])
+
+    def _columns(self, genres):
+        """Return the columns of the genres, adding the ones that are new."""
+        new = [
+            genre for genre in dict.fromkeys(genres) if genre not in self._genre_column
+        ]
+        if new:
+            for genre in new:
+                self._genre_column[genre] = len(self._genre_column)
+            self._genres = np.hstack(
+                [self._genres, np.zeros((len(self.playlist_ids), len(new)))]
+            )
+        return [self._genre_column[genre] for genre in dict.fromkeys(genres)]
+
+    def set(self, playlist_id, vectors, genre_lists):
+        """Set the tracks of a playlist: a feature vector and genres per track."""
+        if playlist_id not in self:
+            self._add_row(playlist_id)
+        row = self._row[playlist_id]
+        self._sums[row] = 0
+        self._counts[row] = self._tracks[row] = 0
+        self._genres[row] = 0
+        for vector, genres in zip(vectors, genre_lists):
+            self.add(playlist_id, vector, genres)
+
+    def add(self, playlist_id, vector, genres):
+        """Add a track (its feature vector, None if unknown, and genres)."""
+        if playlist_id not in self:
+            return
+        row = self._row[playlist_id]
+        if vector is not None:
+            self._sums[row] += vector
+            self._counts[row] += 1
+        if genres:
+            # (first, as new genres make the genre counts wider)
+            columns = self._columns(genres)
+            self._genres[row, columns] += 1
+            self._tracks[row] += 1
+
+    def keep(self, playlist_ids):
+        """Forget the playlists that aren't in playlist_ids (no targets anymore)."""
+        rows = [
+            self._row[playlist_id]
+            for playlist_id in playlist_ids
+            if playlist_id in self
+        ]
+        self.playlist_ids = [self.playlist_ids[row] for row in rows]
+        self._row = {
+            playlist_id: row for row, playlist_id in enumerate(self.playlist_ids)
+        }
+        self._sums = self._sums[rows]
+        self._counts = self._counts[rows]
+        self._tracks = self._tracks[rows]
+        self._genres = self._genres[rows]
+
+    def score(self, vectors, genre_lists):
+        """
+        Return the score (0 to 1, NaN if unknown) of each track for each playlist.
+
+        vectors is an array of feature vectors (one row per track, NaN if
+        unknown), genre_lists the genres per track. Returns tracks x playlists.
+        """
+        vectors = np.atleast_2d(vectors)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centroids = self._sums / self._counts[:, None]
+            centroids[self._counts < MIN_TRACKS] = np.nan
+            # (in chunks of tracks, a whole source at once would take a lot
+            # of memory: tracks x playlists x features)
+            features = np.concatenate(
+                [
+                    1 - np.abs(chunk[:, None, :] - centroids[None, :, :]).mean(axis=2)
+                    for chunk in np.split(vectors, range(CHUNK, len(vectors), CHUNK))
+                ]
+            )
+
+            # the share of the playlist's tracks with each genre, summed over
+            # the genres of the track (most tracks have a handful), added up
+            # for all (track, genre) pairs at once
+            shares = self._genres / self._tracks[:, None]
+            pair_tracks, pair_columns = [], []
+            counts = np.zeros(len(vectors))
+            for track, track_genres in enumerate(genre_lists):
+                track_genres = dict.fromkeys(track_genres)
+                counts[track] = len(track_genres)
+                for genre in track_genres:
+                    if genre in self._genre_column:
+                        pair_tracks.append(track)
+                        pair_columns.append(self._genre_column[genre])
+            genres = np.zeros(features.shape)
+            np.add.at(genres, pair_tracks, shares.T[pair_columns])
+            genres /= counts[:, None]
+            genres[:, self._tracks < MIN_TRACKS] = np.nan
+
+        # (the features score alone if there are no genres to compare)
+        return np.where(np.isnan(genres), features, (features + genres) / 2)
+
+    def suggest(self, vector, genres, exclude=()):
+        """Return the ids of the playlists that fit the track best (best first)."""
+        if not self.playlist_ids or vector is None:
+            return []
+        scores = self.score(vector, [genres])[0]
+        order = np.argsort(-np.nan_to_num(scores, nan=-1), kind="stable")
+        return [
+            self.playlist_ids[row]
+            for row in order
+            if scores[row] >= MIN_SCORE and self.playlist_ids[row] not in exclude
+        ][:TOP]
@@ -0,0 +1,46 @@
+"""Load the target playlists of the divide page in the background."""
+
+from background import BackgroundJobs
+
+
+class TargetLoader(BackgroundJobs):
+    """
+    Load what the divide page needs of the target playlists, in the background.
+
+    Marking the targets that have the track (see PlaylistMembership) and
+    suggesting targets (see PlaylistCentroids) take all tracks of all targets,
+    and their audio features; the divide page doesn't wait for that. load is
+    called as load(spotify_client, uid, playlist_ids) in the background (see
+    BackgroundJobs), and what it returns is kept with the progress (the part
+    'targets_loading' in the track store) until a request of the user takes
+    it (see merge_targets in app.py): only the requests change the membership
+    and centroids. One load per user at a time, a new one replaces the last.
+    """
+
+    part = "targets_loading"
+
+    def __init__(self, get_client, track_store, load, max_workers=2, scheduler=None):
+        super().__init__(
+            get_client,
+            track_store,
+            max_workers=max_workers,
+            scheduler=scheduler,
+            name="target_loader",
+        )
+        self.load = load
+
+    def start(self, uid, playlist_ids):
+        """Start loading the target playlists, return the progress."""
+        return self._start(uid, playlists=list(playlist_ids), result=None, error=None)
+
+    def take(self, uid):
+        """Return the progress of the load once it's done (or failed), and forget it."""
+        with self._lock:
+            progress = self.progress(uid)
+            if not progress or progress["state"] == "running":
+                return None
+            self.track_store.delete(uid, self.part)
+        return progress
+
+    def _job(self, uid, progress, spotify_client):
+        progress["result"] = self.load(spotify_client, uid, progress["playlists"])
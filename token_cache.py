@@ -0,0 +1,161 @@
+"""Store for the Spotify tokens of all users: in memory, over a SQLite table."""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import spotipy
+
+
+class TokenStore:
+    """
+    Keep the token_info of every user (uuid), instead of one file per user.
+
+    Tokens are looked up in memory first and in SQLite (shared by the workers)
+    otherwise, both by primary key. A token that hasn't been used for max_age
+    seconds is stale and removed by purge(), which runs every so many saves.
+    """
+
+    # only touch the 'last used' time of a token once in a while, not every call
+    TOUCH_INTERVAL = 10 * 60
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, path, max_age, max_memory_entries=10000):
+        self.path = path
+        self.max_age = max_age
+        self.max_memory_entries = max_memory_entries
+
+        self._memory = OrderedDict()  # uid -> (last_used, token_info)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._saves = 0
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                " uid TEXT PRIMARY KEY,"
+                " token_info TEXT NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)"
+            )
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads, so one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, uid):
+        """Return the token_info of the user, or None if there is none (or stale)."""
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(uid)
+            if cached:
+                self._memory.move_to_end(uid)
+
+        if cached:
+            last_used, token_info = cached
+        else:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT token_info, last_used FROM tokens WHERE uid = ?", (uid,)
+                )
+                .fetchone()
+            )
+            if row is None:
+                return None
+            token_info, last_used = json.loads(row[0]), row[1]
+
+        if last_used < now - self.max_age:
+            return None
+
+        if last_used < now - self.TOUCH_INTERVAL:
+            last_used = now
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "UPDATE tokens SET last_used = ? WHERE uid = ?", (now, uid)
+                )
+
+        self._remember(uid, last_used, token_info)
+        return token_info
+
+    def save(self, uid, token_info):
+        """Save (overwrite) the token_info of the user."""
+        now = time.time()
+        self._remember(uid, now, token_info)
+
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO tokens (uid, token_info, last_used) "
+                "VALUES (?, ?, ?)",
+                (uid, json.dumps(token_info), now),
+            )
+
+        self._saves += 1
+        if self._saves >= self.PURGE_INTERVAL:
+            self._saves = 0
+            self.purge()
+
+    def _remember(self, uid, last_used, token_info):
+        with self._lock:
+            self._memory[uid] = (last_used, token_info)
+            self._memory.move_to_end(uid)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def delete(self, uid):
+        """Remove the token of the user (e.g. on log out)."""
+        with self._lock:
+            self._memory.pop(uid, None)
+
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM tokens WHERE uid = ?", (uid,))
+
+    def purge(self):
+        """Remove all stale tokens, return how many were removed."""
+        oldest = time.time() - self.max_age
+        with self._lock:
+            for uid in [
+                uid for uid, (used, _) in self._memory.items() if used < oldest
+            ]:
+                del self._memory[uid]
+
+        connection = self._connection()
+        with connection:
+            return connection.execute(
+                "DELETE FROM tokens WHERE last_used < ?", (oldest,)
+            ).rowcount
+
+
+class TokenCacheHandler(spotipy.cache_handler.CacheHandler):
+    """
+    Modified version for handling the caching and retrieval of authorization tokens.
+
+    Based on abstraction CacheHandler() in cache_handler.py of spotipy.
+    Handles reading and writing Spotify authorization tokens of one user in
+    the TokenStore.
+    """
+
+    def __init__(self, token_store, uid):
+        self.token_store = token_store
+        self.uid = uid
+
+    def get_cached_token(self):
+        """Get and return a token_info dictionary object."""
+        return self.token_store.get(self.uid)
+
+    def save_token_to_cache(self, token_info):
+        """Save a token_info dictionary object to the cache and return None."""
+        self.token_store.save(self.uid, token_info)
@@ -0,0 +1,104 @@
+"""Navigation index of the loaded source tracks: next, previous, remove in O(log n)."""
+
+from array import array
+
+
+class TrackIndex:
+    """
+    Which of the loaded tracks are still to be divided, as a Fenwick tree.
+
+    Every loaded position (the index in the track list, Track.position) has a
+    1 in the tree if the track can be divided (not a skipped item) and isn't
+    removed (moved) yet, so the track list itself never changes after
+    loading. Finding the next or previous track, removing a track, and the
+    rank of a track (its number among the tracks left) are O(log n), instead
+    of scanning (and rewriting) the track list.
+    """
+
+    def __init__(self, live):
+        """Build the index from a flag (divide or not) per loaded position."""
+        self._live = bytearray(1 if flag else 0 for flag in live)
+        self.size = len(self._live)
+        self._count = sum(self._live)
+
+        # linear build: every node adds itself to its parent
+        self._tree = array("i", [0]) + array("i", list(self._live))
+        for node in range(1, self.size + 1):
+            parent = node + (node & -node)
+            if parent <= self.size:
+                self._tree[parent] += self._tree[node]
+
+        self._top = 1 << self.size.bit_length() if self.size else 0
+
+    def extend(self, live):
+        """Add the flags of positions loaded later, after the last position."""
+        for flag in live:
+            node = self.size + 1
+            self._live.append(1 if flag else 0)
+            # (the node sums the flags after node - its lowest bit, up to itself)
+            self._tree.append(
+                self._live[-1] + self.rank(node - 1) - self.rank(node - (node & -node))
+            )
+            self.size = node
+            self._count += self._live[-1]
+        self._top = 1 << self.size.bit_length() if self.size else 0
+
+    def __len__(self):
+        """Return the number of tracks left."""
+        return self._count
+
+    def __contains__(self, position):
+        return 0 <= position < self.size and self._live[position] == 1
+
+    def flags(self):
+        """Return the flag per loaded position, 1 if the track is left (as bytes)."""
+        return bytes(self._live)
+
+    def rank(self, position):
+        """Return the number of tracks left before the position."""
+        total = 0
+        node = position
+        while node > 0:
+            total += self._tree[node]
+            node -= node & -node
+        return total
+
+    def select(self, rank):
+        """Return the position of the track left with rank (0 is the first)."""
+        if not 0 <= rank < self._count:
+            raise IndexError("track index out of range")
+        position = 0
+        remaining = rank + 1
+        step = self._top
+        while step:
+            node = position + step
+            if node <= self.size and self._tree[node] < remaining:
+                position = node
+                remaining -= self._tree[node]
+            step >>= 1
+        return position
+
+    def remove(self, position):
+        """Remove the track at the position (it's moved or removed)."""
+        if position not in self:
+            return
+        self._live[position] = 0
+        self._count -= 1
+        node = position + 1
+        while node <= self.size:
+            self._tree[node] -= 1
+            node += node & -node
+
+    def next(self, position):
+        """Return the position of the next track left (after the last: the first)."""
+        if not self._count:
+            return -1
+        rank = self.rank(position + 1)
+        return self.select(rank if rank < self._count else 0)
+
+    def previous(self, position):
+        """Return the position of the previous track left (before the first: last)."""
+        if not self._count:
+            return -1
+        rank = self.rank(position)
+        return self.select(rank - 1 if rank > 0 else self._count - 1)
@@ -0,0 +1,204 @@
+"""Compact, per-visitor storage of the loaded source playlist (outside the session)."""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from itertools import zip_longest
+
+
+class Track:
+    """
+    Slim version of a Spotify playlist (or saved track) item.
+
+    Only the fields the divide page and the divide actions read are kept, so
+    no available_markets, all album images, full artist objects, etc.
+    """
+
+    __slots__ = (
+        "id",
+        "uri",
+        "name",
+        "type",
+        "album_id",
+        "album_name",
+        "album_type",
+        "image_url",
+        "artist_ids",
+        "artist_names",
+        "popularity",
+        "duration_ms",
+        "release_date",
+        "skip",
+        "position",
+        "added_at",
+        "isrc",
+    )
+
+    # what from_item reads of an item (a fields expression, see projection.py)
+    ITEM_FIELDS = (
+        "added_at,track(type,id,uri,name,popularity,duration_ms,external_ids(isrc),"
+        "album(id,name,album_type,release_date,images(url)),artists(id,name))"
+    )
+
+    def __init__(self, **fields):
+        for slot in self.__slots__:
+            setattr(self, slot, fields.get(slot))
+
+    @classmethod
+    def from_item(cls, item, position=None):
+        """
+        Create a Track from a playlist item or saved track item of the API.
+
+        Position is the index of the item in the playlist (when loaded).
+        """
+        track = item.get("track")
+        added_at = item.get("added_at")
+
+        # local files, unavailable tracks and podcasts can't be divided, so skip
+        if not track or track.get("type") != "track" or not track.get("id"):
+            return cls(
+                id=track.get("id") if track else None,
+                uri=track.get("uri") if track else None,
+                name=track.get("name") if track else None,
+                type=track.get("type") if track else None,
+                artist_ids=(),
+                artist_names=(),
+                skip=True,
+                position=position,
+                added_at=added_at,
+            )
+
+        album = track["album"]
+        # the first image is the largest, that's the one displayed on the page
+        images = album.get("images") or [{"url": ""}]
+        return cls(
+            id=track["id"],
+            uri=track["uri"],
+            name=track["name"],
+            type=track["type"],
+            album_id=album["id"],
+            album_name=album["name"],
+            album_type=album["album_type"],
+            image_url=images[0]["url"],
+            artist_ids=tuple(artist["id"] for artist in track["artists"]),
+            artist_names=tuple(artist["name"] for artist in track["artists"]),
+            popularity=track.get("popularity", 0),
+            duration_ms=track["duration_ms"],
+            release_date=album.get("release_date"),
+            isrc=(track.get("external_ids") or {}).get("isrc"),
+            skip=False,
+            position=position,
+            added_at=added_at,
+        )
+
+    def __getstate__(self):
+        # a plain tuple pickles a lot smaller than a dict with the slot names
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        # (tracks stored before a slot was added get None for it)
+        for slot, value in zip_longest(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return f"Track({self.id!r}, {self.name!r})"
+
+
+class TrackStore:
+    """
+    Store large per-visitor data (like the loaded tracks) next to the session.
+
+    Every visitor (uuid) has a number of named parts, each part is pickled to
+    its own file, and is only (re)written when it is set. So a click on
+    next/previous doesn't rewrite the full track list like the session does.
+    The last used parts are kept in memory; the file modification time is
+    checked, so parts written by another worker are picked up.
+    """
+
+    def __init__(self, folder, max_memory_entries=64):
+        self.folder = folder
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()  # (uid, part) -> (mtime_ns, value)
+        self._lock = threading.RLock()
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def _path(self, uid, part):
+        return os.path.join(self.folder, f"{uid}.{part}")
+
+    def get(self, uid, part, default=None):
+        """Return the stored part of the visitor, or default if not stored."""
+        path = self._path(uid, part)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return default
+
+        with self._lock:
+            cached = self._memory.get((uid, part))
+            if cached and cached[0] == mtime_ns:
+                self._memory.move_to_end((uid, part))
+                return cached[1]
+
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+
+        self._remember(uid, part, mtime_ns, value)
+        return value
+
+    def set(self, uid, part, value):
+        """Store (overwrite) a part of the visitor."""
+        path = self._path(uid, part)
+        # write to a temporary file first, so readers never see half a pickle
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        self._remember(uid, part, os.stat(path).st_mtime_ns, value)
+
+    def _remember(self, uid, part, mtime_ns, value):
+        with self._lock:
+            self._memory[(uid, part)] = (mtime_ns, value)
+            self._memory.move_to_end((uid, part))
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def delete(self, uid, part):
+        """Remove a stored part of the visitor."""
+        with self._lock:
+            self._memory.pop((uid, part), None)
+        try:
+            os.remove(self._path(uid, part))
+        except OSError:
+            pass
+
+    def clear(self, uid):
+        """Remove all stored parts of the visitor."""
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == uid]:
+                del self._memory[key]
+
+        prefix = f"{uid}."
+        for filename in os.listdir(self.folder):
+            if filename.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.folder, filename))
+                except OSError:
+                    pass
+
+    def purge(self, max_age):
+        """Remove all parts that haven't been written for max_age seconds."""
+        oldest = time.time() - max_age
+        for filename in os.listdir(self.folder):
+            path = os.path.join(self.folder, filename)
+            try:
+                if os.stat(path).st_mtime < oldest:
+                    os.remove(path)
+            except OSError:
+                pass